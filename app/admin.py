@@ -0,0 +1,17 @@
+# app/admin.py
+# Guard for operator-only endpoints. They are disabled unless ADMIN_TOKEN is
+# set, and callers must send the same value in the X-Admin-Token header.
+import hmac
+import os
+from typing import Optional
+from dotenv import load_dotenv
+from fastapi import Header, HTTPException, status
+
+load_dotenv()
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
@@ -0,0 +1,116 @@
+# app/auth_cache.py
+# In-process cache of recently verified Basic-auth credentials, so repeated
+# requests from the same client skip the bcrypt verify. An entry only counts
+# while the user's stored password hash is the one it was verified against;
+# the request still loads the row, so a password change made through any
+# worker retires the entry everywhere on the next request.
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from time import monotonic
+from typing import Optional
+from dotenv import load_dotenv
+from app.metrics import statsd_client
+
+load_dotenv()
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: int
+    email: str
+    first_name: str
+    last_name: str
+    account_created: Optional[datetime]
+    account_updated: Optional[datetime]
+    is_verified: bool
+    token_version: int = 0
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(
+            id=user.id,
+            email=user.email,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            account_created=user.account_created,
+            account_updated=user.account_updated,
+            is_verified=user.is_verified,
+            token_version=user.token_version or 0,
+        )
+
+
+class CredentialCache:
+    """Bounded LRU of username -> (credential digest, password hash digest, expiry).
+
+    Only HMACs under a per-process random key are kept, never the password
+    itself. ``matches`` needs the password hash from the user's current row,
+    so an entry stored for an old password, including one written back by a
+    verify that was still in flight when the password changed, never matches.
+    """
+
+    def __init__(self, max_size=1024, ttl=60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._key = secrets.token_bytes(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _digest(self, password):
+        return hmac.new(self._key, password.encode(), hashlib.sha256).digest()
+
+    def matches(self, username, password, hashed_password):
+        """True if ``password`` was recently verified against ``hashed_password``, the row's current hash."""
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None:
+                digest, hash_digest, expires_at = entry
+                if expires_at <= now:
+                    del self._entries[username]
+                elif hmac.compare_digest(digest, self._digest(password)) and \
+                        hmac.compare_digest(hash_digest, self._digest(hashed_password)):
+                    self._entries.move_to_end(username)
+                    statsd_client.incr("auth_cache.hit")
+                    return True
+        statsd_client.incr("auth_cache.miss")
+        return False
+
+    def put(self, username, password, hashed_password):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[username] = (self._digest(password), self._digest(hashed_password), monotonic() + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _after_fork(self):
+        # The lock may have been held by another thread at fork time
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+
+credential_cache = CredentialCache(
+    max_size=int(os.getenv("AUTH_CACHE_MAX_SIZE", "1024")),
+    ttl=float(os.getenv("AUTH_CACHE_TTL", "60")),
+)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=credential_cache._after_fork)
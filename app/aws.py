@@ -0,0 +1,234 @@
+# app/aws.py
+# Shared S3 and SNS clients created once per process. Every boto3 call runs
+# on a dedicated thread pool sized to the botocore connection pool, so the
+# event loop never waits on AWS. Set AWS_BACKEND=stub to use the in-memory
+# backend (tests, benchmarks, local development).
+#
+# boto3 is imported when the first client is created, not at module import,
+# to keep worker startup fast.
+import asyncio
+import functools
+import io
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from dotenv import load_dotenv
+from app.metrics import statsd_client
+from app.tracing import span
+
+load_dotenv()
+
+AWS_BACKEND = os.getenv("AWS_BACKEND", "boto3")
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "20"))
+
+
+class AsyncServiceClient:
+    """Runs the blocking methods of a boto3 (or stub) client off the event loop.
+
+    ``await client.publish(...)`` calls ``publish`` on the wrapped client in
+    the shared executor and reports ``<service>.<operation>_time`` to statsd.
+    """
+
+    def __init__(self, service, client, executor):
+        self.service = service
+        self.client = client
+        self._executor = executor
+
+    @property
+    def exceptions(self):
+        return self.client.exceptions
+
+    async def call(self, operation, *args, **kwargs):
+        method = functools.partial(getattr(self.client, operation), *args, **kwargs)
+        start_time = time()
+        try:
+            with span(f"{self.service}.{operation}", self.service):
+                return await asyncio.get_running_loop().run_in_executor(self._executor, method)
+        finally:
+            statsd_client.timing(f"{self.service}.{operation}_time", (time() - start_time) * 1000)
+
+    async def run(self, func, *args):
+        """Run an arbitrary blocking helper (e.g. reading a streaming body) on the same pool."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(func, *args))
+
+    def __getattr__(self, operation):
+        if operation.startswith("_"):
+            raise AttributeError(operation)
+        return functools.partial(self.call, operation)
+
+
+class _StubBody:
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    def read(self, amt=None):
+        return self._stream.read(amt)
+
+    def iter_chunks(self, chunk_size=1024):
+        while True:
+            chunk = self._stream.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+class StubS3Client:
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}
+        self.multipart_uploads = {}
+
+    def _missing(self, operation, key):
+        return self.exceptions.NoSuchKey(f"An error occurred (NoSuchKey) when calling the {operation} operation: "
+                                         f"The specified key does not exist: {key}")
+
+    def head_bucket(self, Bucket, **kwargs):
+        return {}
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        self.objects[(Bucket, Key)] = bytes(Body)
+        return {"ETag": uuid.uuid4().hex}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self.objects[(Bucket, Key)] = Fileobj.read()
+
+    def get_object(self, Bucket, Key, **kwargs):
+        if (Bucket, Key) not in self.objects:
+            raise self._missing("GetObject", Key)
+        data = self.objects[(Bucket, Key)]
+        return {"Body": _StubBody(data), "ContentLength": len(data)}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        deleted = []
+        for obj in Delete["Objects"]:
+            self.objects.pop((Bucket, obj["Key"]), None)
+            deleted.append({"Key": obj["Key"]})
+        return {} if Delete.get("Quiet") else {"Deleted": deleted}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = uuid.uuid4().hex
+        self.multipart_uploads[upload_id] = {}
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        etag = uuid.uuid4().hex
+        self.multipart_uploads[UploadId][PartNumber] = (etag, bytes(Body))
+        return {"ETag": etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        parts = self.multipart_uploads.pop(UploadId)
+        self.objects[(Bucket, Key)] = b"".join(parts[part["PartNumber"]][1] for part in MultipartUpload["Parts"])
+        return {"Bucket": Bucket, "Key": Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self.multipart_uploads.pop(UploadId, None)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        Params = Params or {}
+        expires = int(time()) + ExpiresIn
+        return (f"https://{Params.get('Bucket')}.s3.amazonaws.com/{Params.get('Key')}"
+                f"?X-Amz-Expires={ExpiresIn}&Expires={expires}&Signature={uuid.uuid4().hex}")
+
+
+class StubSNSClient:
+    class exceptions:
+        pass
+
+    def __init__(self):
+        self.published = []
+
+    def get_topic_attributes(self, TopicArn, **kwargs):
+        return {"Attributes": {"TopicArn": TopicArn}}
+
+    def publish(self, TopicArn, Message, Subject=None, **kwargs):
+        message_id = str(uuid.uuid4())
+        self.published.append({"TopicArn": TopicArn, "Message": Message, "Subject": Subject, "MessageId": message_id})
+        return {"MessageId": message_id}
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries, **kwargs):
+        successful = []
+        for entry in PublishBatchRequestEntries:
+            response = self.publish(TopicArn=TopicArn, Message=entry["Message"], Subject=entry.get("Subject"))
+            successful.append({"Id": entry["Id"], "MessageId": response["MessageId"]})
+        return {"Successful": successful, "Failed": []}
+
+
+class AWSClients:
+    def __init__(self, backend=AWS_BACKEND, max_pool_connections=AWS_MAX_POOL_CONNECTIONS):
+        self.backend = backend
+        self.max_pool_connections = max_pool_connections
+        self._executor = None
+        self._session = None
+        self._s3 = None
+        self._sns = None
+
+    def _create_client(self, service):
+        if self.backend == "stub":
+            return StubS3Client() if service == "s3" else StubSNSClient()
+
+        import boto3
+        from botocore.config import Config
+
+        config = Config(max_pool_connections=self.max_pool_connections, retries={"mode": "standard"})
+        # IAM roles assigned to the EC2 instance will be used for authentication.
+        if self._session is None:
+            self._session = boto3.session.Session()
+        return self._session.client(service, region_name=os.getenv("AWS_REGION"), config=config)
+
+    def credentials_expiry(self):
+        """Epoch seconds at which the clients' current credentials expire, or None if they don't.
+
+        Instance-role credentials are temporary, and anything signed with them
+        (presigned URLs included) stops working when they expire. May block.
+        """
+        if self._session is None:
+            return None
+        expiry = getattr(self._session.get_credentials(), "_expiry_time", None)
+        return expiry.timestamp() if expiry is not None else None
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_pool_connections, thread_name_prefix="aws")
+            self._s3 = AsyncServiceClient("s3", self._create_client("s3"), self._executor)
+            self._sns = AsyncServiceClient("sns", self._create_client("sns"), self._executor)
+
+    @property
+    def s3(self):
+        self.start()
+        return self._s3
+
+    @property
+    def sns(self):
+        self.start()
+        return self._sns
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._s3 = None
+            self._sns = None
+
+    def _after_fork(self):
+        # boto3 clients and their connection pools must not be shared across processes
+        self._executor = None
+        self._session = None
+        self._s3 = None
+        self._sns = None
+
+
+aws_clients = AWSClients()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=aws_clients._after_fork)
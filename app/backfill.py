@@ -0,0 +1,86 @@
+# app/backfill.py
+# One-off backfill of Image.sha256 for rows uploaded before the column existed.
+# The column itself comes from migration 5; run `python -m app.manage migrate` first.
+#
+#   python -m app.backfill --batch-size 100
+import argparse
+import asyncio
+import hashlib
+import logging
+from sqlalchemy.future import select
+from sqlalchemy.exc import IntegrityError
+from app.database import AsyncSessionLocal, engine
+from app.aws import aws_clients
+from app.bootstrap import check_schema_version
+from app.models.user import Image
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+
+
+def hash_body(body):
+    digest = hashlib.sha256()
+    for chunk in body.iter_chunks(chunk_size=1024 * 1024):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def backfill_image_hashes(batch_size=DEFAULT_BATCH_SIZE):
+    s3_client = aws_clients.s3
+    last_id = 0
+    hashed = skipped = 0
+
+    while True:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Image)
+                .where(Image.sha256.is_(None), Image.id > last_id)
+                .order_by(Image.id)
+                .limit(batch_size)
+            )
+            images = result.scalars().all()
+            if not images:
+                break
+            last_id = images[-1].id
+
+            for image in images:
+                image_id, user_id = image.id, image.user_id
+                try:
+                    response = await s3_client.get_object(Bucket=image.bucket_name, Key=image.object_key)
+                    file_hash = await s3_client.run(hash_body, response["Body"])
+                except s3_client.exceptions.NoSuchKey:
+                    logger.warning(f"Object {image.object_key} for image {image_id} is missing in S3, skipping")
+                    skipped += 1
+                    continue
+
+                try:
+                    async with session.begin_nested():
+                        image.sha256 = file_hash
+                    hashed += 1
+                except IntegrityError:
+                    # The user already has another image with identical content
+                    logger.warning(f"Image {image_id} duplicates another image of user {user_id}, leaving unhashed")
+                    skipped += 1
+
+            await session.commit()
+            logger.info(f"Backfilled up to image id {last_id} ({hashed} hashed, {skipped} skipped)")
+
+    return hashed, skipped
+
+
+async def main(batch_size):
+    # Refuses to run against a database that hasn't been migrated
+    await check_schema_version()
+    hashed, skipped = await backfill_image_hashes(batch_size)
+    logger.info(f"Backfill complete: {hashed} hashed, {skipped} skipped")
+    aws_clients.close()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill SHA-256 content hashes for existing images.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size))
@@ -1,12 +1,17 @@
 import os
 from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy import text
+from sqlalchemy import text, func
 from sqlalchemy.exc import ProgrammingError
-from app.database import Base, engine
+from sqlalchemy.pool import NullPool
+from sqlalchemy.future import select
+from sqlalchemy.exc import SQLAlchemyError
+from app.database import Base, engine, DB_ECHO
 from dotenv import load_dotenv
-import boto3
-from botocore.exceptions import NoCredentialsError
 from app.metrics import statsd_client
+# Register every table on Base.metadata
+import app.models.user
+from app.models.schema import SchemaVersion
+from app.migrations import MIGRATIONS, pending_migrations
 
 
 
@@ -14,6 +19,12 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Workers refuse to start against a schema older than the last migration
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+class SchemaVersionError(RuntimeError):
+    pass
+
 def get_default_db_url():
     # Split the URL and remove the database name, using 'postgres' as the default database
     parts = DATABASE_URL.rsplit('/', 1)
@@ -24,8 +35,8 @@ async def create_database():
     db_name = DATABASE_URL.split("/")[-1]  # Extract the database name from DATABASE_URL
     default_db_url = get_default_db_url()
 
-    # Create a temporary engine with AUTOCOMMIT isolation level
-    temp_engine = create_async_engine(default_db_url, echo=True, isolation_level="AUTOCOMMIT")
+    # Create a temporary, unpooled engine with AUTOCOMMIT isolation level
+    temp_engine = create_async_engine(default_db_url, echo=DB_ECHO, isolation_level="AUTOCOMMIT", poolclass=NullPool)
     async with temp_engine.connect() as conn:
         try:
             await conn.execute(text(f"CREATE DATABASE {db_name}"))
@@ -41,13 +52,50 @@ async def create_tables():
         await conn.run_sync(Base.metadata.create_all)
         print("created")
 
+async def apply_migrations():
+    """Apply every pending migration, each in its own transaction with its version stamp; returns them."""
+    applied = []
+    for migration in pending_migrations(await get_schema_version()):
+        async with engine.begin() as conn:
+            for statement in migration.statements:
+                await conn.execute(text(statement))
+            await conn.execute(SchemaVersion.__table__.insert().values(version=migration.version))
+        print(f"Applied migration {migration.version}: {migration.description}")
+        applied.append(migration)
+    return applied
+
+async def migrate():
+    # create_all first so a migration never runs against a table that doesn't exist yet
+    await create_tables()
+    return await apply_migrations()
+
+async def stamp_schema_version():
+    async with engine.begin() as conn:
+        result = await conn.execute(select(SchemaVersion.version).where(SchemaVersion.version == SCHEMA_VERSION))
+        if result.scalar_one_or_none() is None:
+            await conn.execute(SchemaVersion.__table__.insert().values(version=SCHEMA_VERSION))
+
+async def get_schema_version():
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(select(func.max(SchemaVersion.version)))
+            return result.scalar()
+    except SQLAlchemyError:
+        # Most likely the schema_version table doesn't exist yet
+        return None
+
+async def check_schema_version():
+    version = await get_schema_version()
+    if version != SCHEMA_VERSION:
+        raise SchemaVersionError(
+            f"Database schema version is {version}, expected {SCHEMA_VERSION}; run `python -m app.manage migrate`"
+        )
+    return version
+
 async def bootstrap_database():
     try:
         await create_database()
     except Exception as e:
         print(f"Error during database creation: {e}")
-    await create_tables()
-
-def get_s3_client():
-    return boto3.client("s3")  # IAM roles assigned to the EC2 instance will be used for authentication.
+    await migrate()
 
@@ -0,0 +1,312 @@
+# app/bulk_import.py
+# Bulk user import from NDJSON or CSV, used by POST /v2/users/import and by
+#
+#   python -m app.bulk_import users.ndjson --batch-size 500 > results.ndjson
+#
+# Records are handled in batches: one IN query finds emails that already
+# exist, passwords are hashed in parallel on the password pool, and the
+# users, email logs and outbox messages are each written with one multi-row
+# INSERT per batch, committed together. Results come back per input row.
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+from collections import deque
+from time import time
+from dotenv import load_dotenv
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.future import select
+from app.database import AsyncSessionLocal, engine
+from app.metrics import statsd_client
+from app.models.user import User, Email_logs, EmailOutbox
+from app.outbox import outbox_dispatcher
+from app.passwords import PasswordHasher, password_hasher, MAX_WORKERS
+from app.schemas.userSchemas import UserCreate
+from app.verification import verification_link, verification_message, VERIFICATION_SUBJECT
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+# Keeps a multi-row INSERT well under Postgres' 32767 bind parameter limit
+IMPORT_MAX_BATCH_SIZE = 1000
+
+
+async def iter_lines(chunks):
+    """Split an async stream of byte chunks into decoded lines."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8").rstrip("\r")
+
+
+async def parse_ndjson(lines):
+    """Yield (line number, record, error) for each non-blank line."""
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, "Expected a JSON object"
+            continue
+        yield line_number, record, None
+
+
+class _LineQueue:
+    """Iterator over queued lines that can run dry and be refilled, unlike a generator."""
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def parse_csv(lines):
+    """Yield (line number, record, error) for each data row; the first row is the header.
+
+    One csv.reader reads the whole stream, so quoted fields may span lines. It
+    is fed once the lines so far hold an even number of quote characters
+    (escaped quotes come in pairs), i.e. no quoted field is left open.
+    """
+    queue = _LineQueue()
+    reader = csv.reader(queue, strict=True)
+    header = None
+    quotes = 0
+    done = False
+    while not done:
+        try:
+            line = await lines.__anext__()
+        except StopAsyncIteration:
+            # An unterminated quoted field runs to the end of the input
+            done = True
+        else:
+            queue.lines.append(line + "\n")
+            quotes += line.count('"')
+            if quotes % 2:
+                continue
+        quotes = 0
+        while queue.lines:
+            line_number = reader.line_num + 1
+            try:
+                row = next(reader)
+            except csv.Error as e:
+                yield line_number, None, f"Invalid CSV: {e}"
+                continue
+            if not any(field.strip() for field in row):
+                continue
+            if header is None:
+                header = [column.strip().lstrip("\ufeff") for column in row]
+                continue
+            if len(row) != len(header):
+                yield line_number, None, f"Expected {len(header)} fields, got {len(row)}"
+                continue
+            yield line_number, dict(zip(header, row)), None
+
+
+PARSERS = {"ndjson": parse_ndjson, "csv": parse_csv}
+
+
+def insert_ignoring_conflicts(table, dialect_name):
+    if dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    return dialect_insert(table)
+
+
+def row_result(line_number, email, status, **extra):
+    return dict(line=line_number, email=email, status=status, **extra)
+
+
+def validation_error(error):
+    return "; ".join(f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" for detail in error.errors())
+
+
+class BulkUserImporter:
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, hasher=password_hasher, session_factory=AsyncSessionLocal):
+        self.batch_size = max(1, min(batch_size, IMPORT_MAX_BATCH_SIZE))
+        self.hasher = hasher
+        self.session_factory = session_factory
+
+    async def run(self, records):
+        """Import (line number, record, error) tuples; yields one list of row results per batch."""
+        batch = []
+        async for item in records:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield await self._import_batch(batch)
+                batch = []
+        if batch:
+            yield await self._import_batch(batch)
+
+    async def _import_batch(self, batch):
+        start_time = time()
+        results = {}
+        candidates = {}
+        for line_number, record, error in batch:
+            if error is not None:
+                results[line_number] = row_result(line_number, None, "invalid", error=error)
+                continue
+            try:
+                user = UserCreate(**record)
+            except ValidationError as e:
+                results[line_number] = row_result(line_number, record.get("email"), "invalid",
+                                                  error=validation_error(e))
+                continue
+            if user.email in candidates:
+                results[line_number] = row_result(line_number, user.email, "duplicate",
+                                                  error="Email appears earlier in the input")
+                continue
+            candidates[user.email] = (line_number, user)
+
+        if candidates:
+            try:
+                await self._insert(candidates, results)
+            except SQLAlchemyError as e:
+                logger.error(f"Database error during bulk import: {e}")
+                self._fail_remaining(candidates, results, "Database error occurred")
+            except Exception as e:
+                # Fail this batch's rows rather than the whole streamed import
+                logger.error(f"Bulk import batch failed: {e}")
+                self._fail_remaining(candidates, results, "An error occurred while importing the row")
+
+        created = sum(1 for result in results.values() if result["status"] == "created")
+        statsd_client.incr("bulk_import.created", created)
+        if len(results) > created:
+            statsd_client.incr("bulk_import.rejected", len(results) - created)
+        statsd_client.timing("bulk_import.batch_time", (time() - start_time) * 1000)
+        return [results[line_number] for line_number in sorted(results)]
+
+    @staticmethod
+    def _fail_remaining(candidates, results, error):
+        for line_number, user in candidates.values():
+            results.setdefault(line_number, row_result(line_number, user.email, "failed", error=error))
+
+    async def _insert(self, candidates, results):
+        # One lookup for the whole batch instead of one per row. The session is closed before
+        # hashing, which takes seconds per batch, so no pooled connection waits idle in a transaction.
+        async with self.session_factory() as session:
+            existing = await session.execute(select(User.email).where(User.email.in_(list(candidates))))
+            existing_emails = existing.scalars().all()
+        for email in existing_emails:
+            line_number, _ = candidates.pop(email)
+            results[line_number] = row_result(line_number, email, "exists", error="Email already exists")
+        if not candidates:
+            return
+
+        hashed_passwords = await asyncio.gather(
+            *(self.hasher.hash(user.password) for _, user in candidates.values()), return_exceptions=True
+        )
+        users = []
+        for (email, (line_number, user)), hashed_password in zip(list(candidates.items()), hashed_passwords):
+            if isinstance(hashed_password, Exception):
+                logger.error(f"Password hashing failed during bulk import: {hashed_password}")
+                del candidates[email]
+                results[line_number] = row_result(line_number, email, "failed", error="Password hashing failed")
+            else:
+                users.append((user, hashed_password))
+        if not users:
+            return
+
+        async with self.session_factory() as session:
+            # ON CONFLICT covers emails created by someone else since the lookup above
+            statement = insert_ignoring_conflicts(User.__table__, session.bind.dialect.name).values([
+                {"email": user.email, "hashed_password": hashed_password, "first_name": user.first_name,
+                 "last_name": user.last_name, "is_verified": False}
+                for user, hashed_password in users
+            ])
+            inserted = await session.execute(
+                statement.on_conflict_do_nothing(index_elements=["email"]).returning(User.id, User.email)
+            )
+            created = {row.email: row.id for row in inserted}
+
+            if created:
+                links = {email: verification_link(email) for email in created}
+                await session.execute(insert(Email_logs).values([
+                    {"email": email, "verification_link": link} for email, link in links.items()
+                ]))
+                await session.execute(insert(EmailOutbox).values([
+                    {"email": email, "subject": VERIFICATION_SUBJECT, "message": verification_message(email, link)}
+                    for email, link in links.items()
+                ]))
+            await session.commit()
+
+        for email, (line_number, _) in candidates.items():
+            if email in created:
+                results[line_number] = row_result(line_number, email, "created", id=created[email])
+            else:
+                results[line_number] = row_result(line_number, email, "exists", error="Email already exists")
+        if created:
+            outbox_dispatcher.notify()
+
+
+async def read_chunks(f, size=64 * 1024):
+    while True:
+        chunk = f.read(size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def import_file(f, file_format, batch_size, hash_workers):
+    # Nothing else shares this process, so let hashing use every worker
+    hasher = PasswordHasher(max_workers=hash_workers, max_concurrent_hashes=hash_workers)
+    importer = BulkUserImporter(batch_size=batch_size, hasher=hasher)
+    counts = {}
+    try:
+        async for results in importer.run(PARSERS[file_format](iter_lines(read_chunks(f)))):
+            for result in results:
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+                print(json.dumps(result))
+    finally:
+        hasher.shutdown()
+        await engine.dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import users from an NDJSON or CSV file.")
+    parser.add_argument("path", help="input file, or - for stdin")
+    parser.add_argument("--format", choices=sorted(PARSERS), default=None,
+                        help="input format (default: from the file extension, else ndjson)")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--hash-workers", type=int, default=MAX_WORKERS)
+    args = parser.parse_args()
+
+    file_format = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    f = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+    try:
+        counts = asyncio.run(import_file(f, file_format, args.batch_size, args.hash_workers))
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+    print(", ".join(f"{status}={count}" for status, count in sorted(counts.items())) or "no records",
+          file=sys.stderr)
+    sys.exit(1 if counts.get("failed") else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,161 @@
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.sql import Select
+from collections import OrderedDict
+from time import monotonic
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from fastapi import Depends
+from contextvars import ContextVar
+from functools import lru_cache
+import logging
 import os
+import re
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 from app.metrics import statsd_client
+from app.tracing import record_span
 from time import time
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+
+def env_bool(name, default):
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+# Engine tuning, all overridable from the environment so the pool can be sized per instance type
+DB_ECHO = env_bool("DB_ECHO", False)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = env_bool("DB_POOL_PRE_PING", True)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))  # asyncpg prepared statements
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "500"))  # SQLAlchemy compiled statements
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+
+# Read replicas, comma-separated; read-only dependencies are spread across them
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+DB_REPLICA_RETRY_AFTER = float(os.getenv("DB_REPLICA_RETRY_AFTER", "30"))  # seconds a failed replica is skipped
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "10"))  # seconds of lag before a replica is skipped
+# Seconds on the primary after a write; never shorter than the lag a replica may have and still be used
+DB_READ_YOUR_WRITES_WINDOW = float(os.getenv("DB_READ_YOUR_WRITES_WINDOW", str(DB_REPLICA_MAX_LAG)))
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Reports how long each checkout waited for a free (or new) connection."""
+
+    def connect(self):
+        start_time = time()
+        try:
+            return super().connect()
+        finally:
+            statsd_client.timing("database.pool.checkout_wait_time", (time() - start_time) * 1000)
+
+
+def instrument_pool(engine, prefix="database.pool"):
+    pool = engine.sync_engine.pool
+    if not isinstance(pool, QueuePool):
+        # NullPool/StaticPool (e.g. SQLite) have nothing to report
+        return
+
+    def report(*args):
+        statsd_client.gauge(f"{prefix}.checked_out", pool.checkedout())
+        statsd_client.gauge(f"{prefix}.overflow", max(0, pool.overflow()))
+
+    event.listen(engine.sync_engine, "checkout", report)
+    event.listen(engine.sync_engine, "checkin", report)
+
+
+_TABLE_PATTERN = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+\"?(\w+)", re.IGNORECASE)
+_WHERE_COLUMN_PATTERN = re.compile(r"(?:\w+\.)?(\w+)\s*(?:=|<|>|<=|>=|IN|IS)\s", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def statement_fingerprint(statement):
+    """Collapse a SQL statement into a stable metric name, e.g. ``select_users_by_email``."""
+    words = statement.split(None, 1)
+    if not words:
+        return "empty"
+    operation = words[0].lower()
+    table = _TABLE_PATTERN.search(statement)
+    fingerprint = f"{operation}_{table.group(1).lower()}" if table else operation
+
+    where = re.split(r"\bWHERE\b", statement, maxsplit=1, flags=re.IGNORECASE)
+    if len(where) == 2:
+        clause = re.split(r"\b(?:ORDER BY|GROUP BY|LIMIT|RETURNING|FOR UPDATE)\b", where[1], maxsplit=1,
+                          flags=re.IGNORECASE)[0]
+        columns = []
+        for column in _WHERE_COLUMN_PATTERN.findall(clause):
+            column = column.lower()
+            if column not in columns:
+                columns.append(column)
+        if columns:
+            fingerprint += "_by_" + "_".join(columns)
+    return fingerprint
+
+
+# Per-request statement counter, installed by the request middleware in app.main
+_query_counter = ContextVar("query_counter", default=None)
+
+
+def start_query_count():
+    counter = {"count": 0}
+    _query_counter.set(counter)
+    return counter
+
+
+def instrument_queries(engine):
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_start_time = time()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = (time() - context._query_start_time) * 1000
+        fingerprint = statement_fingerprint(statement)
+        statsd_client.timing(f"database.query.{fingerprint}", duration)
+        record_span(f"db.{fingerprint}", "db", duration / 1000)
+        if duration >= DB_SLOW_QUERY_MS:
+            logger.warning(f"Slow query ({duration:.1f} ms) {fingerprint}: {statement}")
+        counter = _query_counter.get()
+        if counter is not None:
+            counter["count"] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+
+
+def engine_options(url, **overrides):
+    options = {
+        "echo": DB_ECHO,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "query_cache_size": DB_QUERY_CACHE_SIZE,
+    }
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    if url.get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    options.update(overrides)
+    return options
+
+
 Base = declarative_base()
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = create_async_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+instrument_pool(engine)
+instrument_queries(engine)
 AsyncSessionLocal = sessionmaker(
     bind=engine,
     class_=AsyncSession,
@@ -21,15 +163,161 @@ AsyncSessionLocal = sessionmaker(
 )
 
 
+class ReplicaRouter:
+    """Chooses the engine for read-only sessions.
+
+    Replicas are used round-robin, skipping any that recently failed or lag
+    more than ``max_lag`` seconds; with none available reads go to the primary.
+    Users who wrote within the last ``window`` seconds read from the primary so
+    they always see their own changes. The window is raised to ``max_lag`` if
+    it is shorter, since a replica that far behind could still serve the
+    user's old row (an old password, say) once the window had ended.
+    """
+
+    def __init__(self, primary, replicas, window=DB_READ_YOUR_WRITES_WINDOW,
+                 retry_after=DB_REPLICA_RETRY_AFTER, max_lag=DB_REPLICA_MAX_LAG, max_writers=10000):
+        self.primary = primary
+        self.replicas = list(replicas)
+        if window < max_lag:
+            logger.warning(f"DB_READ_YOUR_WRITES_WINDOW ({window}s) is shorter than DB_REPLICA_MAX_LAG ({max_lag}s); "
+                           f"using {max_lag}s")
+            window = max_lag
+        self.window = window
+        self.retry_after = retry_after
+        self.max_lag = max_lag
+        self.max_writers = max_writers
+        self.lag = [None] * len(self.replicas)
+        self._down_until = [0.0] * len(self.replicas)
+        self._next = 0
+        self._recent_writers = OrderedDict()  # user key -> end of read-your-writes window
+
+    def mark_write(self, key):
+        if not self.replicas:
+            return
+        self._recent_writers[key] = monotonic() + self.window
+        self._recent_writers.move_to_end(key)
+        while len(self._recent_writers) > self.max_writers:
+            self._recent_writers.popitem(last=False)
+
+    def wrote_recently(self, key):
+        until = self._recent_writers.get(key)
+        if until is None:
+            return False
+        if until <= monotonic():
+            del self._recent_writers[key]
+            return False
+        return True
+
+    def mark_down(self, index):
+        self._down_until[index] = monotonic() + self.retry_after
+        statsd_client.gauge(f"database.replica.{index}.up", 0)
+
+    def mark_up(self, index, lag=None):
+        self._down_until[index] = 0.0
+        self.lag[index] = lag
+        statsd_client.gauge(f"database.replica.{index}.up", 1)
+        if lag is not None:
+            statsd_client.gauge(f"database.replica.{index}.lag", lag * 1000)
+
+    def available(self, index):
+        lag = self.lag[index]
+        return self._down_until[index] <= monotonic() and (lag is None or lag <= self.max_lag)
+
+    def pick(self):
+        """Next usable replica engine, or the primary if there is none."""
+        for _ in range(len(self.replicas)):
+            index = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+            if self.available(index):
+                statsd_client.incr("database.route.replica")
+                return self.replicas[index]
+        if self.replicas:
+            statsd_client.incr("database.route.fallback")
+        statsd_client.incr("database.route.primary")
+        return self.primary
+
+
+def create_replica(index, url):
+    replica = create_async_engine(url, **engine_options(url))
+    instrument_pool(replica, prefix=f"database.replica.{index}.pool")
+    instrument_queries(replica)
+
+    def handle_error(context):
+        # Stop routing to a replica we can't reach; the health prober brings it back
+        if context.is_disconnect or isinstance(context.original_exception, (OSError, ConnectionError)):
+            replica_router.mark_down(index)
+
+    event.listen(replica.sync_engine, "handle_error", handle_error)
+    return replica
+
+
+replica_router = ReplicaRouter(engine, [create_replica(i, url) for i, url in enumerate(DATABASE_REPLICA_URLS)])
+
+
+class RoutingSession(Session):
+    """Sends SELECTs to the engine chosen for the session and everything else to the primary."""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or not isinstance(clause, Select):
+            return replica_router.primary.sync_engine
+        # Chosen once, so every read in a request sees the same server
+        bind = self.info.get("read_bind")
+        if bind is None:
+            if self.info.get("primary"):
+                statsd_client.incr("database.route.read_your_writes")
+                statsd_client.incr("database.route.primary")
+                bind = replica_router.primary.sync_engine
+            else:
+                bind = replica_router.pick().sync_engine
+            self.info["read_bind"] = bind
+        return bind
+
+
+# Without replicas, read sessions are ordinary primary sessions
+ReadSessionLocal = sessionmaker(
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    expire_on_commit=False
+) if replica_router.replicas else AsyncSessionLocal
+
+
+def route_reads_for(session, key):
+    """Keep this session's reads on the primary if ``key`` (a user's email) wrote recently."""
+    if replica_router.wrote_recently(key):
+        session.info["primary"] = True
+
+
+@asynccontextmanager
+async def try_advisory_lock(lock_id, bind=None):
+    """Connection holding the session-level advisory lock ``lock_id`` for the whole block.
+
+    Yields None, without waiting, if another connection already holds it. Databases
+    other than Postgres have no advisory locks and always get the connection.
+    """
+    async with (bind or engine).connect() as conn:
+        if conn.dialect.name != "postgresql":
+            yield conn
+            return
+        locked = (await conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": lock_id})).scalar()
+        await conn.commit()
+        if not locked:
+            yield None
+            return
+        try:
+            yield conn
+        finally:
+            # The lock outlives transactions, so release it before the connection goes back to the pool
+            await conn.rollback()
+            await conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": lock_id})
+            await conn.commit()
+
 
 @asynccontextmanager
 async def session_scope():
     session = AsyncSession(bind=engine)
     try:
-        start_time = time()
+        # Per-statement timings are reported by instrument_queries
         yield session
-        duration = time() - start_time
-        statsd_client.timing("database.query_time", duration * 1000)  # DB query time in ms
         await session.commit()
     except Exception as e:
         await session.rollback()
@@ -43,3 +331,11 @@ async def get_db() -> AsyncSession:
             yield session
         finally:
             await session.close()
+
+async def get_read_db() -> AsyncSession:
+    """Session for handlers that only read; may be served by a replica."""
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
@@ -0,0 +1,170 @@
+# app/email_logs.py
+# Buffered writer for the email_logs audit table. Signup appends a row to an
+# in-process buffer instead of inserting it in the request's transaction; a
+# background task writes the buffer with one multi-row INSERT when it reaches
+# EMAIL_LOG_BATCH_SIZE rows or every EMAIL_LOG_FLUSH_INTERVAL seconds, and
+# once more on shutdown. The verification email itself is queued through the
+# outbox in the signup transaction, so only this log is written late; rows
+# still buffered when a worker is killed without a clean shutdown are lost.
+#
+# sent_at is the time the row was logged, not written: each buffered row keeps
+# its log time and the INSERT back-dates the database clock by its age.
+#
+# The same task deletes rows older than EMAIL_LOG_RETENTION_DAYS in batches,
+# walking the sent_at index, so the table and its indexes stop growing. One
+# advisory lock is held for the whole run; a worker that can't take it skips
+# the run instead of interleaving batches with the worker that holds it.
+# EMAIL_LOG_MODE=inline restores the old behaviour of inserting each row in
+# the signup transaction.
+import asyncio
+import logging
+import os
+from datetime import timedelta
+from time import monotonic, time
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.future import select
+from app.database import AsyncSessionLocal, try_advisory_lock
+from app.metrics import statsd_client
+from app.models.user import Email_logs
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EMAIL_LOG_MODE = os.getenv("EMAIL_LOG_MODE", "buffered")
+EMAIL_LOG_BATCH_SIZE = int(os.getenv("EMAIL_LOG_BATCH_SIZE", "500"))
+EMAIL_LOG_FLUSH_INTERVAL = float(os.getenv("EMAIL_LOG_FLUSH_INTERVAL", "1"))
+# Rows kept while the database is unreachable; the oldest are dropped beyond this
+EMAIL_LOG_MAX_BUFFER = int(os.getenv("EMAIL_LOG_MAX_BUFFER", "10000"))
+EMAIL_LOG_RETENTION_DAYS = float(os.getenv("EMAIL_LOG_RETENTION_DAYS", "30"))  # 0 keeps rows forever
+EMAIL_LOG_RETENTION_INTERVAL = float(os.getenv("EMAIL_LOG_RETENTION_INTERVAL", "3600"))
+EMAIL_LOG_RETENTION_BATCH = int(os.getenv("EMAIL_LOG_RETENTION_BATCH", "5000"))
+
+# Any constant shared by every worker; only the worker holding it prunes
+RETENTION_LOCK_ID = 0x656D6C67
+
+
+def expired_email_logs(retention_days=EMAIL_LOG_RETENTION_DAYS, batch_size=EMAIL_LOG_RETENTION_BATCH):
+    """Ids of one batch of rows older than ``retention_days``."""
+    cutoff = func.now() - timedelta(days=retention_days)
+    return select(Email_logs.id).where(Email_logs.sent_at < cutoff).limit(batch_size)
+
+
+async def prune_email_logs(retention_days=EMAIL_LOG_RETENTION_DAYS, batch_size=EMAIL_LOG_RETENTION_BATCH, bind=None):
+    """Delete rows older than ``retention_days``, one short transaction per batch; returns the count.
+
+    The run is skipped if another worker is already pruning.
+    """
+    start_time = time()
+    pruned = 0
+    async with try_advisory_lock(RETENTION_LOCK_ID, bind) as conn:
+        if conn is None:
+            return 0
+        while True:
+            expired = expired_email_logs(retention_days, batch_size)
+            result = await conn.execute(delete(Email_logs).where(Email_logs.id.in_(expired.scalar_subquery())))
+            await conn.commit()
+            pruned += result.rowcount
+            if result.rowcount < batch_size:
+                break
+
+    statsd_client.incr("email_log.pruned", pruned)
+    statsd_client.timing("email_log.prune_time", (time() - start_time) * 1000)
+    return pruned
+
+
+class EmailLogWriter:
+    def __init__(self, batch_size=EMAIL_LOG_BATCH_SIZE, flush_interval=EMAIL_LOG_FLUSH_INTERVAL,
+                 max_buffer=EMAIL_LOG_MAX_BUFFER, retention_days=EMAIL_LOG_RETENTION_DAYS,
+                 retention_interval=EMAIL_LOG_RETENTION_INTERVAL, session_factory=AsyncSessionLocal, bind=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.retention_days = retention_days
+        self.retention_interval = retention_interval
+        self.session_factory = session_factory
+        self.bind = bind
+        self._buffer = []
+        self._task = None
+        self._wakeup = None
+        self._stopping = False
+        self._next_prune = 0.0
+
+    def log(self, email, verification_link):
+        # sent_at is back-dated from the flush by the time the row spent buffered
+        self._buffer.append({"email": email, "verification_link": verification_link, "logged_at": monotonic()})
+        if len(self._buffer) > self.max_buffer:
+            del self._buffer[:len(self._buffer) - self.max_buffer]
+            statsd_client.incr("email_log.dropped")
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._next_prune = monotonic()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Write everything still buffered, then stop the background task."""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        # Rows logged after the task's last flush, or with no task running at all
+        while await self.flush():
+            pass
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                while await self.flush() >= self.batch_size:
+                    pass
+                if self.retention_days > 0 and not self._stopping and monotonic() >= self._next_prune:
+                    self._next_prune = monotonic() + self.retention_interval
+                    await prune_email_logs(self.retention_days, bind=self.bind)
+            except Exception as e:
+                logger.error(f"Email log writer failed: {e}")
+
+    async def flush(self):
+        """Insert up to one batch of buffered rows. Returns the number written."""
+        if not self._buffer:
+            return 0
+        rows = self._buffer[:self.batch_size]
+        del self._buffer[:len(rows)]
+        start_time = time()
+        now = monotonic()
+        values = [
+            {"email": row["email"], "verification_link": row["verification_link"],
+             "sent_at": func.now() - timedelta(seconds=now - row["logged_at"])}
+            for row in rows
+        ]
+        try:
+            async with self.session_factory() as session:
+                await session.execute(insert(Email_logs).values(values))
+                await session.commit()
+        except SQLAlchemyError as e:
+            logger.error(f"Failed to write {len(rows)} email logs: {e}")
+            statsd_client.incr("email_log.failed", len(rows))
+            # Put them back for the next flush, still within the buffer bound
+            self._buffer[:0] = rows[:max(0, self.max_buffer - len(self._buffer))]
+            return 0
+        statsd_client.incr("email_log.written", len(rows))
+        statsd_client.timing("email_log.flush_time", (time() - start_time) * 1000)
+        return len(rows)
+
+    def __len__(self):
+        return len(self._buffer)
+
+
+email_log_writer = EmailLogWriter()
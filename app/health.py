@@ -0,0 +1,147 @@
+# app/health.py
+# Background prober for the service's dependencies. Health endpoints answer
+# from the cached result instead of taking a pool connection per probe, so
+# aggressive load balancer intervals cost nothing and a slow database can't
+# cause a pileup of health checks.
+import asyncio
+import logging
+import functools
+import os
+from time import time, monotonic
+from dotenv import load_dotenv
+from sqlalchemy import text
+from app.aws import aws_clients
+from app.database import engine, replica_router
+from app.metrics import statsd_client
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+# Dependencies that must be up for the instance to receive traffic; the rest are reported only
+HEALTH_REQUIRED_DEPENDENCIES = [
+    name.strip() for name in os.getenv("HEALTH_REQUIRED_DEPENDENCIES", "database").split(",") if name.strip()
+]
+
+
+async def check_database():
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+# Seconds since the last replayed transaction; 0 when caught up (or not a replica)
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+async def check_replica(index):
+    # Also keeps the router's view of the replica current: failures and lag take it out of rotation
+    try:
+        async with replica_router.replicas[index].connect() as conn:
+            lag = (await conn.execute(REPLICA_LAG_SQL)).scalar()
+    except Exception:
+        replica_router.mark_down(index)
+        raise
+    replica_router.mark_up(index, float(lag or 0))
+
+
+async def check_s3():
+    bucket_name = os.getenv("BUCKET_NAME")
+    if bucket_name:
+        await aws_clients.s3.head_bucket(Bucket=bucket_name)
+
+
+async def check_sns():
+    topic_arn = os.getenv("SNS_TOPIC_ARN")
+    if topic_arn:
+        await aws_clients.sns.get_topic_attributes(TopicArn=topic_arn)
+
+
+class HealthProber:
+    def __init__(self, checks=None, interval=HEALTH_CHECK_INTERVAL, timeout=HEALTH_CHECK_TIMEOUT,
+                 required=HEALTH_REQUIRED_DEPENDENCIES):
+        if checks is None:
+            checks = {"database": check_database, "s3": check_s3, "sns": check_sns}
+            for index in range(len(replica_router.replicas)):
+                checks[f"replica_{index}"] = functools.partial(check_replica, index)
+        self.checks = checks
+        self.interval = interval
+        self.timeout = timeout
+        self.required = required
+        self.results = {}
+        self._checked_at = None
+        self._task = None
+        self._refresh = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    async def _check(self, name, check):
+        start_time = time()
+        try:
+            await asyncio.wait_for(check(), timeout=self.timeout)
+            healthy, error = True, None
+        except Exception as e:
+            healthy, error = False, str(e) or e.__class__.__name__
+            logger.warning(f"Health check for {name} failed: {error}")
+        latency = (time() - start_time) * 1000
+        statsd_client.timing(f"health.{name}.latency", latency)
+        statsd_client.gauge(f"health.{name}.status", 1 if healthy else 0)
+        return {"healthy": healthy, "latency_ms": round(latency, 3), "error": error}
+
+    async def _probe(self):
+        names = list(self.checks)
+        results = await asyncio.gather(*(self._check(name, self.checks[name]) for name in names))
+        self.results = dict(zip(names, results))
+        self._checked_at = monotonic()
+
+    async def refresh(self):
+        # Concurrent callers share a single in-flight probe
+        if self._refresh is None:
+            self._refresh = asyncio.ensure_future(self._probe())
+        try:
+            await asyncio.shield(self._refresh)
+        finally:
+            if self._refresh is not None and self._refresh.done():
+                self._refresh = None
+
+    @property
+    def is_stale(self):
+        # Allow a few missed intervals before distrusting the cache
+        return self._checked_at is None or monotonic() - self._checked_at > 3 * self.interval + self.timeout
+
+    async def current(self):
+        """Cached results; probes inline only if the background prober isn't keeping them fresh."""
+        if self.is_stale:
+            await self.refresh()
+        return self.results
+
+    def statuses(self):
+        """{name: "up" | "down"} for public responses; errors and latencies stay in the logs and metrics."""
+        return {name: "up" if result["healthy"] else "down" for name, result in self.results.items()}
+
+    async def is_ready(self):
+        results = await self.current()
+        return all(results.get(name, {}).get("healthy", False) for name in self.required)
+
+
+health_prober = HealthProber()
@@ -1,31 +1,106 @@
-from fastapi import FastAPI, Request
 from time import time
-from app.bootstrap import bootstrap_database
+# Measured from the first import so the startup metric includes module loading
+process_started = time()
+
+import asyncio
+import os
+from fastapi import FastAPI
+from app.bootstrap import bootstrap_database, check_schema_version
 from app.metrics import statsd_client
+from app.database import start_query_count
+from app.passwords import password_hasher
+from app.aws import aws_clients
+from app.outbox import outbox_dispatcher
+from app.email_logs import email_log_writer
+from app.health import health_prober
+from app.ratelimit import RateLimitMiddleware
+from app.tracing import trace_buffer, install_signal_handler
+from app.responses import FastJSONResponse
 from app.routes.healthRoutes import router as health_router
 from app.routes.userRoutes import router as user_router
+from app.routes.adminRoutes import router as admin_router
+
+# "check" only verifies the schema version (run `python -m app.manage bootstrap` once per deploy),
+# "bootstrap" creates the database and tables from every worker, "skip" does neither
+SCHEMA_STARTUP_MODE = os.getenv("SCHEMA_STARTUP_MODE", "check")
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 @app.on_event("startup")
 async def startup_event():
     print("Starting up...")
-    await bootstrap_database()
-    print("Database bootstrap completed.")
+    if SCHEMA_STARTUP_MODE == "bootstrap":
+        await bootstrap_database()
+        print("Database bootstrap completed.")
+    elif SCHEMA_STARTUP_MODE == "check":
+        version = await check_schema_version()
+        print(f"Database schema version {version} verified.")
+    outbox_dispatcher.start()
+    email_log_writer.start()
+    health_prober.start()
+    install_signal_handler(asyncio.get_running_loop())
+    statsd_client.timing("app.startup_time", (time() - process_started) * 1000)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await health_prober.stop()
+    await outbox_dispatcher.stop()
+    # Writes whatever signups logged since the last flush
+    await email_log_writer.stop()
+    password_hasher.shutdown()
+    aws_clients.close()
+    statsd_client.close()
+
+class MetricsMiddleware:
+    """Per-route request metrics.
+
+    A plain ASGI middleware rather than @app.middleware("http"): that wrapper
+    runs the endpoint in a separate task and competes for receive() while a
+    streaming response is sent, which breaks endpoints that stream the request
+    body (bulk import) and adds overhead to every request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Start timer
+        start_time = time()
+        queries = start_query_count()
+        trace = trace_buffer.start(f"{scope['method']} {scope['path']}")
+        status = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper if trace is not None else send)
+        finally:
+            duration = time() - start_time
 
-@app.middleware("http")
-async def add_metrics(request: Request, call_next):
-    # Start timer
-    start_time = time()
-    response = await call_next(request)
-    duration = time() - start_time
+            # Name metrics after the route template (/v2/users/{user_id}), not the raw path,
+            # so one metric isn't created per user or image id
+            route = scope.get("route")
+            path = route.path_format if route is not None else "unmatched"
+            if trace is not None:
+                trace_buffer.finish(trace, f"{scope['method']} {path}", status.get("code"))
 
-    # Log metrics
-    statsd_client.incr(f"{request.url.path}.count")  # Count each API call
-    statsd_client.timing(f"{request.url.path}.response_time", duration * 1000)  # API response time in ms
+            # Log metrics
+            statsd_client.incr(f"{path}.count")  # Count each API call
+            statsd_client.timing(f"{path}.response_time", duration * 1000)  # API response time in ms
+            statsd_client.timing(f"{path}.query_count", queries["count"])  # SQL statements per request
 
-    return response
+app.add_middleware(MetricsMiddleware)
+# Outermost, so throttled requests are rejected before any other work
+app.add_middleware(RateLimitMiddleware)
 
 # Include the routes
 app.include_router(health_router, prefix="/v2")
 app.include_router(user_router, prefix="/v2/users", tags=["Users"])
+app.include_router(admin_router, prefix="/v2/admin", tags=["Admin"])
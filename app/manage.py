@@ -0,0 +1,55 @@
+# app/manage.py
+# Operational commands that must run once per deployment, not once per worker.
+#
+#   python -m app.manage bootstrap      create the database, then migrate
+#   python -m app.manage migrate        create missing tables and apply pending migrations
+#   python -m app.manage check-schema   exit non-zero if the schema version doesn't match the code
+import argparse
+import asyncio
+import sys
+from app.bootstrap import bootstrap_database, check_schema_version, migrate, SchemaVersionError
+from app.database import engine
+
+
+async def bootstrap():
+    await bootstrap_database()
+    print("Database bootstrap completed.")
+
+
+async def run_migrations():
+    applied = await migrate()
+    print(f"Applied {len(applied)} migration(s)." if applied else "Database schema is up to date.")
+
+
+async def check_schema():
+    try:
+        version = await check_schema_version()
+    except SchemaVersionError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Database schema is at version {version}.")
+    return 0
+
+
+async def run(command):
+    try:
+        if command == "bootstrap":
+            await bootstrap()
+            return 0
+        if command == "migrate":
+            await run_migrations()
+            return 0
+        return await check_schema()
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database management commands.")
+    parser.add_argument("command", choices=["bootstrap", "migrate", "check-schema"])
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.command)))
+
+
+if __name__ == "__main__":
+    main()
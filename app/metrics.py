@@ -1,5 +1,175 @@
 # metrics.py
-from statsd import StatsClient
+# StatsD client that aggregates in memory and flushes on an interval.
+#
+# Recording a metric is a dict update under a lock; a daemon thread sends
+# everything recorded since the last flush as a few pipelined UDP packets.
+# Counters are summed, gauges keep their last value and timers keep up to
+# METRICS_MAX_TIMER_SAMPLES samples per flush (reservoir sampled, sent with
+# a StatsD sample rate so the server still sees the true count).
+import os
+import random
+import socket
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STATSD_HOST = os.getenv("STATSD_HOST", "localhost")
+STATSD_PORT = int(os.getenv("STATSD_PORT", "8125"))
+STATSD_PREFIX = os.getenv("STATSD_PREFIX", "fastapi_app")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+METRICS_MAX_KEYS = int(os.getenv("METRICS_MAX_KEYS", "5000"))
+METRICS_MAX_TIMER_SAMPLES = int(os.getenv("METRICS_MAX_TIMER_SAMPLES", "500"))
+MAX_UDP_SIZE = 512
+
+
+def format_value(value):
+    """Render a counter or gauge without exponents: integers in full, fractions to six places."""
+    if isinstance(value, int) or float(value).is_integer():
+        return f"{int(value):d}"
+    return f"{value:.6f}".rstrip("0").rstrip(".")
+
+
+class AggregatingStatsClient:
+    def __init__(self, host=STATSD_HOST, port=STATSD_PORT, prefix=STATSD_PREFIX,
+                 flush_interval=METRICS_FLUSH_INTERVAL, max_keys=METRICS_MAX_KEYS,
+                 max_timer_samples=METRICS_MAX_TIMER_SAMPLES):
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self.max_timer_samples = max_timer_samples
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timers = {}  # stat -> [samples, total seen]
+        self._dropped = 0
+        self._addr = None
+        self._sock = None
+        self._flusher = None
+        self._stopped = threading.Event()
+
+    def _has_room(self, stat, bucket):
+        if stat in bucket or len(self._counters) + len(self._gauges) + len(self._timers) < self.max_keys:
+            return True
+        self._dropped += 1
+        return False
+
+    def incr(self, stat, count=1, rate=1):
+        with self._lock:
+            if self._has_room(stat, self._counters):
+                self._counters[stat] = self._counters.get(stat, 0) + count / rate
+        self._ensure_flusher()
+
+    def decr(self, stat, count=1, rate=1):
+        self.incr(stat, -count, rate)
+
+    def gauge(self, stat, value, rate=1, delta=False):
+        with self._lock:
+            if self._has_room(stat, self._gauges):
+                if delta:
+                    value += self._gauges.get(stat, 0)
+                self._gauges[stat] = value
+        self._ensure_flusher()
+
+    def timing(self, stat, delta, rate=1):
+        with self._lock:
+            timer = self._timers.get(stat)
+            if timer is None:
+                if not self._has_room(stat, self._timers):
+                    return
+                timer = self._timers[stat] = [[], 0]
+            samples = timer[0]
+            timer[1] += 1
+            if len(samples) < self.max_timer_samples:
+                samples.append(delta)
+            else:
+                slot = random.randrange(timer[1])
+                if slot < self.max_timer_samples:
+                    samples[slot] = delta
+        self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        if self._flusher is None and self.flush_interval > 0:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._run, name="statsd-flusher", daemon=True)
+                    self._flusher.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def _drain(self):
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            gauges, self._gauges = self._gauges, {}
+            timers, self._timers = self._timers, {}
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            counters["metrics.dropped_keys"] = dropped
+
+        prefix = f"{self.prefix}." if self.prefix else ""
+        lines = []
+        for stat, value in counters.items():
+            lines.append(f"{prefix}{stat}:{format_value(value)}|c")
+        for stat, value in gauges.items():
+            if value < 0:
+                # A leading minus would be read as a delta, so reset to zero first
+                lines.append(f"{prefix}{stat}:0|g")
+            lines.append(f"{prefix}{stat}:{format_value(value)}|g")
+        for stat, (samples, seen) in timers.items():
+            suffix = f"|@{format_value(len(samples) / seen)}" if seen > len(samples) else ""
+            for sample in samples:
+                lines.append(f"{prefix}{stat}:{sample:0.6f}|ms{suffix}")
+        return lines
+
+    def _packets(self, lines):
+        packet = ""
+        for line in lines:
+            if packet and len(packet) + len(line) + 1 > MAX_UDP_SIZE:
+                yield packet
+                packet = line
+            else:
+                packet = f"{packet}\n{line}" if packet else line
+        if packet:
+            yield packet
+
+    def flush(self):
+        lines = self._drain()
+        if not lines:
+            return
+        try:
+            if self._sock is None:
+                family, _, _, _, self._addr = socket.getaddrinfo(self.host, self.port, socket.AF_INET,
+                                                                 socket.SOCK_DGRAM)[0]
+                self._sock = socket.socket(family, socket.SOCK_DGRAM)
+            for packet in self._packets(lines):
+                self._sock.sendto(packet.encode("ascii"), self._addr)
+        except (socket.error, RuntimeError):
+            # Metrics are best effort; never let a missing agent affect requests
+            pass
+
+    def close(self):
+        self._stopped.set()
+        self.flush()
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _after_fork(self):
+        # Threads and sockets don't survive fork; start fresh in the child
+        self._lock = threading.Lock()
+        self._counters, self._gauges, self._timers = {}, {}, {}
+        self._dropped = 0
+        self._sock = None
+        self._flusher = None
+        self._stopped = threading.Event()
+
 
 # Initialize StatsD client
-statsd_client = StatsClient(host='localhost', port=8125, prefix='fastapi_app')
+statsd_client = AggregatingStatsClient()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=statsd_client._after_fork)
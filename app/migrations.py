@@ -0,0 +1,44 @@
+# app/migrations.py
+# Versioned schema changes, applied in order by `python -m app.manage migrate`
+# (and by bootstrap). Base.metadata.create_all creates missing tables with
+# every current column and index but never alters a table that already exists,
+# so each migration brings an existing database up to its version and is a
+# no-op on one create_all has just built. Append new migrations at the end and
+# never edit one that has shipped; the last version is the SCHEMA_VERSION
+# workers check at startup.
+from dataclasses import dataclass, field
+from typing import List
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    statements: List[str] = field(default_factory=list)
+
+
+MIGRATIONS = [
+    Migration(1, "Baseline schema created from the models"),
+    Migration(2, "Image keyset pagination index and access token versions", [
+        "CREATE INDEX IF NOT EXISTS ix_images_user_id_id ON images (user_id, id)",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0",
+    ]),
+    Migration(3, "Email log lookups by address, newest first", [
+        "CREATE INDEX IF NOT EXISTS ix_email_logs_email_sent_at ON email_logs (email, sent_at)",
+    ]),
+    Migration(4, "Email log retention walks rows by age", [
+        "CREATE INDEX IF NOT EXISTS ix_email_logs_sent_at ON email_logs (sent_at)",
+    ]),
+    Migration(5, "Image content hashes for duplicate detection", [
+        "ALTER TABLE images ADD COLUMN IF NOT EXISTS sha256 VARCHAR(64)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_images_user_id_sha256 ON images (user_id, sha256)",
+    ]),
+    Migration(6, "Outbox retention walks sent rows by age", [
+        "CREATE INDEX IF NOT EXISTS ix_email_outbox_sent_at ON email_outbox (sent_at) WHERE sent_at IS NOT NULL",
+    ]),
+]
+
+
+def pending_migrations(version):
+    """Migrations newer than ``version`` (None for a database that was never stamped)."""
+    return [migration for migration in MIGRATIONS if version is None or migration.version > version]
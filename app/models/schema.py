@@ -0,0 +1,8 @@
+from sqlalchemy import Column, Integer, DateTime, func
+from app.database import Base
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
+    applied_at = Column(DateTime, default=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, func, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, func, ForeignKey, Boolean, UniqueConstraint, Index
 from app.database import Base
 from sqlalchemy.orm import relationship
 
@@ -12,6 +12,8 @@ class User(Base):
     account_created = Column(DateTime, default=func.now())
     account_updated = Column(DateTime, onupdate=func.now())
     is_verified = Column(Boolean, default=False)
+    # Raised on password change; access tokens issued with an older version are rejected
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
 
     # Define the images relationship
     images = relationship("Image", back_populates="user")
@@ -24,10 +26,19 @@ class Image(Base):
     image_url = Column(String, nullable=False)
     bucket_name = Column(String, nullable=False)
     object_key = Column(String, nullable=False)
+    # Hex SHA-256 of the object body, used for per-user duplicate detection.
+    # Nullable so rows uploaded before this column existed can be backfilled.
+    sha256 = Column(String(64), nullable=True)
     upload_date = Column(DateTime, default=func.now())
 
     user = relationship("User", back_populates="images")
 
+    __table_args__ = (
+        UniqueConstraint("user_id", "sha256", name="uq_images_user_id_sha256"),
+        # Keyset pagination of a user's images walks this index in id order
+        Index("ix_images_user_id_id", "user_id", "id"),
+    )
+
 class Email_logs(Base):
     __tablename__ = "email_logs"
 
@@ -35,3 +46,30 @@ class Email_logs(Base):
     email = Column(String, nullable=False)
     sent_at = Column(DateTime, default=func.now())
     verification_link = Column(String, nullable=False)
+
+    __table_args__ = (
+        # Latest verification email sent to an address
+        Index("ix_email_logs_email_sent_at", "email", "sent_at"),
+        # Retention deletes the oldest rows
+        Index("ix_email_logs_sent_at", "sent_at"),
+    )
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    message = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    next_attempt_at = Column(DateTime, default=func.now(), nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(String, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # The dispatcher only ever scans unsent rows
+        Index("ix_email_outbox_pending", "next_attempt_at", postgresql_where=sent_at.is_(None)),
+        # Retention deletes the oldest sent rows
+        Index("ix_email_outbox_sent_at", "sent_at", postgresql_where=sent_at.isnot(None)),
+    )
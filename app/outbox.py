@@ -0,0 +1,245 @@
+# app/outbox.py
+# Background dispatcher for the email_outbox table. create_user writes the
+# verification message in the same transaction as the user row; this task
+# publishes pending rows to SNS in batches and retries failures with
+# exponential backoff, so signup latency no longer includes an SNS round trip.
+#
+# A batch is claimed in one short transaction that pushes its next_attempt_at
+# OUTBOX_CLAIM_TIMEOUT seconds ahead, published with no transaction or
+# connection held, and its results are recorded in a second short
+# transaction. Rows claimed by a worker that dies mid-batch come due again
+# once the claim times out, so delivery is at least once.
+#
+# A message that fails OUTBOX_MAX_ATTEMPTS times is dead-lettered: it stays in
+# the table for inspection, is logged and counted when it gives up, and the
+# number of dead rows is reported as a gauge. Sent rows are deleted once they
+# are OUTBOX_RETENTION_DAYS old, in batches, like the email log retention.
+import asyncio
+import logging
+import os
+from datetime import timedelta
+from time import monotonic, time
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, update
+from sqlalchemy.future import select
+from app.aws import aws_clients
+from app.database import AsyncSessionLocal, try_advisory_lock
+from app.metrics import statsd_client
+from app.models.user import EmailOutbox
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# SNS PublishBatch accepts at most 10 entries per call
+SNS_BATCH_LIMIT = 10
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_RETRY_BASE_DELAY = float(os.getenv("OUTBOX_RETRY_BASE_DELAY", "2"))
+OUTBOX_RETRY_MAX_DELAY = float(os.getenv("OUTBOX_RETRY_MAX_DELAY", "300"))
+# Long enough to publish a whole batch even when every SNS call runs into its timeouts
+OUTBOX_CLAIM_TIMEOUT = float(os.getenv("OUTBOX_CLAIM_TIMEOUT", "600"))
+OUTBOX_RETENTION_DAYS = float(os.getenv("OUTBOX_RETENTION_DAYS", "7"))  # 0 keeps sent rows forever
+OUTBOX_RETENTION_INTERVAL = float(os.getenv("OUTBOX_RETENTION_INTERVAL", "3600"))
+OUTBOX_RETENTION_BATCH = int(os.getenv("OUTBOX_RETENTION_BATCH", "5000"))
+
+# Any constant shared by every worker; only the worker holding it prunes
+RETENTION_LOCK_ID = 0x6F757462
+
+
+def retry_delay(attempts):
+    return min(OUTBOX_RETRY_MAX_DELAY, OUTBOX_RETRY_BASE_DELAY * (2 ** (attempts - 1)))
+
+
+def expired_outbox_messages(retention_days=OUTBOX_RETENTION_DAYS, batch_size=OUTBOX_RETENTION_BATCH):
+    """Ids of one batch of messages sent more than ``retention_days`` ago."""
+    cutoff = func.now() - timedelta(days=retention_days)
+    return select(EmailOutbox.id).where(EmailOutbox.sent_at < cutoff).limit(batch_size)
+
+
+async def prune_outbox(retention_days=OUTBOX_RETENTION_DAYS, batch_size=OUTBOX_RETENTION_BATCH,
+                       max_attempts=OUTBOX_MAX_ATTEMPTS, bind=None):
+    """Delete sent messages older than ``retention_days`` and report the dead-lettered ones.
+
+    One short transaction per batch; returns the number of rows deleted. The run is
+    skipped if another worker is already pruning.
+    """
+    start_time = time()
+    pruned = 0
+    async with try_advisory_lock(RETENTION_LOCK_ID, bind) as conn:
+        if conn is None:
+            return 0
+        while True:
+            expired = expired_outbox_messages(retention_days, batch_size)
+            result = await conn.execute(delete(EmailOutbox).where(EmailOutbox.id.in_(expired.scalar_subquery())))
+            await conn.commit()
+            pruned += result.rowcount
+            if result.rowcount < batch_size:
+                break
+
+        result = await conn.execute(
+            select(func.count()).where(EmailOutbox.sent_at.is_(None), EmailOutbox.attempts >= max_attempts)
+        )
+        dead = result.scalar()
+        await conn.commit()
+    statsd_client.gauge("outbox.dead", dead)
+    if dead:
+        logger.warning(f"{dead} outbox messages gave up after {max_attempts} attempts")
+
+    statsd_client.incr("outbox.pruned", pruned)
+    statsd_client.timing("outbox.prune_time", (time() - start_time) * 1000)
+    return pruned
+
+
+class OutboxDispatcher:
+    def __init__(self, batch_size=OUTBOX_BATCH_SIZE, poll_interval=OUTBOX_POLL_INTERVAL,
+                 max_attempts=OUTBOX_MAX_ATTEMPTS, retention_days=OUTBOX_RETENTION_DAYS,
+                 retention_interval=OUTBOX_RETENTION_INTERVAL, claim_timeout=OUTBOX_CLAIM_TIMEOUT):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.claim_timeout = claim_timeout
+        self.retention_days = retention_days
+        self.retention_interval = retention_interval
+        self._task = None
+        self._wakeup = None
+        self._next_prune = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._next_prune = monotonic()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self):
+        """Wake the dispatcher so a freshly committed message goes out without waiting for the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                # Keep draining while full batches come back
+                while await self.drain_once() >= self.batch_size:
+                    pass
+                if self.retention_days > 0 and monotonic() >= self._next_prune:
+                    self._next_prune = monotonic() + self.retention_interval
+                    await prune_outbox(self.retention_days, max_attempts=self.max_attempts)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox dispatch failed: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def due_messages(self):
+        """The rows the next batch publishes, locked so other workers skip them."""
+        return (
+            select(EmailOutbox, func.now() - EmailOutbox.created_at)
+            .where(
+                EmailOutbox.sent_at.is_(None),
+                EmailOutbox.next_attempt_at <= func.now(),
+                EmailOutbox.attempts < self.max_attempts,
+            )
+            .order_by(EmailOutbox.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+
+    async def drain_once(self):
+        """Publish one batch of due messages. Returns the number of rows processed."""
+        start_time = time()
+        async with AsyncSessionLocal() as session:
+            # SKIP LOCKED lets every uvicorn worker claim a batch without double-sending;
+            # the claim is committed before any SNS call, so no locks or connection are held while publishing
+            result = await session.execute(self.due_messages())
+            rows = result.all()
+            if not rows:
+                return 0
+            await session.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id.in_([message.id for message, _ in rows]))
+                .values(next_attempt_at=func.now() + timedelta(seconds=self.claim_timeout))
+            )
+            await session.commit()
+
+        sent_ids = []
+        failed = {}
+        for i in range(0, len(rows), SNS_BATCH_LIMIT):
+            chunk = rows[i:i + SNS_BATCH_LIMIT]
+            failures = await self._publish(chunk)
+            for message, age in chunk:
+                if message.id in failures:
+                    failed[message.id] = (message, failures[message.id][:500])
+                else:
+                    sent_ids.append(message.id)
+                    statsd_client.timing("outbox.lag", age.total_seconds() * 1000)
+
+        dead_lettered = 0
+        async with AsyncSessionLocal() as session:
+            if sent_ids:
+                await session.execute(
+                    update(EmailOutbox).where(EmailOutbox.id.in_(sent_ids)).values(sent_at=func.now())
+                )
+            for message, error in failed.values():
+                attempts = message.attempts + 1
+                await session.execute(
+                    update(EmailOutbox).where(EmailOutbox.id == message.id).values(
+                        attempts=attempts, last_error=error,
+                        next_attempt_at=func.now() + timedelta(seconds=retry_delay(attempts)),
+                    )
+                )
+                if attempts >= self.max_attempts:
+                    dead_lettered += 1
+                    logger.error(f"Outbox message {message.id} to {message.email} gave up after "
+                                 f"{attempts} attempts: {error}")
+            await session.commit()
+
+        failed = len(rows) - len(sent_ids)
+        statsd_client.incr("outbox.sent", len(sent_ids))
+        if failed:
+            statsd_client.incr("outbox.failed", failed)
+        if dead_lettered:
+            statsd_client.incr("outbox.dead_lettered", dead_lettered)
+        statsd_client.timing("outbox.batch_time", (time() - start_time) * 1000)
+        return len(rows)
+
+    async def _publish(self, chunk):
+        """Publish up to SNS_BATCH_LIMIT messages; returns {outbox id: error} for the ones that failed."""
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        entries = [
+            {"Id": str(message.id), "Message": message.message, "Subject": message.subject}
+            for message, _ in chunk
+        ]
+        try:
+            response = await aws_clients.sns.publish_batch(
+                TopicArn=os.getenv("SNS_TOPIC_ARN"),
+                PublishBatchRequestEntries=entries,
+            )
+        except (BotoCoreError, ClientError) as e:
+            logger.error(f"Failed to publish outbox batch: {e}")
+            return {message.id: str(e) for message, _ in chunk}
+
+        return {
+            int(failure["Id"]): failure.get("Message") or failure.get("Code", "unknown error")
+            for failure in response.get("Failed", [])
+        }
+
+
+outbox_dispatcher = OutboxDispatcher()
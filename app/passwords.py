@@ -0,0 +1,116 @@
+# app/passwords.py
+# bcrypt hashing and verification run on a worker pool so they don't block
+# the event loop. Hashing is capped below the pool size so a burst of
+# signups or password changes always leaves workers free for logins.
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from time import time
+from dotenv import load_dotenv
+from app.metrics import statsd_client
+from app.tracing import span
+
+load_dotenv()
+
+_pwd_context = None
+
+# "thread" works well because bcrypt releases the GIL; "process" isolates it completely
+EXECUTOR_KIND = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+MAX_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+MAX_CONCURRENT_HASHES = int(os.getenv("PASSWORD_HASH_MAX_CONCURRENT_HASHES", str(max(1, MAX_WORKERS // 2))))
+
+
+def get_pwd_context():
+    # passlib is imported on first use rather than at startup
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+
+def _hash(password):
+    return get_pwd_context().hash(password)
+
+
+def _verify(password, hashed_password):
+    return get_pwd_context().verify(password, hashed_password)
+
+
+class PasswordHasher:
+    def __init__(self, executor_kind=EXECUTOR_KIND, max_workers=MAX_WORKERS,
+                 max_concurrent_hashes=MAX_CONCURRENT_HASHES):
+        self.executor_kind = executor_kind
+        self.max_workers = max_workers
+        self.max_concurrent_hashes = max_concurrent_hashes
+        self._executor = None
+        self._slots = None
+        self._hash_slots = None
+        self._pending = 0
+
+    def _ensure_started(self):
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="password-hasher")
+            self._slots = asyncio.Semaphore(self.max_workers)
+            self._hash_slots = asyncio.Semaphore(self.max_concurrent_hashes)
+
+    @property
+    def queue_depth(self):
+        return self._pending
+
+    async def _run(self, operation, func, *args, limit=None):
+        self._ensure_started()
+        self._pending += 1
+        statsd_client.gauge("password_hasher.queue_depth", self._pending)
+        start_time = time()
+        try:
+            if limit is not None:
+                await limit.acquire()
+            try:
+                async with self._slots:
+                    statsd_client.timing(f"password_hasher.{operation}_wait_time", (time() - start_time) * 1000)
+                    with span(f"password.{operation}", "bcrypt"):
+                        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+            finally:
+                if limit is not None:
+                    limit.release()
+        finally:
+            self._pending -= 1
+            statsd_client.timing(f"password_hasher.{operation}_time", (time() - start_time) * 1000)
+
+    async def hash(self, password):
+        self._ensure_started()
+        return await self._run("hash", _hash, password, limit=self._hash_slots)
+
+    async def verify(self, password, hashed_password):
+        return await self._run("verify", _verify, password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _after_fork(self):
+        # Worker threads don't survive fork; the child builds its own pool on first use
+        self._executor = None
+        self._slots = None
+        self._hash_slots = None
+        self._pending = 0
+
+
+password_hasher = PasswordHasher()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=password_hasher._after_fork)
+
+
+async def hash_password(password):
+    return await password_hasher.hash(password)
+
+
+async def verify_password(password, hashed_password):
+    return await password_hasher.verify(password, hashed_password)
@@ -0,0 +1,106 @@
+# app/presign.py
+# Presigned GET URLs for image objects. Signing is a local HMAC computation
+# (no request to S3), and each URL is reused until shortly before it expires.
+# Signing can still block: botocore refreshes expiring instance-role
+# credentials from the metadata service inside generate_presigned_url. Cache
+# misses are therefore signed on the AWS thread pool, one hop per page of
+# images, and hits never leave the event loop. A URL dies with the temporary
+# credentials that signed it, so a cached URL is never served past the expiry
+# of those credentials, whatever IMAGE_URL_EXPIRY says.
+import os
+import threading
+from collections import OrderedDict
+from time import time
+from dotenv import load_dotenv
+from app.aws import aws_clients
+from app.metrics import statsd_client
+
+load_dotenv()
+
+IMAGE_URL_EXPIRY = int(os.getenv("IMAGE_URL_EXPIRY", "3600"))
+# Stop handing out a cached URL this many seconds before it expires
+IMAGE_URL_REFRESH_MARGIN = int(os.getenv("IMAGE_URL_REFRESH_MARGIN", "300"))
+IMAGE_URL_CACHE_SIZE = int(os.getenv("IMAGE_URL_CACHE_SIZE", "10000"))
+
+
+class PresignedUrlCache:
+    """Bounded LRU of (bucket, key) -> (presigned URL, time to stop serving it)."""
+
+    def __init__(self, expiry=IMAGE_URL_EXPIRY, refresh_margin=IMAGE_URL_REFRESH_MARGIN,
+                 max_size=IMAGE_URL_CACHE_SIZE):
+        self.expiry = expiry
+        # A margin at least as long as the expiry would mean never reusing a URL
+        self.refresh_margin = min(refresh_margin, expiry // 2)
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sign_all(self, client, objects):
+        """Sign ``objects``; returns the URLs and when the signing credentials expire (None if never).
+
+        Runs on the AWS thread pool. The expiry is read before signing, so a
+        refresh in between can only make it earlier than the real one.
+        """
+        credentials_expiry = aws_clients.credentials_expiry()
+        urls = [
+            client.generate_presigned_url("get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=self.expiry)
+            for bucket, key in objects
+        ]
+        return urls, credentials_expiry
+
+    async def get_many(self, objects):
+        """Presigned URLs for a list of (bucket, key) pairs, in the same order."""
+        now = time()
+        urls = {}
+        with self._lock:
+            for obj in objects:
+                entry = self._entries.get(obj)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(obj)
+                    urls[obj] = entry[0]
+        misses = list(dict.fromkeys(obj for obj in objects if obj not in urls))
+        if len(misses) < len(objects):
+            statsd_client.incr("presign_cache.hit", len(objects) - len(misses))
+
+        if misses:
+            statsd_client.incr("presign_cache.miss", len(misses))
+            s3 = aws_clients.s3
+            signed, credentials_expiry = await s3.run(self._sign_all, s3.client, misses)
+            valid_until = now + self.expiry
+            if credentials_expiry is not None:
+                valid_until = min(valid_until, credentials_expiry)
+            serve_until = valid_until - self.refresh_margin
+            with self._lock:
+                for obj, url in zip(misses, signed):
+                    urls[obj] = url
+                    # Credentials about to expire: hand the URL out once, and sign afresh next time
+                    if serve_until > now:
+                        self._entries[obj] = (url, serve_until)
+                        self._entries.move_to_end(obj)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return [urls[obj] for obj in objects]
+
+    async def get(self, bucket, key):
+        return (await self.get_many([(bucket, key)]))[0]
+
+    def invalidate(self, bucket, key):
+        with self._lock:
+            self._entries.pop((bucket, key), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+
+presigned_urls = PresignedUrlCache()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=presigned_urls._after_fork)
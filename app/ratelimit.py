@@ -0,0 +1,220 @@
+# app/ratelimit.py
+# Token-bucket rate limiting for signup, verification and Basic auth.
+#
+# Route limits are keyed by client IP. Every request carrying Basic credentials
+# also reserves a token from buckets keyed by IP and by username before it
+# reaches bcrypt, and gets it back unless the response is a 401. The username
+# bucket is scoped to the client IP as well, so failures from one address
+# can't lock the account's owner out from everywhere else. A request
+# whose bucket is empty is rejected up front, so a credential stuffing burst
+# is cut off without costing a hash per attempt, even when it arrives in
+# parallel faster than the first attempts can fail.
+#
+# Buckets live in a bounded in-process LRU by default. Each worker then limits
+# independently; set RATE_LIMIT_BACKEND to "package.module:Class" to share
+# buckets between workers through any store implementing RateLimitBackend.
+import base64
+import binascii
+import importlib
+import json
+import math
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+from dotenv import load_dotenv
+from starlette.responses import JSONResponse
+from starlette.routing import compile_path
+from app.database import env_bool
+from app.metrics import statsd_client
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = env_bool("RATE_LIMIT_ENABLED", True)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# "METHOD /route/template" -> {key type: [burst, period in seconds]}; "auth_failures" applies to every
+# request carrying Basic credentials, and its "user" buckets are per (username, IP). Override or extend
+# with RATE_LIMIT_RULES (same shape, JSON).
+DEFAULT_RULES = {
+    "POST /v2/users/": {"ip": [10, 60]},
+    "GET /v2/users/verify": {"ip": [30, 60]},
+    "POST /v2/users/login": {"ip": [60, 60]},
+    "auth_failures": {"ip": [30, 60], "user": [10, 60]},
+}
+
+
+@dataclass(frozen=True)
+class Limit:
+    burst: int
+    period: float
+
+    @property
+    def rate(self):
+        return self.burst / self.period
+
+
+class RateLimitBackend:
+    """Storage for token buckets.
+
+    ``take`` refills the bucket for ``key`` at ``limit.rate`` tokens per second
+    up to ``limit.burst``, then removes ``cost`` tokens if that many are
+    available. It returns 0 when they were (or would be, with ``consume``
+    false) available, otherwise the seconds until they will be.
+    """
+
+    async def take(self, key, limit, cost=1, consume=True):
+        raise NotImplementedError
+
+    async def refund(self, key, limit, cost=1):
+        """Return ``cost`` tokens taken from ``key``, without exceeding ``limit.burst``."""
+        raise NotImplementedError
+
+
+class MemoryBackend(RateLimitBackend):
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last refill)
+
+    def take_now(self, key, limit, cost=1, consume=True, now=None):
+        now = monotonic() if now is None else now
+        tokens, updated_at = self._buckets.get(key, (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+
+        retry_after = 0.0
+        if tokens >= cost:
+            if consume:
+                tokens -= cost
+        else:
+            retry_after = (cost - tokens) / limit.rate
+
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        # A key idle long enough to be evicted has refilled to a full bucket anyway
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    async def take(self, key, limit, cost=1, consume=True):
+        return self.take_now(key, limit, cost, consume)
+
+    async def refund(self, key, limit, cost=1):
+        if key in self._buckets:
+            tokens, updated_at = self._buckets[key]
+            self._buckets[key] = (min(limit.burst, tokens + cost), updated_at)
+
+    def clear(self):
+        self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+def load_backend(name=RATE_LIMIT_BACKEND):
+    if name == "memory":
+        return MemoryBackend()
+    module_name, _, class_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def load_rules():
+    rules = dict(DEFAULT_RULES)
+    rules.update(json.loads(os.getenv("RATE_LIMIT_RULES", "{}")))
+    return {
+        name: {key_type: Limit(int(burst), float(period)) for key_type, (burst, period) in limits.items()}
+        for name, limits in rules.items()
+    }
+
+
+def basic_auth_username(scope):
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, credentials = value.partition(b" ")
+            if scheme.lower() != b"basic":
+                return None
+            try:
+                return base64.b64decode(credentials).decode().partition(":")[0]
+            except (binascii.Error, UnicodeDecodeError):
+                return None
+    return None
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, rules=None, backend=None, enabled=RATE_LIMIT_ENABLED):
+        self.app = app
+        self.enabled = enabled
+        self.backend = backend or load_backend()
+        rules = rules if rules is not None else load_rules()
+        self.auth_failure_limits = rules.pop("auth_failures", {})
+        self.routes = []
+        for name, limits in rules.items():
+            method, _, path = name.partition(" ")
+            regex, _, _ = compile_path(path)
+            self.routes.append((method.upper(), regex, path, limits))
+
+    def _route_limits(self, scope):
+        for method, regex, path, limits in self.routes:
+            if scope["method"] == method and regex.match(scope["path"]):
+                return path, limits
+        return None, {}
+
+    async def _throttled(self, send, name, retry_after):
+        statsd_client.incr("ratelimit.throttled")
+        statsd_client.incr(f"{name}.throttled")
+        response = JSONResponse({"detail": "Too many requests"}, status_code=429,
+                                headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+        await response(None, None, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        keys = {"ip": client[0] if client else "unknown"}
+        username = basic_auth_username(scope)
+        if username is not None:
+            keys["user"] = username.lower()
+
+        path, limits = self._route_limits(scope)
+        for key_type, limit in limits.items():
+            if key_type in keys:
+                retry_after = await self.backend.take(f"{path}:{key_type}:{keys[key_type]}", limit)
+                if retry_after:
+                    await self._throttled(send, path, retry_after)
+                    return
+
+        # Every attempt reserves a failure token before bcrypt runs, so accounts and addresses
+        # with too many recent or in-flight failures are refused without a hash
+        failure_limits = self.auth_failure_limits if username is not None else {}
+        reserved = []
+        for key_type, limit in failure_limits.items():
+            key = f"auth:{key_type}:{keys[key_type]}"
+            if key_type != "ip":
+                # Otherwise anyone could lock an account out by failing its password a few times
+                key += f":{keys['ip']}"
+            retry_after = await self.backend.take(key, limit)
+            if retry_after:
+                await self._refund(reserved)
+                await self._throttled(send, "auth_failures", retry_after)
+                return
+            reserved.append((key, limit))
+
+        status = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper if reserved else send)
+        finally:
+            # Only failed logins keep their token
+            if status.get("code") != 401:
+                await self._refund(reserved)
+
+    async def _refund(self, reserved):
+        for key, limit in reserved:
+            await self.backend.refund(key, limit)
@@ -0,0 +1,33 @@
+# app/responses.py
+# Default JSON response class. Renders with orjson when it is installed
+# (requirements.txt pins it), which encodes dicts, datetimes
+# and dates natively, and falls back to the standard library encoder
+# otherwise. Rendering is recorded as the request's serialization span.
+#
+# Hot endpoints build plain dicts from ORM rows and return this response
+# directly. FastAPI then skips validating and re-encoding the value against
+# response_model, which is kept on the route for the OpenAPI schema only.
+import json
+from datetime import date
+from starlette.responses import JSONResponse
+from app.tracing import span
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, date):  # datetime is a date subclass
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        with span("serialize", "serialization"):
+            if orjson is not None:
+                return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+            return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+                              default=_default).encode("utf-8")
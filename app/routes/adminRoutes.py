@@ -0,0 +1,30 @@
+# app/routes/adminRoutes.py
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.admin import require_admin
+from app.tracing import trace_buffer, chrome_trace, profiler, ProfilerBusy
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.get("/traces")
+async def get_traces(limit: Optional[int] = Query(None, ge=1),
+                     min_duration_ms: float = Query(0, ge=0),
+                     route: Optional[str] = Query(None, description="substring of \"METHOD /route/template\"")):
+    # Chrome trace event JSON; open in chrome://tracing or https://ui.perfetto.dev
+    traces = trace_buffer.traces(limit=limit, min_duration_ms=min_duration_ms, name=route)
+    return JSONResponse(chrome_trace(traces), headers={"Content-Disposition": 'attachment; filename="traces.json"'})
+
+@router.post("/profile")
+async def run_profile(seconds: float = Query(10, gt=0, le=60), interval_ms: float = Query(5, ge=1, le=1000)):
+    # Samples the event loop thread while it keeps serving requests; returns folded stacks
+    try:
+        profiler.start(interval_ms=interval_ms)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+    return PlainTextResponse(profiler.folded())
@@ -1,18 +1,27 @@
 # app/routes/health.py
-from fastapi import APIRouter, Depends, HTTPException, Response
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from app.database import get_db
-from app.models.user import User
+from fastapi import APIRouter, Response
+from fastapi.responses import JSONResponse
+from app.health import health_prober
 
 router = APIRouter()
 
 @router.get("/healthz",status_code=200)
-async def health_check(session: AsyncSession = Depends(get_db)):
-    try:
-        # Check database connectivity
-        result = await session.execute(select(1))
+async def health_check():
+    # Answered from the background prober's cache; no pool connection per probe
+    if await health_prober.is_ready():
         return Response(content="", status_code=200)
-    except Exception as e:
-        raise HTTPException(status_code=503, detail=f"Database check failed: {str(e)}")
+    return Response(content="", status_code=503)
 
+@router.get("/livez", status_code=200)
+async def liveness_check():
+    # The process is up and its event loop is serving requests
+    return Response(content="", status_code=200)
+
+@router.get("/readyz")
+async def readiness_check():
+    ready = await health_prober.is_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        # Unauthenticated, so no error strings: they can carry hostnames, ARNs and driver details
+        content={"status": "ready" if ready else "unavailable", "dependencies": health_prober.statuses()},
+    )
@@ -1,23 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Header, Response, Query, Request
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPBasic, HTTPBasicCredentials, HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import update, delete
 from sqlalchemy.future import select
-from sqlalchemy.exc import SQLAlchemyError
-from app.models.user import User,Image
-from app.schemas.userSchemas import UserCreate, UserUpdate, UserResponse, ImageResponse
-from app.database import get_db
-from app.bootstrap import get_s3_client
-from passlib.context import CryptContext
+from typing import Optional
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from app.models.user import User, Image, EmailOutbox
+from app.schemas.userSchemas import UserCreate, UserUpdate, UserResponse, ImageResponse, ImageListResponse, \
+    ImageBatchDelete, ImageBatchDeleteResponse, ImageDeleteFailure, TokenResponse
+from app.database import get_db, get_read_db, ReadSessionLocal, replica_router, route_reads_for
+from app.aws import aws_clients
+from app.outbox import outbox_dispatcher
+from app.email_logs import email_log_writer, EMAIL_LOG_MODE
+from app.uploads import StreamingUpload, UploadTooLarge
+from app.auth_cache import credential_cache, UserSnapshot
+from app.passwords import hash_password, verify_password
+from app.presign import presigned_urls
+from app.tracing import span
+from app.responses import FastJSONResponse
+from app.tokens import issue_access_token, decode_access_token, revoke_access_token, \
+    token_denylist, InvalidToken
+from app.admin import require_admin
+from app.bulk_import import BulkUserImporter, PARSERS, iter_lines, insert_ignoring_conflicts, IMPORT_BATCH_SIZE, \
+    IMPORT_MAX_BATCH_SIZE
+import asyncio
 import uuid
+import hashlib
 import os
 import json
-import boto3
 import logging
-import hashlib
 from dotenv import load_dotenv
 from app.metrics import statsd_client
 from time import time
-from itsdangerous import URLSafeTimedSerializer
+from app.verification import verification_link, verification_message, load_verification_token, consumed_tokens, \
+    VERIFICATION_SUBJECT
 # Database logging function
 from sqlalchemy.ext.asyncio import AsyncSession
 import logging
@@ -27,9 +44,9 @@ load_dotenv()
 
 bucket_name = os.getenv("BUCKET_NAME")
 
-# Create security object for basic auth
-security = HTTPBasic()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Protected routes accept a bearer token from /login or, for compatibility, Basic auth
+security = HTTPBasic(auto_error=False)
+bearer = HTTPBearer(auto_error=False)
 router = APIRouter()
 
 # Configure logging
@@ -39,13 +56,52 @@ logger = logging.getLogger(__name__)
 # Validate required environment variables
 required_env_vars = ["AWS_REGION", "BASE_URL", "SNS_TOPIC_ARN", "SECRET_KEY", "TOKEN_MAX_AGE"]
 
-serializer = URLSafeTimedSerializer(os.getenv("SECRET_KEY"))
+PRINCIPAL_COLUMNS = (
+    User.id, User.email, User.first_name, User.last_name,
+    User.account_created, User.account_updated, User.is_verified, User.token_version,
+)
+
+USER_RESPONSE_COLUMNS = (
+    User.email, User.first_name, User.last_name, User.account_created, User.account_updated,
+)
+
+# Only what an image response returns; a listing also needs the bucket to sign each URL
+IMAGE_RESPONSE_COLUMNS = (Image.id, Image.user_id, Image.object_key, Image.image_url, Image.upload_date)
+IMAGE_LIST_COLUMNS = IMAGE_RESPONSE_COLUMNS + (Image.bucket_name,)
+IMAGE_PAGE_MAX_SIZE = 100
+# S3 DeleteObjects accepts at most 1000 keys per call
+S3_DELETE_BATCH_LIMIT = 1000
+
+IMPORT_CONTENT_TYPES = {"application/x-ndjson": "ndjson", "text/csv": "csv"}
+
+
+# The per-request lookups, kept as builders so tests can EXPLAIN the exact statements
+def credentials_query(email):
+    return select(User.hashed_password, *PRINCIPAL_COLUMNS).where(User.email == email)
+
+
+def image_page_query(user_id, after, limit):
+    # Keyset pagination on (user_id, id): every page is an index range scan, however deep
+    query = select(*IMAGE_LIST_COLUMNS).where(Image.user_id == user_id)
+    if after is not None:
+        query = query.where(Image.id > after)
+    # One extra row tells whether another page exists without a COUNT
+    return query.order_by(Image.id).limit(limit + 1)
+
+
+def duplicate_image_query(user_id, sha256):
+    return select(Image.id).where(Image.user_id == user_id, Image.sha256 == sha256)
+
 async def authenticate_user(credentials: HTTPBasicCredentials, session: AsyncSession):
     try:
-        result = await session.execute(select(User).where(User.email == credentials.username))
-        user = result.scalar_one_or_none()
-        
-        if not user or not pwd_context.verify(credentials.password, user.hashed_password):
+        # Only the columns the snapshot needs, as a plain row rather than an ORM entity
+        result = await session.execute(credentials_query(credentials.username))
+        user = result.one_or_none()
+
+        # Credentials recently verified against this same password hash skip bcrypt
+        cached = user is not None and \
+            credential_cache.matches(credentials.username, credentials.password, user.hashed_password)
+        if not cached and (not user or not await verify_password(credentials.password, user.hashed_password)):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
@@ -56,11 +112,76 @@ async def authenticate_user(credentials: HTTPBasicCredentials, session: AsyncSes
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Account not verified. Please complete email verification.",
             )
-        return user
+        if not cached:
+            # Tied to the hash read above: if the password changed meanwhile, the entry never matches
+            credential_cache.put(credentials.username, credentials.password, user.hashed_password)
+        return UserSnapshot.from_user(user)
     except SQLAlchemyError as e:
         logger.error(f"Database error during authentication: {e}")
         raise HTTPException(status_code=500, detail="Database error occurred")
 
+async def authenticate_token(token: str, session: AsyncSession) -> UserSnapshot:
+    # Signature, age and denylist first, then one primary-key lookup for the current profile; no bcrypt
+    try:
+        claims = decode_access_token(token)
+    except InvalidToken as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    try:
+        route_reads_for(session, claims["email"])
+        result = await session.execute(select(*PRINCIPAL_COLUMNS).where(User.id == claims["sub"]))
+        user = result.one_or_none()
+    except SQLAlchemyError as e:
+        logger.error(f"Database error during authentication: {e}")
+        raise HTTPException(status_code=500, detail="Database error occurred")
+    # A password change since the token was issued retires it in every worker
+    if user is None or user.token_version != claims["ver"]:
+        statsd_client.incr("auth.token.revoked")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revoked",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return UserSnapshot.from_user(user)
+
+async def get_current_user(token: Optional[HTTPAuthorizationCredentials] = Depends(bearer),
+                           credentials: Optional[HTTPBasicCredentials] = Depends(security)) -> UserSnapshot:
+    """Authenticated principal, loaded once per request and shared by every handler.
+
+    The lookup uses its own read session, closed before the handler runs, so a
+    write handler never holds it alongside its own primary connection.
+    """
+    if token is None and credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Basic"}
+        )
+    async with ReadSessionLocal() as session:
+        if token is not None:
+            return await authenticate_token(token.credentials, session)
+        # Read from the primary right after this user's own writes (e.g. a password change)
+        route_reads_for(session, credentials.username)
+        return await authenticate_user(credentials, session)
+
+def user_etag(user):
+    fingerprint = f"{user.id}:{user.email}:{user.first_name}:{user.last_name}:{user.account_updated}"
+    return '"' + hashlib.sha1(fingerprint.encode()).hexdigest() + '"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
 
 
 logger = logging.getLogger(__name__)
@@ -69,39 +190,80 @@ async def log_email_in_db(email, verification_link, session: AsyncSession = Depe
     try:
         query = text("""
             INSERT INTO email_logs (email, verification_link, sent_at)
-            VALUES (:email, :verification_link, NOW())
+            VALUES (:email, :verification_link, CURRENT_TIMESTAMP)
         """)
-        # Execute the query asynchronously
+        # Execute the query asynchronously; the caller commits it with the rest of the signup
         await session.execute(query, {"email": email, "verification_link": verification_link})
-        await session.commit()  # Persist changes to the database
         logger.info(f"Logged email for {email}")
     except Exception as e:
         logger.error(f"Failed to log email for {email}: {e}")
         raise HTTPException(status_code=503, detail="Failed to log email")
 
 
+DUPLICATE_IMAGE_CONSTRAINT = "uq_images_user_id_sha256"
+
+def violated_constraint(error):
+    """Name of the constraint behind an IntegrityError, when the driver reports one."""
+    # asyncpg raises the error SQLAlchemy wraps as the DBAPI exception's cause
+    for exc in (error.orig, getattr(error.orig, "__cause__", None)):
+        name = getattr(exc, "constraint_name", None)
+        if name:
+            return name
+    return None
+
+
+def user_body(user):
+    """UserResponse fields from any row or snapshot that has them, ready for FastJSONResponse."""
+    return {
+        "email": user.email,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "account_created": user.account_created,
+        "account_updated": user.account_updated,
+    }
+
+
+def image_body(image):
+    """ImageResponse fields from an images row; the upload date renders as YYYY-MM-DD."""
+    return {
+        "file_name": image.object_key,
+        "id": str(image.id),
+        "url": image.image_url,
+        "upload_date": image.upload_date.date(),
+        "user_id": str(image.user_id),
+    }
+
+
 @router.get("/verify", status_code=200)
 async def verify_user(user: str, token: str, session: AsyncSession = Depends(get_db)):
+    # A replayed link is answered from memory until the token would have expired
+    if consumed_tokens.consumed_by(token) == user:
+        statsd_client.incr("verify.replayed")
+        return {"message": "Email successfully verified"}
+
     try:
-        
         # Decode the token
-        token_max_age = int(os.getenv("TOKEN_MAX_AGE", "120"))  # Default to 120 seconds if not set
-        data = serializer.loads(token, salt="email-verification-salt", max_age=token_max_age)
+        data = load_verification_token(token)
 
         if data["email"] != user:
             raise HTTPException(status_code=400, detail="Invalid token or user mismatch")
 
-        # Fetch the user from the database
-        result = await session.execute(select(User).where(User.email == user))
-        db_user = result.scalar_one_or_none()
-
-        if not db_user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        # Update the user's verification status
-        db_user.is_verified = True
-        await session.commit()
-
+        # One round trip: only an unverified user's row is updated
+        result = await session.execute(
+            update(User).where(User.email == user, User.is_verified.is_(False))
+            .values(is_verified=True).returning(User.id)
+        )
+        if result.scalar_one_or_none() is not None:
+            await session.commit()
+            replica_router.mark_write(user)
+        else:
+            # Already verified (the link is idempotent) or no such user
+            result = await session.execute(select(User.is_verified).where(User.email == user))
+            if result.scalar_one_or_none() is None:
+                raise HTTPException(status_code=404, detail="User not found")
+            statsd_client.incr("verify.already_verified")
+
+        consumed_tokens.add(token, user)
         return {"message": "Email successfully verified"}
 
     except Exception as e:
@@ -112,68 +274,108 @@ async def verify_user(user: str, token: str, session: AsyncSession = Depends(get
 @router.post("/", response_model=UserResponse, status_code=201)
 async def create_user(user: UserCreate, session: AsyncSession = Depends(get_db)):
     try:
-        # Check if the email already exists
-        existing_user = await session.execute(select(User).where(User.email == user.email))
-        if existing_user.scalar() is not None:
-            raise HTTPException(status_code=400, detail="Email already exists")
-
         # Hash the password
-        hashed_password = pwd_context.hash(user.password)
+        hashed_password = await hash_password(user.password)
 
-        # Create a new user
-        new_user = User(
+        # One round trip: the unique email constraint rejects existing users instead of a prior SELECT
+        statement = insert_ignoring_conflicts(User.__table__, session.bind.dialect.name).values(
             email=user.email,
             hashed_password=hashed_password,
             first_name=user.first_name,
             last_name=user.last_name,
             is_verified=False,
         )
+        result = await session.execute(
+            statement.on_conflict_do_nothing(index_elements=["email"]).returning(*USER_RESPONSE_COLUMNS)
+        )
+        new_user = result.first()
+        if new_user is None:
+            raise HTTPException(status_code=400, detail="Email already exists")
 
-        session.add(new_user)
+        # Generate the token for email verification
+        link = verification_link(new_user.email)
+
+        if EMAIL_LOG_MODE == "inline":
+            # Log the email and verification link in the signup transaction
+            try:
+                await log_email_in_db(new_user.email, link, session)
+            except Exception as e:
+                logger.error(f"Failed to log email for {new_user.email}: {e}")
+                # Decide if this failure should impact the user creation flow
+                raise HTTPException(status_code=503, detail="Failed to log email")
+
+        # Queue the verification message in the same transaction as the user;
+        # the outbox dispatcher publishes it to SNS in the background
+        session.add(EmailOutbox(
+            email=new_user.email,
+            subject=VERIFICATION_SUBJECT,
+            message=verification_message(new_user.email, link),
+        ))
         await session.commit()
+        outbox_dispatcher.notify()
+        if EMAIL_LOG_MODE != "inline":
+            # Written by the background batch writer, off the request path
+            email_log_writer.log(new_user.email, link)
 
-        # Generate the token for email verification
-        token = serializer.dumps({"email": new_user.email}, salt="email-verification-salt")
-        verification_link = f"http://{os.getenv('BASE_URL')}/v2/users/verify?user={new_user.email}&token={token}"
+        return FastJSONResponse(user_body(new_user), status_code=201)
 
-        # Log the email and verification link in the database
-        try:
-            await log_email_in_db(new_user.email, verification_link, session)
-        except Exception as e:
-            logger.error(f"Failed to log email for {new_user.email}: {e}")
-            # Decide if this failure should impact the user creation flow
-            raise HTTPException(status_code=503, detail="Failed to log email")
+    except SQLAlchemyError as e:
+        logger.error(f"Database error occurred: {e}")
+        raise HTTPException(status_code=503, detail="Database error occurred")
 
-        # Configure the SNS client
-        sns_client = boto3.client("sns", region_name=os.getenv("AWS_REGION"))
+class RequestStreamingResponse(StreamingResponse):
+    """StreamingResponse whose content reads the request body while it is sent.
+
+    Starlette's version polls receive() for a client disconnect during the
+    response, which would swallow the body chunks the generator still needs.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+@router.post("/login", response_model=TokenResponse)
+async def login(credentials: Optional[HTTPBasicCredentials] = Depends(security),
+                session: AsyncSession = Depends(get_read_db)):
+    # Exchange Basic credentials (one bcrypt verify) for a token that later requests check by signature.
+    # Tokens can't be traded for new ones, so a revoked session can't extend itself.
+    if credentials is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated",
+                            headers={"WWW-Authenticate": "Basic"})
+    route_reads_for(session, credentials.username)
+    authenticated_user = await authenticate_user(credentials, session)
+    access_token, expires_in = issue_access_token(authenticated_user)
+    return TokenResponse(access_token=access_token, expires_in=expires_in)
+
+@router.post("/logout", status_code=204)
+async def logout(token: Optional[HTTPAuthorizationCredentials] = Depends(bearer)):
+    if token is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Bearer token required",
+                            headers={"WWW-Authenticate": "Bearer"})
+    try:
+        revoke_access_token(decode_access_token(token.credentials))
+    except InvalidToken:
+        pass  # Already unusable
+    return Response(status_code=204)
 
-        sns_message = {
-            "email": new_user.email,
-            "verification_link": verification_link,
-        }
+@router.post("/import", dependencies=[Depends(require_admin)])
+async def import_users(request: Request,
+                       batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=IMPORT_MAX_BATCH_SIZE)):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in IMPORT_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail="Send users as application/x-ndjson or text/csv")
 
-        # Publish the verification message
-        try:
-            sns_client.publish(
-                TopicArn=os.getenv("SNS_TOPIC_ARN"),
-                Message=json.dumps(sns_message),
-                Subject="Email Verification Required"
-            )
-        except boto3.exceptions.Boto3Error as e:
-            logger.error(f"Failed to publish SNS message: {e}")
-            raise HTTPException(status_code=503, detail="Could not send verification email")
+    # The body is parsed as it arrives and results are streamed back batch by batch,
+    # so neither the input nor the output is ever held in memory in full
+    records = PARSERS[IMPORT_CONTENT_TYPES[content_type]](iter_lines(request.stream()))
+    importer = BulkUserImporter(batch_size=batch_size)
 
-        return UserResponse(
-            email=new_user.email,
-            first_name=new_user.first_name,
-            last_name=new_user.last_name,
-            account_created=new_user.account_created,
-            account_updated=new_user.account_updated,
-        )
+    async def results():
+        async for batch in importer.run(records):
+            yield "".join(json.dumps(result) + "\n" for result in batch)
 
-    except SQLAlchemyError as e:
-        logger.error(f"Database error occurred: {e}")
-        raise HTTPException(status_code=503, detail="Database error occurred")
+    return RequestStreamingResponse(results(), media_type="application/x-ndjson")
 
 @router.get("/CICD")
 async def get_cicd():
@@ -182,159 +384,299 @@ async def get_cicd():
 @router.put("/{user_id}", response_model=UserResponse)
 async def update_user(user_id: int, user_update: UserUpdate, 
                       session: AsyncSession = Depends(get_db), 
-                      credentials: HTTPBasicCredentials = Depends(security)):
+                      authenticated_user: UserSnapshot = Depends(get_current_user)):
     try:
-        # Authenticate the user
-        authenticated_user = await authenticate_user(credentials, session)
-
         # Check if the authenticated user is trying to update their own data
         if authenticated_user.id != user_id:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to update this user's data")
 
-        result = await session.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
-
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
+        values = {}
         if user_update.first_name:
-            user.first_name = user_update.first_name
+            values["first_name"] = user_update.first_name
         if user_update.last_name:
-            user.last_name = user_update.last_name
+            values["last_name"] = user_update.last_name
         if user_update.password:
-            user.hashed_password = pwd_context.hash(user_update.password)
+            values["hashed_password"] = await hash_password(user_update.password)
+            # Retire every access token issued under the old password
+            values["token_version"] = User.token_version + 1
+
+        if values:
+            # Update and read back in one round trip instead of select + commit + refresh
+            result = await session.execute(
+                update(User).where(User.id == user_id).values(**values).returning(*PRINCIPAL_COLUMNS)
+            )
+        else:
+            # Nothing to change: echo the stored row rather than a snapshot cached before another update
+            result = await session.execute(select(*PRINCIPAL_COLUMNS).where(User.id == user_id))
+        user = result.one_or_none()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
 
-        await session.commit()
-        await session.refresh(user)
+        if values:
+            await session.commit()
+            replica_router.mark_write(user.email)
 
-        return UserResponse(email=user.email, first_name=user.first_name,
-                            last_name=user.last_name,
-                            account_created=user.account_created,
-                            account_updated=user.account_updated)
+            # The new hash already retires cached credentials in every worker; this just frees the entry
+            credential_cache.invalidate(user.email)
+            if user_update.password:
+                token_denylist.revoke_user(user.id, user.token_version)
+
+        return FastJSONResponse(user_body(user))
 
     except SQLAlchemyError as e:
         logger.error(f"Database error occurred: {e}")
         raise HTTPException(status_code=503, detail="Database error occurred")
 
-@router.get("/{user_id}", response_model=UserResponse, status_code=200)
-async def get_user(user_id: int, 
-                   session: AsyncSession = Depends(get_db), 
-                   credentials: HTTPBasicCredentials = Depends(security)):
+# Declared before /{user_id} so "image" isn't parsed as a user id
+@router.get("/image", response_model=ImageListResponse)
+async def list_images(
+    limit: int = Query(50, ge=1, le=IMAGE_PAGE_MAX_SIZE),
+    after: Optional[int] = Query(None, description="next_cursor returned by the previous page"),
+    authenticated_user: UserSnapshot = Depends(get_current_user),
+    session: AsyncSession = Depends(get_read_db)
+):
+    # Right after this user's own uploads or deletes, list from the primary
+    route_reads_for(session, authenticated_user.email)
     try:
-        # Authenticate the user
-        authenticated_user = await authenticate_user(credentials, session)
+        result = await session.execute(image_page_query(authenticated_user.id, after, limit))
+        rows = result.all()
+    except SQLAlchemyError as e:
+        logger.error(f"Database error occurred: {e}")
+        raise HTTPException(status_code=503, detail="Database error occurred")
 
-        # Check if the authenticated user is trying to access their own data
-        if authenticated_user.id != user_id:
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to access this user's data")
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    try:
+        # Cached URLs are served inline; the page's misses are signed in one hop to the AWS pool
+        urls = await presigned_urls.get_many([(row.bucket_name, row.object_key) for row in rows[:limit]])
+        images = [dict(image_body(row), download_url=url) for row, url in zip(rows[:limit], urls)]
+    except Exception as e:
+        logger.error(f"An error occurred while signing image URLs: {e}")
+        raise HTTPException(status_code=503, detail="An error occurred while retrieving the images.")
 
-        result = await session.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
+    return FastJSONResponse({"images": images, "next_cursor": next_cursor})
 
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+@router.get("/{user_id}", response_model=UserResponse, status_code=200)
+async def get_user(user_id: int, 
+                   if_none_match: Optional[str] = Header(None),
+                   authenticated_user: UserSnapshot = Depends(get_current_user)):
+    # Check if the authenticated user is trying to access their own data
+    if authenticated_user.id != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to access this user's data")
 
-        return UserResponse(email=user.email, first_name=user.first_name,
-                            last_name=user.last_name,
-                            account_created=user.account_created,
-                            account_updated=user.account_updated)
-    
-    except SQLAlchemyError as e:
-        logger.error(f"Database error occurred: {e}")
-        raise HTTPException(status_code=503, detail="Database error occurred")
+    # The principal already holds the profile, so no second lookup is needed
+    etag = user_etag(authenticated_user)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    return FastJSONResponse(user_body(authenticated_user), headers={"ETag": etag})
 
 @router.post("/image", status_code=201)
 async def upload_image(
-    credentials: HTTPBasicCredentials = Depends(security),
+    authenticated_user: UserSnapshot = Depends(get_current_user),
     session: AsyncSession = Depends(get_db),
     file: UploadFile = File(...)
 ):
-    # Authenticate the user
-    authenticated_user = await authenticate_user(credentials, session)
 
-    s3_client = get_s3_client()
     file_extension = file.filename.split(".")[-1]
     if file_extension not in ["png", "jpg", "jpeg"]:
         raise HTTPException(status_code=400, detail="Unsupported file format.")
 
-    # Calculate the hash of the file to check for duplicates
-    file_content = await file.read()  # Read the file content for hashing
-    file_hash = hashlib.sha256(file_content).hexdigest()
-    await file.seek(0)  # Reset file pointer to beginning for upload
-
-    # Retrieve existing object keys for the user to check duplicates
-    result = await session.execute(select(Image.object_key).where(Image.user_id == authenticated_user.id))
-    existing_object_keys = result.scalars().all()
-
-    # Check each existing image in S3 to see if it matches the uploaded file's hash
-    for object_key in existing_object_keys:
-        try:
-            # Fetch the existing file from S3
-            existing_file_obj = s3_client.get_object(Bucket=bucket_name, Key=object_key)
-            existing_file_content = existing_file_obj['Body'].read()
-            existing_file_hash = hashlib.sha256(existing_file_content).hexdigest()
-
-            if file_hash == existing_file_hash:
-                raise HTTPException(status_code=409, detail="Image already exists.")
-        except s3_client.exceptions.NoSuchKey:
-            # Skip if the object does not exist in S3
-            continue
-
     # Generate a new unique object key for the new upload
     new_object_key = f"{authenticated_user.id}/{uuid.uuid4()}.{file_extension}"
 
+    # Stream the file to S3 in parts, hashing it on the way through
+    upload = StreamingUpload(bucket_name, new_object_key)
     try:
+        # Reading, hashing and part uploads; the S3 calls show up as nested spans
+        with span("upload.stream", "upload"):
+            await upload.consume(file)
+        file_hash = upload.sha256
+
+        # Check for a duplicate with a single lookup on the (user_id, sha256) index
+        # before the object is completed, so duplicates never land in the bucket
+        result = await session.execute(duplicate_image_query(authenticated_user.id, file_hash))
+        if result.scalar_one_or_none() is not None:
+            raise HTTPException(status_code=409, detail="Image already exists.")
+
         # Upload to S3
-        start_time = time()
-        s3_client.upload_fileobj(file.file, bucket_name, new_object_key)
-        duration = time() - start_time
-        statsd_client.timing("s3.upload_time", duration * 1000)
+        await upload.complete()
         image_url = f"https://{bucket_name}.s3.amazonaws.com/{new_object_key}"
 
         # Save metadata to the database
-        image = Image(user_id=authenticated_user.id, image_url=image_url, bucket_name=bucket_name, object_key=new_object_key)
+        image = Image(user_id=authenticated_user.id, image_url=image_url, bucket_name=bucket_name,
+                      object_key=new_object_key, sha256=file_hash)
         session.add(image)
         await session.commit()
-        await session.refresh(image)  # Refresh the instance to get the auto-generated ID
+    except BaseException as e:
+        # Whatever failed (or a disconnect cancelled), abort the multipart upload or remove the
+        # completed object, so nothing is left in the bucket without a row pointing at it
+        await upload.discard()
+        if isinstance(e, HTTPException) or not isinstance(e, Exception):
+            raise
+        raise await upload_error(e, session)
+
+    replica_router.mark_write(authenticated_user.email)
+    await session.refresh(image)  # Refresh the instance to get the auto-generated ID
+
+    return {"message": "Image uploaded successfully", "id": image.id, "url": image_url}
+
+
+async def upload_error(e, session):
+    """The HTTPException to report for an upload that failed with ``e``."""
+    if isinstance(e, UploadTooLarge):
+        return HTTPException(status_code=413, detail=str(e))
+    if isinstance(e, IntegrityError):
+        await session.rollback()
+        if violated_constraint(e) == DUPLICATE_IMAGE_CONSTRAINT:
+            # A concurrent upload of the same content won the race on the unique index
+            return HTTPException(status_code=409, detail="Image already exists.")
+    if isinstance(e, SQLAlchemyError):
+        logger.error(f"Database error occurred: {e}")
+        return HTTPException(status_code=503, detail="Database error occurred")
+    logger.error(f"An error occurred while uploading the image: {e}")
+    return HTTPException(status_code=503, detail="An error occurred while uploading the image.")
+
+
+async def delete_image_objects(images):
+    """Delete the S3 objects of (id, bucket_name, object_key) rows; returns {image id: error} for failures."""
+    s3_client = aws_clients.s3
+    by_bucket = {}
+    for image in images:
+        by_bucket.setdefault(image.bucket_name, []).append(image)
+
+    async def delete_chunk(bucket, chunk):
+        try:
+            # Quiet mode only reports the keys that could not be deleted
+            response = await s3_client.delete_objects(
+                Bucket=bucket,
+                Delete={"Objects": [{"Key": image.object_key} for image in chunk], "Quiet": True},
+            )
+        except Exception as e:
+            logger.error(f"An error occurred while deleting images from {bucket}: {e}")
+            return {image.id: "An error occurred while deleting the image." for image in chunk}
+        ids_by_key = {image.object_key: image.id for image in chunk}
+        return {
+            ids_by_key[error["Key"]]: error.get("Message") or error.get("Code", "unknown error")
+            for error in response.get("Errors", []) if error.get("Key") in ids_by_key
+        }
+
+    chunks = [
+        (bucket, bucket_images[i:i + S3_DELETE_BATCH_LIMIT])
+        for bucket, bucket_images in by_bucket.items()
+        for i in range(0, len(bucket_images), S3_DELETE_BATCH_LIMIT)
+    ]
+    failures = {}
+    for chunk_failures in await asyncio.gather(*(delete_chunk(bucket, chunk) for bucket, chunk in chunks)):
+        failures.update(chunk_failures)
+    return failures
+
+async def delete_images(session, images, email):
+    """Delete images from S3, then remove the rows whose objects are gone in one statement.
+
+    Returns (deleted ids, {image id: error}); rows whose objects could not be
+    deleted are kept so the request can be retried.
+    """
+    failures = await delete_image_objects(images)
+    deleted = [image.id for image in images if image.id not in failures]
+    if deleted:
+        await session.execute(delete(Image).where(Image.id.in_(deleted)))
+        await session.commit()
+        replica_router.mark_write(email)
+    for image in images:
+        if image.id not in failures:
+            presigned_urls.invalidate(image.bucket_name, image.object_key)
+
+    statsd_client.incr("images.deleted", len(deleted))
+    if failures:
+        statsd_client.incr("images.delete_failed", len(failures))
+    return deleted, failures
+
+def batch_delete_response(deleted, failures, not_found=()):
+    return ImageBatchDeleteResponse(
+        deleted=sorted(deleted),
+        not_found=sorted(not_found),
+        failed=[ImageDeleteFailure(id=image_id, error=error) for image_id, error in sorted(failures.items())],
+    )
+
+@router.post("/image/batch-delete", response_model=ImageBatchDeleteResponse)
+async def batch_delete_images(
+    body: ImageBatchDelete,
+    authenticated_user: UserSnapshot = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db)
+):
+    try:
+        # Other users' images are reported as not found rather than revealing that they exist
+        result = await session.execute(
+            select(Image.id, Image.bucket_name, Image.object_key)
+            .where(Image.user_id == authenticated_user.id, Image.id.in_(set(body.ids)))
+        )
+        images = result.all()
+        deleted, failures = await delete_images(session, images, authenticated_user.email)
+    except SQLAlchemyError as e:
+        logger.error(f"Database error occurred: {e}")
+        raise HTTPException(status_code=503, detail="Database error occurred")
+
+    not_found = set(body.ids) - {image.id for image in images}
+    return batch_delete_response(deleted, failures, not_found)
 
-        return {"message": "Image uploaded successfully", "id": image.id, "url": image_url}
+@router.delete("/image", response_model=ImageBatchDeleteResponse)
+async def delete_all_images(
+    authenticated_user: UserSnapshot = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db)
+):
+    deleted, failures = [], {}
+    last_id = 0
+    try:
+        # One page per S3 DeleteObjects call, walking the (user_id, id) index, so the
+        # IN list of the DELETE stays bounded however many images the user has
+        while True:
+            result = await session.execute(
+                select(Image.id, Image.bucket_name, Image.object_key)
+                .where(Image.user_id == authenticated_user.id, Image.id > last_id)
+                .order_by(Image.id)
+                .limit(S3_DELETE_BATCH_LIMIT)
+            )
+            images = result.all()
+            if not images:
+                break
+            last_id = images[-1].id
+            page_deleted, page_failures = await delete_images(session, images, authenticated_user.email)
+            deleted.extend(page_deleted)
+            failures.update(page_failures)
     except SQLAlchemyError as e:
         logger.error(f"Database error occurred: {e}")
         raise HTTPException(status_code=503, detail="Database error occurred")
-    except Exception as e:
-        logger.error(f"An error occurred while uploading the image: {e}")
-        raise HTTPException(status_code=503, detail="An error occurred while uploading the image.")
 
+    return batch_delete_response(deleted, failures)
 
 @router.delete("/image/{image_id}",status_code=204)
 async def delete_image(
     image_id: int,
-    credentials: HTTPBasicCredentials = Depends(security),
+    authenticated_user: UserSnapshot = Depends(get_current_user),
     session: AsyncSession = Depends(get_db)
 ):
-    # Authenticate the user
-    authenticated_user = await authenticate_user(credentials, session)
 
-    s3_client = get_s3_client()
+    s3_client = aws_clients.s3
     try:
         # Find the image metadata in the database
         result = await session.execute(select(Image).where(Image.id == image_id))
         image = result.scalar_one_or_none()
-        if image.user_id != authenticated_user.id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You are not authorized to delete this image.")
         if not image:
             raise HTTPException(status_code=404, detail="Image not found or you do not have permission to delete this image.")
+        if image.user_id != authenticated_user.id:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You are not authorized to delete this image.")
         
         # Delete from S3
-        start_time = time()
-        s3_client.delete_object(Bucket=image.bucket_name, Key=image.object_key)
-        duration = time() - start_time
-        statsd_client.timing("s3.delete_time", duration * 1000)
+        await s3_client.delete_object(Bucket=image.bucket_name, Key=image.object_key)
 
         # Delete metadata from the database
         await session.delete(image)
         await session.commit()
+        replica_router.mark_write(authenticated_user.email)
+        presigned_urls.invalidate(image.bucket_name, image.object_key)
         return {"message": "Image deleted successfully"}
+    except HTTPException:
+        raise
     except SQLAlchemyError as e:
         logger.error(f"Database error occurred: {e}")
         raise HTTPException(status_code=503, detail="Database error occurred")
@@ -345,16 +687,14 @@ async def delete_image(
 @router.get("/image/{image_id}", response_model=ImageResponse)
 async def get_image(
     image_id: int,
-    credentials: HTTPBasicCredentials = Depends(security),
-    session: AsyncSession = Depends(get_db)
+    authenticated_user: UserSnapshot = Depends(get_current_user),
+    session: AsyncSession = Depends(get_read_db)
 ):
-    # Authenticate the user
-    authenticated_user = await authenticate_user(credentials, session)
-
+    route_reads_for(session, authenticated_user.email)
     try:
         # Find the image metadata in the database
-        result = await session.execute(select(Image).where(Image.id == image_id))
-        image = result.scalar_one_or_none()
+        result = await session.execute(select(*IMAGE_RESPONSE_COLUMNS).where(Image.id == image_id))
+        image = result.one_or_none()
         
         if not image:
             raise HTTPException(status_code=404, detail="Image not found")
@@ -363,14 +703,10 @@ async def get_image(
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="You are not authorized to access this image.")
         
         # Build the response
-        return ImageResponse(
-            file_name= image.object_key,
-            id= str(image.id),
-            url = image.image_url,
-            upload_date = image.upload_date.strftime("%Y-%m-%d"),
-            user_id = str(image.user_id)
-        )
+        return FastJSONResponse(image_body(image))
 
+    except HTTPException:
+        raise
     except SQLAlchemyError as e:
         logger.error(f"Database error occurred: {e}")
         raise HTTPException(status_code=503, detail="Database error occurred")
@@ -1,6 +1,6 @@
 # app/schemas.py
-from typing import Optional
-from pydantic import BaseModel
+from typing import List, Optional
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 class UserCreate(BaseModel):
@@ -21,9 +21,33 @@ class UserResponse(BaseModel):
     account_created: datetime
     account_updated: Optional[datetime]
 
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
 class ImageResponse(BaseModel):
     file_name: str
     id: str
     url: str
     upload_date: str
     user_id: str
+
+class ImageListItem(ImageResponse):
+    download_url: str
+
+class ImageListResponse(BaseModel):
+    images: List[ImageListItem]
+    next_cursor: Optional[int]
+
+class ImageBatchDelete(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+class ImageDeleteFailure(BaseModel):
+    id: int
+    error: str
+
+class ImageBatchDeleteResponse(BaseModel):
+    deleted: List[int]
+    not_found: List[int]
+    failed: List[ImageDeleteFailure]
@@ -0,0 +1,119 @@
+# app/server.py
+# Production launcher: one worker process per core behind a shared socket.
+#
+#   python -m app.server
+#
+# Uses gunicorn with uvicorn workers when gunicorn is installed (it restarts
+# crashed workers and recycles them after WEB_MAX_REQUESTS), otherwise
+# uvicorn's own multi-process mode. uvloop and httptools are used when
+# available. Every setting can be overridden from the environment.
+import importlib.util
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP = "app.main:app"
+
+
+def available(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def default_workers():
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    return max(1, cores)
+
+
+def server_settings():
+    return {
+        "host": os.getenv("WEB_HOST", "0.0.0.0"),
+        "port": int(os.getenv("WEB_PORT", "8000")),
+        "workers": int(os.getenv("WEB_WORKERS", str(default_workers()))),
+        "backlog": int(os.getenv("WEB_BACKLOG", "2048")),
+        "keep_alive": int(os.getenv("WEB_KEEP_ALIVE", "75")),  # longer than the ALB's 60s idle timeout
+        "graceful_timeout": int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30")),
+        "max_requests": int(os.getenv("WEB_MAX_REQUESTS", "0")),
+        "limit_concurrency": int(os.getenv("WEB_LIMIT_CONCURRENCY", "0")) or None,
+        "loop": os.getenv("WEB_LOOP", "uvloop" if available("uvloop") else "asyncio"),
+        "http": os.getenv("WEB_HTTP", "httptools" if available("httptools") else "h11"),
+        "log_level": os.getenv("WEB_LOG_LEVEL", "info"),
+        "access_log": os.getenv("WEB_ACCESS_LOG", "false").lower() in ("1", "true", "yes", "on"),
+        "server": os.getenv("WEB_SERVER", "gunicorn" if available("gunicorn") else "uvicorn"),
+    }
+
+
+def run_uvicorn(settings):
+    import uvicorn
+
+    # uvicorn starts workers with the "spawn" method, so each one imports the app fresh
+    uvicorn.run(
+        APP,
+        host=settings["host"],
+        port=settings["port"],
+        workers=settings["workers"],
+        backlog=settings["backlog"],
+        timeout_keep_alive=settings["keep_alive"],
+        timeout_graceful_shutdown=settings["graceful_timeout"],
+        limit_max_requests=settings["max_requests"] or None,
+        limit_concurrency=settings["limit_concurrency"],
+        loop=settings["loop"],
+        http=settings["http"],
+        log_level=settings["log_level"],
+        access_log=settings["access_log"],
+        proxy_headers=True,
+    )
+
+
+def run_gunicorn(settings):
+    from gunicorn.app.base import BaseApplication
+    from uvicorn.workers import UvicornWorker
+
+    class TunedUvicornWorker(UvicornWorker):
+        CONFIG_KWARGS = {
+            "loop": settings["loop"],
+            "http": settings["http"],
+            "limit_concurrency": settings["limit_concurrency"],
+            "proxy_headers": True,
+        }
+
+    class Application(BaseApplication):
+        def load_config(self):
+            config = {
+                "bind": f"{settings['host']}:{settings['port']}",
+                "workers": settings["workers"],
+                "worker_class": TunedUvicornWorker,
+                "backlog": settings["backlog"],
+                "keepalive": settings["keep_alive"],
+                "graceful_timeout": settings["graceful_timeout"],
+                "max_requests": settings["max_requests"],
+                # Spread worker recycling so they don't all restart at once
+                "max_requests_jitter": settings["max_requests"] // 10,
+                "loglevel": settings["log_level"],
+                "accesslog": "-" if settings["access_log"] else None,
+                # Import the app after fork so every worker builds its own pools, caches and threads
+                "preload_app": False,
+            }
+            for key, value in config.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app.main import app
+            return app
+
+    Application().run()
+
+
+def main():
+    settings = server_settings()
+    if settings["server"] == "gunicorn":
+        run_gunicorn(settings)
+    else:
+        run_uvicorn(settings)
+
+
+if __name__ == "__main__":
+    main()
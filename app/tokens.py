@@ -0,0 +1,107 @@
+# app/tokens.py
+# Short-lived signed access tokens issued by POST /v2/users/login. A bearer
+# token carries only the user's id, email and token version. Requests check
+# its signature and then load the profile by primary key, so they skip bcrypt
+# but always see the current row.
+#
+# Logout denylists the token id in the worker that handled it. A password
+# change raises the user's token version, and the version is compared with the
+# stored row on every request, so that revocation applies to every worker at
+# once. ACCESS_TOKEN_TTL bounds how long other workers accept a logged-out token.
+import os
+import secrets
+from time import time
+from dotenv import load_dotenv
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from app.metrics import statsd_client
+
+load_dotenv()
+
+ACCESS_TOKEN_TTL = int(os.getenv("ACCESS_TOKEN_TTL", "900"))
+ACCESS_TOKEN_SALT = "access-token"
+TOKEN_DENYLIST_MAX_SIZE = int(os.getenv("TOKEN_DENYLIST_MAX_SIZE", "100000"))
+
+serializer = URLSafeTimedSerializer(os.getenv("SECRET_KEY"), salt=ACCESS_TOKEN_SALT)
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class TokenDenylist:
+    """Revoked token ids and per-user minimum token versions, each kept only until
+    every token it could match has expired anyway."""
+
+    def __init__(self, ttl=ACCESS_TOKEN_TTL, max_size=TOKEN_DENYLIST_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._revoked = {}  # token id -> time after which the token has expired anyway
+        self._min_versions = {}  # user id -> (lowest accepted version, time the rule can be dropped)
+
+    def revoke(self, token_id, expires_at):
+        self._revoked[token_id] = expires_at
+        if len(self._revoked) > self.max_size:
+            self._prune()
+
+    def revoke_user(self, user_id, version):
+        """Reject this user's tokens issued with a version below ``version``."""
+        current = self._min_versions.get(user_id, (0, 0))[0]
+        self._min_versions[user_id] = (max(current, version), time() + self.ttl)
+        if len(self._min_versions) > self.max_size:
+            self._prune()
+
+    def is_revoked(self, claims):
+        if claims["jti"] in self._revoked:
+            return True
+        rule = self._min_versions.get(claims["sub"])
+        return rule is not None and claims["ver"] < rule[0]
+
+    def _prune(self):
+        now = time()
+        self._revoked = {token_id: expires_at for token_id, expires_at in self._revoked.items() if expires_at > now}
+        self._min_versions = {user_id: rule for user_id, rule in self._min_versions.items() if rule[1] > now}
+
+    def clear(self):
+        self._revoked.clear()
+        self._min_versions.clear()
+
+    def __len__(self):
+        return len(self._revoked) + len(self._min_versions)
+
+
+token_denylist = TokenDenylist()
+
+
+def issue_access_token(user):
+    """Sign a token for a UserSnapshot; returns (token, expires_in seconds)."""
+    # No profile fields: they would go stale on the next update. The email never changes
+    # and only routes the profile lookup for read-your-writes.
+    claims = {
+        "sub": user.id,
+        "ver": user.token_version,
+        "jti": secrets.token_urlsafe(12),
+        "email": user.email,
+    }
+    return serializer.dumps(claims), ACCESS_TOKEN_TTL
+
+
+def decode_access_token(token):
+    """Verify a token's signature and age; returns its claims or raises InvalidToken."""
+    try:
+        claims = serializer.loads(token, max_age=ACCESS_TOKEN_TTL)
+    except SignatureExpired:
+        statsd_client.incr("auth.token.expired")
+        raise InvalidToken("Token expired")
+    except BadSignature:
+        statsd_client.incr("auth.token.invalid")
+        raise InvalidToken("Invalid token")
+    if token_denylist.is_revoked(claims):
+        statsd_client.incr("auth.token.revoked")
+        raise InvalidToken("Token revoked")
+    statsd_client.incr("auth.token.accepted")
+    return claims
+
+
+def revoke_access_token(claims):
+    # The token is useless after issue time + TTL, so the entry can go then
+    token_denylist.revoke(claims["jti"], time() + ACCESS_TOKEN_TTL)
@@ -0,0 +1,235 @@
+# app/tracing.py
+# Lightweight per-request tracing and an on-demand sampling profiler.
+#
+# The request middleware opens a trace for a sample of requests. Spans are
+# recorded around database statements, bcrypt, S3/SNS calls, upload streaming
+# and response rendering. Each span is one perf_counter pair and a tuple
+# append, with nothing done when the request isn't sampled, so tracing stays
+# on in production. Finished traces go to a fixed-size ring buffer, which
+# exports as Chrome trace JSON (chrome://tracing, Perfetto).
+#
+# The profiler samples the event loop thread's stack from a background thread
+# and reports folded stacks (speedscope, flamegraph.pl). It runs only when
+# asked: through the admin endpoints, or SIGUSR2 to a worker, which toggles it
+# and writes the profile plus current traces to TRACE_DUMP_DIR when stopped.
+import json
+import logging
+import os
+import random
+import signal
+import sys
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter, time, sleep
+from uuid import uuid4
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "1000"))
+# Bounds memory for requests that run thousands of statements (bulk import)
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "256"))
+TRACE_DUMP_DIR = os.getenv("TRACE_DUMP_DIR", "/tmp")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+_current_trace = ContextVar("current_trace", default=None)
+
+
+class Trace:
+    __slots__ = ("trace_id", "name", "wall_start", "start", "end", "status", "spans", "dropped", "_token")
+
+    def __init__(self, name):
+        self.trace_id = uuid4().hex[:16]
+        self.name = name
+        self.wall_start = time()
+        self.start = perf_counter()
+        self.end = None
+        self.status = None
+        self.spans = []  # (name, category, start, end) in perf_counter seconds
+        self.dropped = 0
+        self._token = None
+
+    @property
+    def duration_ms(self):
+        return ((self.end or perf_counter()) - self.start) * 1000
+
+    def add(self, name, category, start, end):
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append((name, category, start, end))
+        else:
+            self.dropped += 1
+
+
+class TraceBuffer:
+    def __init__(self, enabled=TRACE_ENABLED, sample_rate=TRACE_SAMPLE_RATE, size=TRACE_BUFFER_SIZE):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self._traces = deque(maxlen=size)
+
+    def start(self, name):
+        """Open a trace for the current request if it is sampled; returns it or None."""
+        if not self.enabled or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return None
+        trace = Trace(name)
+        trace._token = _current_trace.set(trace)
+        return trace
+
+    def finish(self, trace, name=None, status=None):
+        trace.end = perf_counter()
+        _current_trace.reset(trace._token)
+        trace.status = status
+        if name is not None:
+            trace.name = name
+        self._traces.append(trace)
+
+    def traces(self, limit=None, min_duration_ms=0, name=None):
+        traces = [
+            trace for trace in list(self._traces)
+            if trace.duration_ms >= min_duration_ms and (name is None or name in trace.name)
+        ]
+        return traces[-limit:] if limit else traces
+
+    def clear(self):
+        self._traces.clear()
+
+    def __len__(self):
+        return len(self._traces)
+
+
+trace_buffer = TraceBuffer()
+
+
+@contextmanager
+def span(name, category):
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, category, start, perf_counter())
+
+
+def record_span(name, category, duration):
+    """Record a span that just ended after ``duration`` seconds (for callback-style hooks)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        end = perf_counter()
+        trace.add(name, category, end - duration, end)
+
+
+def chrome_trace(traces):
+    """Chrome trace event format: one row (tid) per request, spans nested by time."""
+    pid = os.getpid()
+    events = []
+    for tid, trace in enumerate(traces, 1):
+        def timestamp(moment):
+            return round((trace.wall_start + (moment - trace.start)) * 1e6, 1)
+
+        end = trace.end or perf_counter()
+        events.append({
+            "name": trace.name, "cat": "request", "ph": "X", "pid": pid, "tid": tid,
+            "ts": timestamp(trace.start), "dur": round((end - trace.start) * 1e6, 1),
+            "args": {"trace_id": trace.trace_id, "status": trace.status, "dropped_spans": trace.dropped},
+        })
+        for name, category, start, span_end in trace.spans:
+            events.append({
+                "name": name, "cat": category, "ph": "X", "pid": pid, "tid": tid,
+                "ts": timestamp(start), "dur": round((span_end - start) * 1e6, 1),
+            })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack at a fixed interval from a daemon thread."""
+
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS):
+        self.interval_ms = interval_ms
+        self.samples = Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval_ms=None, thread_id=None):
+        if self.running:
+            raise ProfilerBusy("A profile is already running")
+        # Defaults to the calling thread, i.e. the event loop
+        target = thread_id or threading.get_ident()
+        interval = (interval_ms or self.interval_ms) / 1000
+        self.samples = Counter()
+        self.started_at = time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, args=(target, interval), name="profiler", daemon=True)
+        self._thread.start()
+
+    def _sample(self, target, interval):
+        while not self._stop.is_set():
+            frame = sys._current_frames().get(target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+            sleep(interval)
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return self.samples
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+profiler = SamplingProfiler()
+
+
+def dump(directory=TRACE_DUMP_DIR):
+    """Write the current traces, and the last profile if there is one, to files; returns their paths."""
+    stamp = f"{os.getpid()}-{int(time())}"
+    paths = [os.path.join(directory, f"traces-{stamp}.json")]
+    with open(paths[0], "w") as f:
+        json.dump(chrome_trace(trace_buffer.traces()), f)
+    if profiler.samples:
+        paths.append(os.path.join(directory, f"profile-{stamp}.folded"))
+        with open(paths[1], "w") as f:
+            f.write(profiler.folded())
+    return paths
+
+
+def toggle_profiler():
+    if profiler.running:
+        profiler.stop()
+        logger.info(f"Profiler stopped; wrote {', '.join(dump())}")
+    else:
+        profiler.start()
+        logger.info("Profiler started; send SIGUSR2 again to stop and dump")
+
+
+def install_signal_handler(loop):
+    # Send to a worker, not the gunicorn master (which treats SIGUSR2 as a binary upgrade)
+    if hasattr(signal, "SIGUSR2"):
+        try:
+            loop.add_signal_handler(signal.SIGUSR2, toggle_profiler)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass
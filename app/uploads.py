@@ -0,0 +1,108 @@
+# app/uploads.py
+# Streams an UploadFile to S3 in fixed-size parts while hashing it, so peak
+# memory per upload is one part regardless of file size. Files smaller than
+# one part skip the multipart API and go up with a single put_object.
+import hashlib
+import logging
+import os
+from dotenv import load_dotenv
+from app.aws import aws_clients
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# S3 rejects parts smaller than 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+READ_CHUNK_SIZE = 256 * 1024
+
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv("IMAGE_UPLOAD_MAX_SIZE", str(20 * 1024 * 1024)))
+IMAGE_UPLOAD_PART_SIZE = max(MIN_PART_SIZE, int(os.getenv("IMAGE_UPLOAD_PART_SIZE", str(MIN_PART_SIZE))))
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class StreamingUpload:
+    """Two-phase upload: ``consume`` streams and hashes the file, then the
+    caller either ``complete``s it or ``abort``s it (e.g. on a duplicate hash)
+    before the object becomes visible in the bucket.
+    """
+
+    def __init__(self, bucket, key, max_size=IMAGE_UPLOAD_MAX_SIZE, part_size=IMAGE_UPLOAD_PART_SIZE,
+                 s3_client=None):
+        self.bucket = bucket
+        self.key = key
+        self.max_size = max_size
+        self.part_size = part_size
+        self.s3_client = s3_client or aws_clients.s3
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+        self.completed = False
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    async def consume(self, file):
+        while True:
+            chunk = await file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            self.size += len(chunk)
+            if self.size > self.max_size:
+                await self.abort()
+                raise UploadTooLarge(f"Upload exceeds the maximum size of {self.max_size} bytes")
+            self._digest.update(chunk)
+            self._buffer += chunk
+            if len(self._buffer) >= self.part_size:
+                await self._flush_part(self.part_size)
+
+    async def _flush_part(self, length):
+        if self._upload_id is None:
+            response = await self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+            self._upload_id = response["UploadId"]
+        body = bytes(self._buffer[:length])
+        del self._buffer[:length]
+        part_number = len(self._parts) + 1
+        response = await self.s3_client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=part_number, Body=body
+        )
+        self._parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    async def complete(self):
+        if self._upload_id is None:
+            await self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer))
+        else:
+            if self._buffer:
+                await self._flush_part(len(self._buffer))
+            await self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                MultipartUpload={"Parts": self._parts},
+            )
+        self._buffer = bytearray()
+        self.completed = True
+
+    async def abort(self):
+        if self._upload_id is not None:
+            await self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+            self._upload_id = None
+        self._buffer = bytearray()
+
+    async def discard(self):
+        """Undo whatever the upload has stored so far, for a request that failed part way.
+
+        Never raises: it runs while another error is already being handled.
+        """
+        try:
+            if self.completed:
+                await self.s3_client.delete_object(Bucket=self.bucket, Key=self.key)
+            else:
+                # An open multipart upload is billed until it is aborted
+                await self.abort()
+        except Exception as e:
+            logger.error(f"Failed to discard upload {self.key}: {e}")
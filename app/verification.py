@@ -0,0 +1,97 @@
+# app/verification.py
+# Email verification tokens and the outbox message that carries them, shared
+# by single signups and bulk imports.
+#
+# The signer and the token max age are set up once at import, and the HMAC key
+# is derived once per process, rather than on every link and every verification. Tokens that have already
+# verified an account are remembered until they expire, so a replayed link is
+# answered without touching the database.
+import json
+import os
+from collections import OrderedDict
+from time import time
+from dotenv import load_dotenv
+from itsdangerous import URLSafeTimedSerializer, TimestampSigner
+from itsdangerous.encoding import want_bytes
+
+load_dotenv()
+
+VERIFICATION_SALT = "email-verification-salt"
+VERIFICATION_SUBJECT = "Email Verification Required"
+TOKEN_MAX_AGE = int(os.getenv("TOKEN_MAX_AGE", "120"))
+CONSUMED_TOKEN_CACHE_SIZE = int(os.getenv("CONSUMED_TOKEN_CACHE_SIZE", "10000"))
+
+
+class PrecomputedKeySigner(TimestampSigner):
+    """TimestampSigner that derives each HMAC key once per process instead of on every sign and unsign.
+
+    Keys are cached by everything the derivation depends on, so signers that
+    ``serializer.loads`` builds per call, and the explicit key that
+    ``verify_signature`` passes for each rotated secret, hit the cache too.
+    """
+
+    _derived_keys = {}
+
+    def derive_key(self, secret_key=None):
+        secret_key = self.secret_keys[-1] if secret_key is None else want_bytes(secret_key)
+        cache_key = (secret_key, self.salt, self.key_derivation, self.digest_method)
+        derived_key = self._derived_keys.get(cache_key)
+        if derived_key is None:
+            derived_key = self._derived_keys[cache_key] = super().derive_key(secret_key)
+        return derived_key
+
+
+serializer = URLSafeTimedSerializer(os.getenv("SECRET_KEY"), salt=VERIFICATION_SALT, signer=PrecomputedKeySigner)
+signer = serializer.make_signer(VERIFICATION_SALT)
+
+
+def verification_token(email):
+    return signer.sign(serializer.dump_payload({"email": email})).decode("utf-8")
+
+
+def load_verification_token(token):
+    """Return the token's payload; raises itsdangerous' BadSignature (or SignatureExpired)."""
+    return serializer.load_payload(signer.unsign(token, max_age=TOKEN_MAX_AGE))
+
+
+def verification_link(email):
+    return f"http://{os.getenv('BASE_URL')}/v2/users/verify?user={email}&token={verification_token(email)}"
+
+
+def verification_message(email, link):
+    return json.dumps({"email": email, "verification_link": link})
+
+
+class ConsumedTokenCache:
+    """Tokens that already verified an account, kept until they would have expired anyway."""
+
+    def __init__(self, max_size=CONSUMED_TOKEN_CACHE_SIZE, max_age=TOKEN_MAX_AGE):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._tokens = OrderedDict()  # token -> (email, expires at)
+
+    def add(self, token, email):
+        self._tokens[token] = (email, time() + self.max_age)
+        self._tokens.move_to_end(token)
+        while len(self._tokens) > self.max_size:
+            self._tokens.popitem(last=False)
+
+    def consumed_by(self, token):
+        """The email the token verified, or None if it is unknown or expired."""
+        entry = self._tokens.get(token)
+        if entry is None:
+            return None
+        email, expires_at = entry
+        if expires_at <= time():
+            del self._tokens[token]
+            return None
+        return email
+
+    def clear(self):
+        self._tokens.clear()
+
+    def __len__(self):
+        return len(self._tokens)
+
+
+consumed_tokens = ConsumedTokenCache()
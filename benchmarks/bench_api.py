@@ -0,0 +1,244 @@
+# benchmarks/bench_api.py
+# Throughput and tail-latency benchmark for the /v2 API.
+#
+# Runs app.main:app in-process over an ASGI transport with the in-memory
+# S3/SNS backend. By default it uses a throwaway SQLite database (needs
+# `pip install aiosqlite`); pass --database-url to benchmark against Postgres.
+#
+#   python -m benchmarks.bench_api --concurrency 1,8,32 --requests 500 --output bench.json
+#   python -m benchmarks.bench_api --compare bench.json   # diff a new run against a saved one
+#
+# Signup with email logs written in the request vs by the batch writer:
+#
+#   EMAIL_LOG_MODE=inline python -m benchmarks.bench_api --endpoints create_user --output inline.json
+#   python -m benchmarks.bench_api --endpoints create_user --compare inline.json
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from time import perf_counter
+
+ENDPOINTS = ["healthz", "create_user", "get_user", "get_user_token", "upload_image"]
+
+
+def configure_environment(database_url):
+    # Must run before anything under app/ is imported
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["AWS_BACKEND"] = "stub"
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+    os.environ.setdefault("BASE_URL", "localhost:8000")
+    os.environ.setdefault("SNS_TOPIC_ARN", "arn:aws:sns:us-east-1:000000000000:benchmark")
+    os.environ.setdefault("BUCKET_NAME", "benchmark-bucket")
+    os.environ.setdefault("TOKEN_MAX_AGE", "120")
+    os.environ.setdefault("METRICS_FLUSH_INTERVAL", "0")
+    # Benchmarks hammer a handful of accounts from one address by design
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(endpoint, concurrency, latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if status >= 400)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+    }
+
+
+class Scenario:
+    """Builds one request per call; ``run_id`` keeps emails and uploads unique across runs."""
+
+    def __init__(self, run_id, user_id, email, password):
+        self.run_id = run_id
+        self.user_id = user_id
+        self.auth = (email, password)
+        self.token = None
+        self.counter = 0
+
+    def next_index(self):
+        self.counter += 1
+        return self.counter
+
+    async def healthz(self, client):
+        return await client.get("/v2/healthz")
+
+    async def create_user(self, client):
+        return await client.post("/v2/users/", json={
+            "email": f"bench-{self.run_id}-{self.next_index()}@example.com",
+            "password": "benchmark-password",
+            "first_name": "Bench",
+            "last_name": "User",
+        })
+
+    async def get_user(self, client):
+        return await client.get(f"/v2/users/{self.user_id}", auth=self.auth)
+
+    async def get_user_token(self, client):
+        if self.token is None:
+            response = await client.post("/v2/users/login", auth=self.auth)
+            self.token = response.json()["access_token"]
+        return await client.get(f"/v2/users/{self.user_id}", headers={"Authorization": f"Bearer {self.token}"})
+
+    async def upload_image(self, client):
+        content = f"{self.run_id}-{self.next_index()}".encode() * 64
+        files = {"file": ("bench.png", content, "image/png")}
+        return await client.post("/v2/users/image", files=files, auth=self.auth)
+
+
+async def seed_user(run_id):
+    from app.database import AsyncSessionLocal
+    from app.models.user import User
+    from app.passwords import hash_password
+
+    email = f"bench-{run_id}-principal@example.com"
+    password = "benchmark-password"
+    async with AsyncSessionLocal() as session:
+        user = User(email=email, hashed_password=await hash_password(password),
+                    first_name="Bench", last_name="Principal", is_verified=True)
+        session.add(user)
+        await session.commit()
+        return user.id, email, password
+
+
+async def run_endpoint(client, request, concurrency, total):
+    latencies = []
+    statuses = {}
+    remaining = [total]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = perf_counter()
+            response = await request(client)
+            latencies.append((perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, perf_counter() - start
+
+
+async def run_benchmark(args):
+    from httpx import AsyncClient
+    from app.database import Base, engine
+    from app.email_logs import email_log_writer
+    from app.main import app
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    run_id = uuid.uuid4().hex[:8]
+    scenario = Scenario(run_id, *await seed_user(run_id))
+    results = []
+    # The ASGI transport doesn't run startup/shutdown events, so start the background writer here
+    email_log_writer.start()
+
+    async with AsyncClient(app=app, base_url="http://benchmark") as client:
+        for concurrency in args.concurrency:
+            for endpoint in args.endpoints:
+                request = getattr(scenario, endpoint)
+                if args.warmup:
+                    await run_endpoint(client, request, concurrency, args.warmup)
+                latencies, statuses, elapsed = await run_endpoint(client, request, concurrency, args.requests)
+                result = summarize(endpoint, concurrency, latencies, statuses, elapsed)
+                results.append(result)
+                print(f"{endpoint:>14} c={concurrency:<4} {result['rps']:>9.1f} req/s  "
+                      f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms p99={result['p99_ms']:.2f}ms  "
+                      f"errors={result['errors']}")
+
+    await email_log_writer.stop()
+    await engine.dispose()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results):
+    previous = {(r["endpoint"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for result in results:
+        old = previous.get((result["endpoint"], result["concurrency"]))
+        if old is None:
+            continue
+        rps_change = (result["rps"] - old["rps"]) / old["rps"] * 100 if old["rps"] else 0.0
+        p99_change = (result["p99_ms"] - old["p99_ms"]) / old["p99_ms"] * 100 if old["p99_ms"] else 0.0
+        print(f"{result['endpoint']:>14} c={result['concurrency']:<4} rps {rps_change:+6.1f}%   p99 {p99_change:+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the /v2 API in-process.")
+    parser.add_argument("--concurrency", default="1,8,32",
+                        help="comma-separated concurrency levels (default: 1,8,32)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed requests before each measurement")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help=f"comma-separated subset of {','.join(ENDPOINTS)}")
+    parser.add_argument("--database-url", default=None,
+                        help="async SQLAlchemy URL; defaults to a temporary SQLite database")
+    parser.add_argument("--output", default=None, help="write results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="print the change against a previous JSON result")
+    args = parser.parse_args()
+
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+    args.endpoints = [endpoint.strip() for endpoint in args.endpoints.split(",")]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+    configure_environment(database_url)
+
+    results = asyncio.run(run_benchmark(args))
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": database_url.split(":", 1)[0],
+            "requests": args.requests,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# benchmarks/bench_serialization.py
+# CPU cost of building and rendering a response body, per request, for the
+# hot user and image endpoints. "model" is the previous path: build the
+# Pydantic response model, let FastAPI validate it against response_model and
+# encode it, then render with the stdlib encoder. "direct" is the current
+# path: a dict built from the row, rendered by FastJSONResponse.
+#
+#   python -m benchmarks.bench_serialization --iterations 20000
+import argparse
+import asyncio
+import json
+from datetime import datetime
+from time import process_time
+from types import SimpleNamespace
+from benchmarks.bench_api import configure_environment, git_commit
+
+
+def make_rows(count):
+    created = datetime(2024, 10, 1, 12, 30, 45, 123456)
+    user = SimpleNamespace(email="bench@example.com", first_name="Bench", last_name="User",
+                           account_created=created, account_updated=created)
+    images = [
+        SimpleNamespace(id=i, user_id=1, object_key=f"1/{i}-photo.png", bucket_name="benchmark-bucket",
+                        image_url=f"https://benchmark-bucket.s3.amazonaws.com/1/{i}-photo.png", upload_date=created)
+        for i in range(1, count + 1)
+    ]
+    return user, images
+
+
+def build_cases(page_size):
+    from fastapi.routing import serialize_response
+    from starlette.responses import JSONResponse
+    from app.main import app
+    from app.responses import FastJSONResponse
+    from app.routes.userRoutes import user_body, image_body
+    from app.schemas.userSchemas import UserResponse, ImageResponse, ImageListItem, ImageListResponse
+
+    fields = {(route.path, tuple(route.methods)): route.response_field for route in app.routes
+              if getattr(route, "response_field", None) is not None}
+    user_field = fields[("/v2/users/{user_id}", ("GET",))]
+    image_field = fields[("/v2/users/image/{image_id}", ("GET",))]
+    list_field = fields[("/v2/users/image", ("GET",))]
+    user, images = make_rows(page_size)
+    url = "https://benchmark-bucket.s3.amazonaws.com/signed"
+
+    def image_model(row, cls=ImageResponse, **extra):
+        return cls(file_name=row.object_key, id=str(row.id), url=row.image_url,
+                   upload_date=row.upload_date.strftime("%Y-%m-%d"), user_id=str(row.user_id), **extra)
+
+    async def model(field, content):
+        return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+    return {
+        "get_user": (
+            lambda: model(user_field, UserResponse(
+                email=user.email, first_name=user.first_name, last_name=user.last_name,
+                account_created=user.account_created, account_updated=user.account_updated)),
+            lambda: FastJSONResponse(user_body(user)).body,
+        ),
+        "get_image": (
+            lambda: model(image_field, image_model(images[0])),
+            lambda: FastJSONResponse(image_body(images[0])).body,
+        ),
+        f"list_images_{page_size}": (
+            lambda: model(list_field, ImageListResponse(
+                images=[image_model(row, ImageListItem, download_url=url) for row in images], next_cursor=None)),
+            lambda: FastJSONResponse({"images": [dict(image_body(row), download_url=url) for row in images],
+                                      "next_cursor": None}).body,
+        ),
+    }
+
+
+async def cpu_per_call(func, iterations, is_async):
+    start = process_time()
+    for _ in range(iterations):
+        if is_async:
+            await func()
+        else:
+            func()
+    return (process_time() - start) / iterations * 1e6
+
+
+async def run(iterations, page_size):
+    from app.responses import orjson
+
+    results = []
+    for name, (model, direct) in build_cases(page_size).items():
+        # Both paths must produce the same document
+        assert json.loads(await model()) == json.loads(direct()), name
+        runs = max(1, iterations // page_size) if name.startswith("list_images") else iterations
+        model_us = await cpu_per_call(model, runs, True)
+        direct_us = await cpu_per_call(direct, runs, False)
+        results.append({"endpoint": name, "model_us": round(model_us, 2), "direct_us": round(direct_us, 2),
+                        "saved_us": round(model_us - direct_us, 2), "speedup": round(model_us / direct_us, 2)})
+        print(f"{name:>16}  model {model_us:9.2f}us  direct {direct_us:9.2f}us  "
+              f"saved {model_us - direct_us:9.2f}us/request  ({model_us / direct_us:.1f}x)")
+    print(f"encoder: {'orjson' if orjson is not None else 'json (orjson not installed)'}, commit {git_commit()}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-request CPU spent building response bodies.")
+    parser.add_argument("--iterations", type=int, default=20000, help="calls per single-object endpoint")
+    parser.add_argument("--page-size", type=int, default=100, help="images per listing page")
+    parser.add_argument("--output", default=None, help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    configure_environment("sqlite+aiosqlite:///:memory:")
+    results = asyncio.run(run(args.iterations, args.page_size))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"commit": git_commit(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# benchmarks/bench_workers.py
+# Measures how throughput scales with the number of worker processes by
+# launching `python -m app.server` with WEB_WORKERS=1,2,4,... and driving it
+# over real HTTP from several client processes.
+#
+#   python -m benchmarks.bench_workers --workers 1,2,4 --endpoint get_user --duration 15 --output scaling.json
+#
+# Give the load generator its own cores (--client-processes), otherwise the
+# client and server compete for CPU and scaling looks worse than it is.
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from time import perf_counter
+from benchmarks.bench_api import configure_environment, git_commit, percentile, seed_user
+
+ENDPOINTS = {
+    "healthz": ("GET", "/v2/healthz", False),
+    "livez": ("GET", "/v2/livez", False),
+    "get_user": ("GET", "/v2/users/{user_id}", True),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def prepare_database():
+    from app.database import Base, engine
+    import app.models.user  # register the tables on Base.metadata
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    user = await seed_user(os.urandom(4).hex())
+    await engine.dispose()
+    return user
+
+
+def start_server(workers, port):
+    env = dict(os.environ, WEB_WORKERS=str(workers), WEB_PORT=str(port), WEB_HOST="127.0.0.1",
+               WEB_LOG_LEVEL="warning", SCHEMA_STARTUP_MODE="skip")
+    return subprocess.Popen([sys.executable, "-m", "app.server"], env=env)
+
+
+def wait_until_ready(port, timeout=60):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/v2/livez", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not become ready within {timeout}s")
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def generate_load(url, method, auth, concurrency, duration):
+    import httpx
+
+    latencies = []
+    errors = 0
+    deadline = perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal errors
+            while perf_counter() < deadline:
+                start = perf_counter()
+                try:
+                    response = await client.request(method, url, auth=auth)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((perf_counter() - start) * 1000)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(args):
+    return asyncio.run(generate_load(*args))
+
+
+def measure(port, endpoint, user, concurrency, duration, client_processes):
+    method, path, needs_auth = ENDPOINTS[endpoint]
+    user_id, email, password = user
+    url = f"http://127.0.0.1:{port}{path.format(user_id=user_id)}"
+    auth = (email, password) if needs_auth else None
+    per_process = max(1, concurrency // client_processes)
+
+    with multiprocessing.get_context("spawn").Pool(client_processes) as pool:
+        results = pool.map(client_process, [(url, method, auth, per_process, duration)] * client_processes)
+
+    latencies = sorted(latency for process_latencies, _ in results for latency in process_latencies)
+    errors = sum(process_errors for _, process_errors in results)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / duration, 2),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure throughput scaling across worker processes.")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts (default: 1,2,4)")
+    parser.add_argument("--endpoint", default="get_user", choices=sorted(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, default=64, help="total in-flight requests")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load per worker count")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of untimed load before measuring")
+    parser.add_argument("--client-processes", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--database-url", default=None,
+                        help="async SQLAlchemy URL; defaults to a temporary SQLite database")
+    parser.add_argument("--output", default=None, help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+    configure_environment(database_url)
+    user = asyncio.run(prepare_database())
+
+    results = []
+    baseline_rps = None
+    for workers in [int(count) for count in args.workers.split(",")]:
+        port = free_port()
+        server = start_server(workers, port)
+        try:
+            wait_until_ready(port)
+            if args.warmup:
+                measure(port, args.endpoint, user, args.concurrency, args.warmup, args.client_processes)
+            result = measure(port, args.endpoint, user, args.concurrency, args.duration, args.client_processes)
+        finally:
+            stop_server(server)
+
+        baseline_rps = baseline_rps or result["rps"]
+        result.update(workers=workers, speedup=round(result["rps"] / baseline_rps, 2) if baseline_rps else 0.0)
+        results.append(result)
+        print(f"workers={workers:<3} {result['rps']:>9.1f} req/s  x{result['speedup']:<5} "
+              f"p50={result['p50_ms']:.2f}ms p99={result['p99_ms']:.2f}ms errors={result['errors']}")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "cpu_count": os.cpu_count(),
+            "endpoint": args.endpoint,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "client_processes": args.client_processes,
+            "database": database_url.split(":", 1)[0],
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
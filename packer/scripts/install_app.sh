@@ -23,7 +23,8 @@ source venv/bin/activate
 # Update pip to its latest version
 pip install --upgrade pip
 
-# Install FastAPI, Uvicorn and other dependencies from requirements.txt
+# Install FastAPI, Uvicorn and other dependencies from requirements.txt, including the
+# pinned production server (gunicorn, uvloop, httptools) and orjson for response rendering
 pip install -r requirements.txt
 
 # Deactivate the virtual environment
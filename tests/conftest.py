@@ -1,9 +1,13 @@
+import os
+
+# Use the in-memory S3/SNS backend instead of real AWS
+os.environ.setdefault("AWS_BACKEND", "stub")
+
 import pytest
 import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.models.user import Base 
-import os
 
 TEST_DATABASE_URL=os.getenv("DATABASE_URL")
 
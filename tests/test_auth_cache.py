@@ -0,0 +1,46 @@
+from app.auth_cache import CredentialCache
+
+HASH = "$2b$12$current"
+
+def test_hit_requires_matching_password():
+    cache = CredentialCache(max_size=10, ttl=60)
+    cache.put("test@example.com", "secret", HASH)
+
+    assert cache.matches("test@example.com", "secret", HASH)
+    assert not cache.matches("test@example.com", "wrong", HASH)
+    assert not cache.matches("other@example.com", "secret", HASH)
+
+def test_entry_stops_matching_once_the_stored_hash_changes():
+    # Also covers a slow verify writing the old password back after a change: the new row's hash differs
+    cache = CredentialCache(max_size=10, ttl=60)
+    cache.put("test@example.com", "old-password", HASH)
+
+    assert not cache.matches("test@example.com", "old-password", "$2b$12$changed")
+
+def test_invalidate_removes_entry():
+    cache = CredentialCache(max_size=10, ttl=60)
+    cache.put("test@example.com", "secret", HASH)
+    cache.invalidate("test@example.com")
+
+    assert not cache.matches("test@example.com", "secret", HASH)
+
+def test_expired_entries_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.auth_cache.monotonic", lambda: now[0])
+    cache = CredentialCache(max_size=10, ttl=5)
+    cache.put("test@example.com", "secret", HASH)
+
+    now[0] += 6
+    assert not cache.matches("test@example.com", "secret", HASH)
+    assert len(cache) == 0
+
+def test_least_recently_used_entry_is_evicted():
+    cache = CredentialCache(max_size=2, ttl=60)
+    cache.put("a@example.com", "a", HASH)
+    cache.put("b@example.com", "b", HASH)
+    cache.matches("a@example.com", "a", HASH)
+    cache.put("c@example.com", "c", HASH)
+
+    assert not cache.matches("b@example.com", "b", HASH)
+    assert cache.matches("a@example.com", "a", HASH)
+    assert cache.matches("c@example.com", "c", HASH)
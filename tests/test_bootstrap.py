@@ -0,0 +1,42 @@
+import pytest
+from app.bootstrap import check_schema_version, stamp_schema_version, migrate, SchemaVersionError, SCHEMA_VERSION
+from app.migrations import MIGRATIONS
+
+@pytest.mark.asyncio
+async def test_schema_version_check(test_db):
+    async with test_db.begin() as conn:
+        await conn.exec_driver_sql("DELETE FROM schema_version")
+    with pytest.raises(SchemaVersionError):
+        await check_schema_version()
+
+    await stamp_schema_version()
+    assert await check_schema_version() == SCHEMA_VERSION
+
+@pytest.mark.asyncio
+async def test_migrate_applies_pending_migrations_once(test_db):
+    async with test_db.begin() as conn:
+        await conn.exec_driver_sql("DELETE FROM schema_version")
+        await conn.exec_driver_sql("INSERT INTO schema_version (version) VALUES (1)")
+
+    applied = await migrate()
+    assert [migration.version for migration in applied] == [migration.version for migration in MIGRATIONS[1:]]
+    assert await check_schema_version() == SCHEMA_VERSION == MIGRATIONS[-1].version
+
+    # Every migration is idempotent and already stamped, so a second run does nothing
+    assert await migrate() == []
+
+@pytest.mark.asyncio
+async def test_migrate_adds_image_hash_column_to_existing_tables(test_db):
+    async with test_db.begin() as conn:
+        await conn.exec_driver_sql("ALTER TABLE images DROP COLUMN sha256")
+        await conn.exec_driver_sql("DELETE FROM schema_version WHERE version >= 5")
+
+    await migrate()
+
+    async with test_db.connect() as conn:
+        columns = await conn.exec_driver_sql(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = 'images'"
+        )
+        assert "sha256" in columns.scalars().all()
+        indexes = await conn.exec_driver_sql("SELECT indexname FROM pg_indexes WHERE tablename = 'images'")
+        assert "uq_images_user_id_sha256" in indexes.scalars().all()
@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app.bulk_import import BulkUserImporter, iter_lines, parse_csv, parse_ndjson
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+async def collect(records):
+    return [record async for record in records]
+
+@pytest.mark.asyncio
+async def test_lines_split_across_chunks():
+    lines = await collect(iter_lines(chunks(b'{"a": 1}\r\n{"b"', b': 2}\n\n', b'{"c": 3}')))
+    assert lines == ['{"a": 1}', '{"b": 2}', "", '{"c": 3}']
+
+@pytest.mark.asyncio
+async def test_ndjson_reports_line_numbers_for_bad_records():
+    records = await collect(parse_ndjson(iter_lines(chunks(b'{"email": "a"}\n\n[1]\nnope\n'))))
+    assert records[0] == (1, {"email": "a"}, None)
+    assert records[1][0] == 3 and records[1][2] == "Expected a JSON object"
+    assert records[2][0] == 4 and records[2][2].startswith("Invalid JSON")
+
+@pytest.mark.asyncio
+async def test_csv_uses_header_row():
+    data = b'\xef\xbb\xbfemail,first_name\n"a@example.com","Smith, Jr"\nb@example.com\n'
+    records = await collect(parse_csv(iter_lines(chunks(data))))
+    assert records[0] == (2, {"email": "a@example.com", "first_name": "Smith, Jr"}, None)
+    assert records[1] == (3, None, "Expected 2 fields, got 1")
+
+@pytest.mark.asyncio
+async def test_csv_quoted_fields_may_span_lines():
+    data = (b'email,first_name\r\n"a@example.com","Line one\r\nline two"\r\n\r\n'
+            b'b@example.com,"Say ""hi""\nagain"\nc@example.com,"never closed\n')
+    # Split mid-field so the record also spans chunks
+    records = await collect(parse_csv(iter_lines(chunks(data[:40], data[40:]))))
+    assert records[0] == (2, {"email": "a@example.com", "first_name": "Line one\nline two"}, None)
+    assert records[1] == (5, {"email": "b@example.com", "first_name": 'Say "hi"\nagain'}, None)
+    assert records[2] == (7, None, "Invalid CSV: unexpected end of data")
+
+@pytest.mark.asyncio
+async def test_import_hashes_outside_any_transaction_and_fails_only_bad_rows(test_db):
+    checked_out = []
+
+    class Hasher:
+        async def hash(self, password):
+            # The lookup's connection is back in the pool while passwords are hashed
+            checked_out.append(test_db.pool.checkedout())
+            if password == "explode":
+                raise RuntimeError("hash pool shut down")
+            return "hashed-" + password
+
+    def record(i, password="secret"):
+        return i, {"email": f"bulk-hash-{i}@example.com", "password": password,
+                   "first_name": "Bulk", "last_name": "Hash"}, None
+
+    importer = BulkUserImporter(hasher=Hasher(), session_factory=sessionmaker(test_db, class_=AsyncSession))
+    async def records():
+        for item in (record(1), record(2, "explode"), record(3)):
+            yield item
+    results = [result async for batch in importer.run(records()) for result in batch]
+
+    assert checked_out == [0, 0, 0]
+    assert [result["status"] for result in results] == ["created", "failed", "created"]
+    assert results[1]["error"] == "Password hashing failed"
+
+    async with test_db.begin() as conn:
+        for table in ("email_outbox", "email_logs", "users"):
+            await conn.execute(text(f"DELETE FROM {table} WHERE email LIKE 'bulk-hash-%'"))
+        # The user route tests expect their user to get the first id
+        await conn.execute(text("SELECT setval('users_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM users"))
@@ -0,0 +1,125 @@
+import os
+import re
+import pytest
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from app.database import statement_fingerprint, ReplicaRouter, RoutingSession, route_reads_for
+from app.models.user import User, Image
+from app.email_logs import expired_email_logs
+from app.outbox import OutboxDispatcher, expired_outbox_messages
+from app.routes.userRoutes import credentials_query, image_page_query, duplicate_image_query, IMAGE_RESPONSE_COLUMNS
+
+SEED_USER_ID = 100001
+
+def test_statement_fingerprint_names_table_and_filter_columns():
+    assert statement_fingerprint(
+        "SELECT users.id, users.email \nFROM users \nWHERE users.email = $1::VARCHAR"
+    ) == "select_users_by_email"
+    assert statement_fingerprint(
+        "SELECT images.id FROM images WHERE images.user_id = $1::INTEGER AND images.sha256 = $2::VARCHAR"
+    ) == "select_images_by_user_id_sha256"
+    assert statement_fingerprint(
+        "INSERT INTO email_logs (email, verification_link, sent_at) VALUES ($1, $2, NOW())"
+    ) == "insert_email_logs"
+    assert statement_fingerprint("SELECT 1") == "select"
+
+def test_replica_router_round_robin_and_fallback(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.database.monotonic", lambda: now[0])
+    router = ReplicaRouter("primary", ["r0", "r1"], window=5, retry_after=30, max_lag=10)
+
+    assert [router.pick() for _ in range(3)] == ["r0", "r1", "r0"]
+
+    router.mark_down(1)
+    router.mark_up(0, lag=60)  # too far behind
+    assert router.pick() == "primary"
+
+    now[0] += 31
+    assert router.pick() == "r1"
+
+def test_read_your_writes_window(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.database.monotonic", lambda: now[0])
+    router = ReplicaRouter("primary", ["r0"], window=5, max_lag=5)
+    router.mark_write("test@example.com")
+
+    assert router.wrote_recently("test@example.com")
+    assert not router.wrote_recently("other@example.com")
+    now[0] += 6
+    assert not router.wrote_recently("test@example.com")
+
+def test_read_your_writes_window_covers_max_lag():
+    # Otherwise a replica within max_lag could serve the pre-write row after the window closes
+    assert ReplicaRouter("primary", ["r0"], window=5, max_lag=10).window == 10
+    assert ReplicaRouter("primary", ["r0"], window=30, max_lag=10).window == 30
+
+@pytest.mark.asyncio
+async def test_routing_session_sends_reads_to_replica_and_writes_to_primary(test_db, monkeypatch):
+    replica = create_async_engine(os.getenv("DATABASE_URL"))
+    router = ReplicaRouter(test_db, [replica])
+    monkeypatch.setattr("app.database.replica_router", router)
+
+    async with AsyncSession(sync_session_class=RoutingSession) as session:
+        await session.execute(select(User.id).limit(1))
+        assert session.info["read_bind"] is replica.sync_engine
+        assert session.get_bind(clause=update(User).values(first_name="x")) is test_db.sync_engine
+
+    router.mark_write("test@example.com")
+    async with AsyncSession(sync_session_class=RoutingSession) as session:
+        route_reads_for(session, "test@example.com")
+        await session.execute(select(User.id).limit(1))
+        assert session.info["read_bind"] is test_db.sync_engine
+    await replica.dispose()
+
+# The statements userRoutes, the outbox dispatcher and email log retention run,
+# built by the same code, with the index each one must be served from
+HOT_QUERIES = {
+    "user_by_email": (credentials_query("seed1@example.com"), "ix_users_email"),
+    "image_page": (image_page_query(SEED_USER_ID, 10, 100), "ix_images_user_id_id"),
+    "image_duplicate": (duplicate_image_query(SEED_USER_ID, "0" * 64), "uq_images_user_id_sha256"),
+    # id carries both the primary key and an index=True index; either one is a single-row lookup
+    "image_by_id": (select(*IMAGE_RESPONSE_COLUMNS).where(Image.id == 1), ("images_pkey", "ix_images_id")),
+    "expired_email_logs": (expired_email_logs(30, 5000), "ix_email_logs_sent_at"),
+    "outbox_due": (OutboxDispatcher().due_messages(), "ix_email_outbox_pending"),
+    "expired_outbox_messages": (expired_outbox_messages(7, 5000), "ix_email_outbox_sent_at"),
+}
+
+# Plans only mean something with statistics: a spread of rows like production's, analyzed and
+# then rolled back. Seed ids sit far above anything the other tests create.
+SEED_DATA = [
+    "INSERT INTO users (id, email, hashed_password, first_name, last_name) "
+    "SELECT n, 'seed' || (n - 100000) || '@example.com', 'x', 'Seed', 'User' FROM generate_series(100001, 102000) n",
+    "INSERT INTO images (user_id, image_url, bucket_name, object_key, sha256) "
+    # SEED_USER_ID has a deep library, so a page means walking (user_id, id) rather than sorting
+    "SELECT CASE WHEN n % 100 = 0 THEN 100001 ELSE 100002 + n % 1999 END, "
+    "'https://seed', 'seed', 'seed/' || n, md5(n::text) || md5((-n)::text) "
+    "FROM generate_series(1, 40000) n",
+    "INSERT INTO email_logs (email, verification_link, sent_at) "
+    "SELECT 'seed' || n % 2000 || '@example.com', 'https://seed', now() - n * interval '70 seconds' "
+    "FROM generate_series(1, 40000) n",
+    # Nearly every message has gone out; only the pending tail is left to scan
+    "INSERT INTO email_outbox (email, subject, message, created_at, next_attempt_at, attempts, sent_at) "
+    "SELECT 'seed@example.com', 's', 'm', now(), now(), 0, "
+    "CASE WHEN n % 100 = 0 THEN NULL ELSE now() - n * interval '16 seconds' END "
+    "FROM generate_series(1, 40000) n",
+    "ANALYZE users, images, email_logs, email_outbox",
+]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+async def test_hot_queries_use_their_index(test_db, name):
+    statement, indexes = HOT_QUERIES[name]
+    sql = str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    async with test_db.connect() as conn:
+        transaction = await conn.begin()
+        for seed in SEED_DATA:
+            await conn.exec_driver_sql(seed)
+        # With sequential scans priced out, the planner still picks one only if no index applies
+        await conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        plan = "\n".join((await conn.exec_driver_sql(f"EXPLAIN {sql}")).scalars().all())
+        await transaction.rollback()
+    indexes = indexes if isinstance(indexes, tuple) else (indexes,)
+    # "Index Scan using ix on t", "Index Only Scan using ix on t" or "Bitmap Index Scan on ix"
+    assert any(re.search(rf"Index (Only )?Scan (using|on) {index}\b", plan) for index in indexes), plan
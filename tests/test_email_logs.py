@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import func, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+from app.email_logs import RETENTION_LOCK_ID, EmailLogWriter, prune_email_logs
+from app.models.user import Email_logs
+
+def session_factory(engine):
+    return sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+async def count_logs(engine, email_like):
+    async with engine.connect() as conn:
+        result = await conn.execute(select(func.count()).where(Email_logs.email.like(email_like)))
+        return result.scalar()
+
+@pytest.mark.asyncio
+async def test_writer_flushes_in_batches_and_on_stop(test_db):
+    writer = EmailLogWriter(batch_size=3, session_factory=session_factory(test_db))
+    for i in range(7):
+        writer.log(f"batch-{i}@example.com", f"http://localhost/verify?user=batch-{i}")
+
+    assert await writer.flush() == 3
+    assert len(writer) == 4
+    await writer.stop()
+    assert len(writer) == 0
+    assert await count_logs(test_db, "batch-%") == 7
+
+@pytest.mark.asyncio
+async def test_sent_at_is_the_time_the_row_was_logged(test_db):
+    writer = EmailLogWriter(batch_size=10, session_factory=session_factory(test_db))
+    writer.log("late-flush@example.com", "link")
+    # As if the row had waited in the buffer for an hour before this flush
+    writer._buffer[0]["logged_at"] -= 3600
+
+    assert await writer.flush() == 1
+    async with test_db.connect() as conn:
+        age = await conn.execute(
+            select(func.extract("epoch", func.now() - Email_logs.sent_at))
+            .where(Email_logs.email == "late-flush@example.com")
+        )
+        assert 3590 < age.scalar() < 3610
+
+    async with test_db.begin() as conn:
+        await conn.execute(text("DELETE FROM email_logs WHERE email = 'late-flush@example.com'"))
+
+@pytest.mark.asyncio
+async def test_writer_keeps_rows_when_the_insert_fails():
+    class FailingSession:
+        async def __aenter__(self):
+            raise OperationalError("INSERT", {}, Exception("connection refused"))
+
+        async def __aexit__(self, *exc_info):
+            return False
+
+    writer = EmailLogWriter(batch_size=10, max_buffer=3, session_factory=FailingSession)
+    for i in range(5):
+        writer.log(f"failed-{i}@example.com", "link")
+    # Only the newest rows fit in the buffer
+    assert [row["email"] for row in writer._buffer] == [f"failed-{i}@example.com" for i in range(2, 5)]
+
+    assert await writer.flush() == 0
+    assert len(writer) == 3
+
+@pytest.mark.asyncio
+async def test_prune_deletes_only_expired_rows(test_db):
+    async with test_db.begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO email_logs (email, verification_link, sent_at) VALUES "
+            "('prune-old@example.com', 'link', NOW() - INTERVAL '40 days'), "
+            "('prune-old@example.com', 'link', NOW() - INTERVAL '31 days'), "
+            "('prune-new@example.com', 'link', NOW() - INTERVAL '1 day')"
+        ))
+
+    assert await prune_email_logs(retention_days=30, batch_size=1, bind=test_db) == 2
+    assert await count_logs(test_db, "prune-old%") == 0
+    assert await count_logs(test_db, "prune-new%") == 1
+
+@pytest.mark.asyncio
+async def test_prune_is_skipped_while_another_worker_holds_the_lock(test_db):
+    async with test_db.begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO email_logs (email, verification_link, sent_at) "
+            "VALUES ('locked-old@example.com', 'link', NOW() - INTERVAL '40 days')"
+        ))
+
+    async with test_db.connect() as other_worker:
+        await other_worker.execute(text("SELECT pg_advisory_lock(:id)"), {"id": RETENTION_LOCK_ID})
+        try:
+            assert await prune_email_logs(retention_days=30, bind=test_db) == 0
+            assert await count_logs(test_db, "locked-old%") == 1
+        finally:
+            await other_worker.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": RETENTION_LOCK_ID})
+
+    assert await prune_email_logs(retention_days=30, bind=test_db) == 1
+    assert await count_logs(test_db, "locked-old%") == 0
@@ -0,0 +1,54 @@
+import pytest
+from httpx import AsyncClient
+from app.main import app
+from app.health import HealthProber
+
+@pytest.mark.asyncio
+async def test_results_are_cached_between_calls():
+    calls = []
+
+    async def check_database():
+        calls.append("database")
+
+    prober = HealthProber(checks={"database": check_database}, interval=60)
+    assert await prober.is_ready()
+    assert await prober.is_ready()
+    assert calls == ["database"]
+
+@pytest.mark.asyncio
+async def test_only_required_dependencies_affect_readiness():
+    async def ok():
+        pass
+
+    async def broken():
+        raise ConnectionError("unreachable")
+
+    prober = HealthProber(checks={"database": ok, "sns": broken}, required=["database"])
+    assert await prober.is_ready()
+    assert prober.results["sns"] == {"healthy": False, "latency_ms": prober.results["sns"]["latency_ms"],
+                                     "error": "unreachable"}
+
+    prober = HealthProber(checks={"database": broken}, required=["database"])
+    assert not await prober.is_ready()
+
+@pytest.mark.asyncio
+async def test_liveness_and_readiness_endpoints():
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        assert (await client.get("/v2/livez")).status_code == 200
+        readiness = await client.get("/v2/readyz")
+        assert readiness.status_code == 200
+        assert readiness.json()["dependencies"]["database"] == "up"
+
+@pytest.mark.asyncio
+async def test_readiness_does_not_expose_check_errors(monkeypatch):
+    async def broken():
+        raise ConnectionError("could not connect to db.internal:5432 as webapp")
+
+    prober = HealthProber(checks={"database": broken}, required=["database"])
+    monkeypatch.setattr("app.routes.healthRoutes.health_prober", prober)
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        readiness = await client.get("/v2/readyz")
+
+    assert readiness.status_code == 503
+    assert readiness.json() == {"status": "unavailable", "dependencies": {"database": "down"}}
+    assert "db.internal" in prober.results["database"]["error"]
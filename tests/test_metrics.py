@@ -0,0 +1,59 @@
+import pytest
+from httpx import AsyncClient
+from app.main import app
+from app.metrics import AggregatingStatsClient, statsd_client
+
+def test_counters_and_timers_are_aggregated():
+    client = AggregatingStatsClient(prefix="test", flush_interval=0, max_timer_samples=2)
+    client.incr("requests")
+    client.incr("requests", 2)
+    client.gauge("pool", 3)
+    for value in (1, 2, 3, 4):
+        client.timing("latency", value)
+
+    lines = client._drain()
+    assert "test.requests:3|c" in lines
+    assert "test.pool:3|g" in lines
+    timer_lines = [line for line in lines if line.startswith("test.latency:")]
+    assert len(timer_lines) == 2
+    assert all(line.endswith("|ms|@0.5") for line in timer_lines)
+    assert client._drain() == []
+
+def test_large_and_fractional_values_are_not_written_in_exponent_form():
+    client = AggregatingStatsClient(prefix="", flush_interval=0)
+    client.incr("bytes", 1234567)
+    client.incr("sampled", 3, rate=0.1)
+    client.gauge("pool.usage", 0.125)
+    client.gauge("queue.depth", 12345678)
+
+    lines = client._drain()
+    assert "bytes:1234567|c" in lines
+    assert "sampled:30|c" in lines
+    assert "pool.usage:0.125|g" in lines
+    assert "queue.depth:12345678|g" in lines
+
+def test_packets_stay_under_udp_limit():
+    client = AggregatingStatsClient(flush_interval=0)
+    lines = [f"fastapi_app.metric_{i}:1|c" for i in range(100)]
+    packets = list(client._packets(lines))
+    assert len(packets) > 1
+    assert all(len(packet) <= 512 for packet in packets)
+    assert sum(packet.count("\n") + 1 for packet in packets) == 100
+
+def test_key_limit_bounds_memory():
+    client = AggregatingStatsClient(prefix="", flush_interval=0, max_keys=2)
+    for i in range(5):
+        client.incr(f"metric_{i}")
+    lines = client._drain()
+    assert "metrics.dropped_keys:3|c" in lines
+    assert len(lines) == 3
+
+@pytest.mark.asyncio
+async def test_request_metrics_use_route_template():
+    statsd_client._drain()
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        await client.get("/v2/users/12345")
+
+    lines = statsd_client._drain()
+    assert any(line.startswith("fastapi_app./v2/users/{user_id}.count:1|c") for line in lines)
+    assert not any("12345" in line for line in lines)
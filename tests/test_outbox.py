@@ -0,0 +1,92 @@
+import pytest
+from sqlalchemy import func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+from app.models.user import EmailOutbox
+from app.outbox import OutboxDispatcher, prune_outbox
+
+def session_factory(engine):
+    return sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+async def count_messages(engine, email_like):
+    async with engine.connect() as conn:
+        result = await conn.execute(select(func.count()).where(EmailOutbox.email.like(email_like)))
+        return result.scalar()
+
+@pytest.mark.asyncio
+async def test_prune_deletes_only_old_sent_messages(test_db, monkeypatch):
+    gauges = {}
+    monkeypatch.setattr("app.outbox.statsd_client.gauge", lambda stat, value: gauges.update({stat: value}))
+    async with test_db.begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO email_outbox (email, subject, message, created_at, next_attempt_at, attempts, sent_at) VALUES "
+            "('prune-old@example.com', 's', 'm', NOW(), NOW(), 0, NOW() - INTERVAL '10 days'), "
+            "('prune-old@example.com', 's', 'm', NOW(), NOW(), 0, NOW() - INTERVAL '8 days'), "
+            "('prune-new@example.com', 's', 'm', NOW(), NOW(), 0, NOW() - INTERVAL '1 day'), "
+            "('prune-dead@example.com', 's', 'm', NOW(), NOW(), 3, NULL)"
+        ))
+
+    pruned = await prune_outbox(retention_days=7, batch_size=1, max_attempts=3, bind=test_db)
+    assert pruned == 2
+    assert await count_messages(test_db, "prune-old%") == 0
+    assert await count_messages(test_db, "prune-new%") == 1
+    # Dead-lettered messages are kept for inspection and reported
+    assert await count_messages(test_db, "prune-dead%") == 1
+    assert gauges["outbox.dead"] == 1
+
+    async with test_db.begin() as conn:
+        await conn.execute(text("DELETE FROM email_outbox WHERE email LIKE 'prune-%'"))
+
+@pytest.mark.asyncio
+async def test_message_is_dead_lettered_after_its_last_attempt(test_db, monkeypatch):
+    counters = {}
+    monkeypatch.setattr("app.outbox.statsd_client.incr",
+                        lambda stat, count=1: counters.update({stat: counters.get(stat, 0) + count}))
+    async with test_db.begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO email_outbox (email, subject, message, created_at, next_attempt_at, attempts) "
+            "VALUES ('dead@example.com', 's', 'm', NOW(), NOW(), 1)"
+        ))
+
+    dispatcher = OutboxDispatcher(max_attempts=2)
+    async def publish_fails(chunk):
+        return {message.id: "endpoint disabled" for message, _ in chunk}
+    monkeypatch.setattr(dispatcher, "_publish", publish_fails)
+
+    assert await dispatcher.drain_once() == 1
+    assert counters["outbox.dead_lettered"] == 1
+    # Given up on, so the next pass leaves it alone
+    assert await dispatcher.drain_once() == 0
+
+    async with test_db.begin() as conn:
+        await conn.execute(text("DELETE FROM email_outbox WHERE email = 'dead@example.com'"))
+
+@pytest.mark.asyncio
+async def test_batch_is_claimed_before_publishing_outside_any_transaction(test_db, monkeypatch):
+    from app.database import engine
+    async with test_db.begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO email_outbox (email, subject, message, created_at, next_attempt_at, attempts) "
+            "VALUES ('claimed@example.com', 's', 'm', NOW(), NOW(), 0)"
+        ))
+
+    dispatcher = OutboxDispatcher()
+    during_publish = {}
+    async def publish(chunk):
+        during_publish["connections"] = engine.pool.checkedout()
+        # Another worker polling meanwhile finds the row already claimed
+        during_publish["others"] = await OutboxDispatcher().drain_once()
+        return {}
+    monkeypatch.setattr(dispatcher, "_publish", publish)
+
+    assert await dispatcher.drain_once() == 1
+    assert during_publish == {"connections": 0, "others": 0}
+    async with test_db.connect() as conn:
+        sent_at = (await conn.execute(text(
+            "SELECT sent_at FROM email_outbox WHERE email = 'claimed@example.com'"
+        ))).scalar()
+    assert sent_at is not None
+
+    async with test_db.begin() as conn:
+        await conn.execute(text("DELETE FROM email_outbox WHERE email = 'claimed@example.com'"))
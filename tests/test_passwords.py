@@ -0,0 +1,14 @@
+import pytest
+from app.passwords import PasswordHasher
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("executor_kind", ["thread", "process"])
+async def test_hash_and_verify_off_loop(executor_kind):
+    hasher = PasswordHasher(executor_kind=executor_kind, max_workers=2, max_concurrent_hashes=1)
+    try:
+        hashed = await hasher.hash("testpassword")
+        assert await hasher.verify("testpassword", hashed)
+        assert not await hasher.verify("wrongpassword", hashed)
+        assert hasher.queue_depth == 0
+    finally:
+        hasher.shutdown()
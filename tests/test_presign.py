@@ -0,0 +1,68 @@
+import pytest
+from app.presign import PresignedUrlCache
+
+@pytest.mark.asyncio
+async def test_url_is_reused_until_refresh_margin(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.presign.time", lambda: now[0])
+    cache = PresignedUrlCache(expiry=600, refresh_margin=60, max_size=10)
+
+    url = await cache.get("bucket", "1/a.png")
+    assert "1/a.png" in url
+    now[0] += 500
+    assert await cache.get("bucket", "1/a.png") == url
+
+    # Within the margin a fresh URL is signed rather than one about to expire
+    now[0] += 50
+    assert await cache.get("bucket", "1/a.png") != url
+
+@pytest.mark.asyncio
+async def test_least_recently_used_entry_is_evicted():
+    cache = PresignedUrlCache(expiry=600, refresh_margin=60, max_size=2)
+    first = await cache.get("bucket", "a")
+    await cache.get("bucket", "b")
+    await cache.get("bucket", "a")
+    await cache.get("bucket", "c")
+
+    assert len(cache) == 2
+    assert await cache.get("bucket", "a") == first
+
+@pytest.mark.asyncio
+async def test_misses_are_signed_off_the_event_loop_in_one_hop(monkeypatch):
+    import threading
+    cache = PresignedUrlCache(expiry=600, refresh_margin=60, max_size=10)
+    cached = await cache.get("bucket", "a")
+
+    signed_on = []
+    sign_all = cache._sign_all
+    def record_thread(client, objects):
+        signed_on.append((threading.current_thread().name, objects))
+        return sign_all(client, objects)
+    monkeypatch.setattr(cache, "_sign_all", record_thread)
+
+    urls = await cache.get_many([("bucket", "b"), ("bucket", "a"), ("bucket", "c"), ("bucket", "b")])
+    assert urls[1] == cached and urls[0] == urls[3]
+    assert [objects for _, objects in signed_on] == [[("bucket", "b"), ("bucket", "c")]]
+    assert signed_on[0][0].startswith("aws")
+
+@pytest.mark.asyncio
+async def test_cached_urls_do_not_outlive_the_signing_credentials(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.presign.time", lambda: now[0])
+    credentials_expiry = [1200.0]
+    monkeypatch.setattr("app.presign.aws_clients.credentials_expiry", lambda: credentials_expiry[0])
+    cache = PresignedUrlCache(expiry=3600, refresh_margin=60, max_size=10)
+
+    url = await cache.get("bucket", "1/a.png")
+    now[0] += 130
+    assert await cache.get("bucket", "1/a.png") == url
+    # Within the margin of the credentials' expiry the URL is signed again
+    now[0] += 20
+    credentials_expiry[0] = 5000.0
+    assert await cache.get("bucket", "1/a.png") != url
+
+    # Credentials already inside the margin: the URL is not cached at all
+    credentials_expiry[0] = now[0] + 30
+    cache.clear()
+    await cache.get("bucket", "1/b.png")
+    assert len(cache) == 0
@@ -0,0 +1,120 @@
+import base64
+import pytest
+from fastapi import FastAPI, HTTPException
+from httpx import AsyncClient, ASGITransport
+from app.ratelimit import Limit, MemoryBackend, RateLimitMiddleware
+
+def test_bucket_refills_at_the_configured_rate():
+    backend = MemoryBackend(max_keys=10)
+    limit = Limit(burst=2, period=10)
+
+    assert backend.take_now("k", limit, now=0) == 0
+    assert backend.take_now("k", limit, now=0) == 0
+    assert backend.take_now("k", limit, now=0) == pytest.approx(5)
+    # Half a period later one token is back
+    assert backend.take_now("k", limit, now=5) == 0
+    assert backend.take_now("k", limit, now=5) > 0
+
+def test_least_recently_used_keys_are_evicted():
+    backend = MemoryBackend(max_keys=2)
+    limit = Limit(burst=1, period=60)
+    for key in ("a", "b", "a", "c"):
+        backend.take_now(key, limit, now=0)
+
+    assert len(backend) == 2
+    assert backend.take_now("a", limit, now=0) > 0
+    # "b" was evicted, so it starts again from a full bucket
+    assert backend.take_now("b", limit, now=0) == 0
+
+def basic(username, password):
+    return {"Authorization": "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode()}
+
+@pytest.fixture
+def limited_app():
+    app = FastAPI()
+    verifications = []
+
+    @app.post("/signup")
+    async def signup():
+        return {}
+
+    @app.get("/me")
+    async def me(password: str = "right"):
+        verifications.append(password)
+        if password != "right":
+            raise HTTPException(status_code=401)
+        return {}
+
+    rules = {
+        "POST /signup": {"ip": Limit(2, 60)},
+        "auth_failures": {"user": Limit(2, 60)},
+    }
+    app.add_middleware(RateLimitMiddleware, rules=rules, backend=MemoryBackend(), enabled=True)
+    app.state.verifications = verifications
+    return app
+
+@pytest.mark.asyncio
+async def test_route_limit_returns_429_with_retry_after(limited_app):
+    async with AsyncClient(app=limited_app, base_url="http://test") as client:
+        statuses = [(await client.post("/signup")).status_code for _ in range(3)]
+        assert statuses == [200, 200, 429]
+        throttled = await client.post("/signup")
+        assert int(throttled.headers["Retry-After"]) >= 1
+
+@pytest.mark.asyncio
+async def test_failed_logins_lock_the_username_before_verification(limited_app):
+    async with AsyncClient(app=limited_app, base_url="http://test") as client:
+        for _ in range(2):
+            response = await client.get("/me", params={"password": "wrong"}, headers=basic("victim", "x"))
+            assert response.status_code == 401
+        locked = await client.get("/me", params={"password": "wrong"}, headers=basic("victim", "x"))
+        assert locked.status_code == 429
+        assert len(limited_app.state.verifications) == 2
+
+        # Successful requests and other accounts are unaffected
+        assert (await client.get("/me", headers=basic("someone", "x"))).status_code == 200
+
+@pytest.mark.asyncio
+async def test_parallel_attempts_cannot_outrun_the_failure_limit():
+    import asyncio
+    app = FastAPI()
+    release = asyncio.Event()
+    verifications = []
+
+    @app.get("/me")
+    async def me():
+        verifications.append(1)
+        # Every attempt is still being verified when the next one arrives
+        await release.wait()
+        raise HTTPException(status_code=401)
+
+    app.add_middleware(RateLimitMiddleware, rules={"auth_failures": {"user": Limit(2, 60)}},
+                       backend=MemoryBackend(), enabled=True)
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        attempts = [asyncio.ensure_future(client.get("/me", headers=basic("victim", "x"))) for _ in range(5)]
+        while len(verifications) < 2 or sum(attempt.done() for attempt in attempts) < 3:
+            await asyncio.sleep(0.01)
+        release.set()
+        statuses = sorted(attempt.status_code for attempt in await asyncio.gather(*attempts))
+
+    assert statuses == [401, 401, 429, 429, 429]
+    assert len(verifications) == 2
+
+@pytest.mark.asyncio
+async def test_successful_logins_give_their_reservation_back(limited_app):
+    async with AsyncClient(app=limited_app, base_url="http://test") as client:
+        for _ in range(5):
+            assert (await client.get("/me", headers=basic("victim", "x"))).status_code == 200
+        for _ in range(2):
+            response = await client.get("/me", params={"password": "wrong"}, headers=basic("victim", "x"))
+            assert response.status_code == 401
+
+@pytest.mark.asyncio
+async def test_failures_from_one_address_do_not_lock_the_account_elsewhere(limited_app):
+    attacker = AsyncClient(transport=ASGITransport(limited_app, client=("203.0.113.7", 4000)), base_url="http://test")
+    owner = AsyncClient(transport=ASGITransport(limited_app, client=("198.51.100.2", 4000)), base_url="http://test")
+    async with attacker, owner:
+        for _ in range(3):
+            await attacker.get("/me", params={"password": "wrong"}, headers=basic("victim", "x"))
+        assert (await attacker.get("/me", headers=basic("victim", "x"))).status_code == 429
+        assert (await owner.get("/me", headers=basic("victim", "x"))).status_code == 200
@@ -0,0 +1,63 @@
+import json
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+import app.responses
+from app.responses import FastJSONResponse
+from app.routes.userRoutes import user_body, image_body
+from app.schemas.userSchemas import UserResponse, ImageResponse
+
+USER = SimpleNamespace(email="a@example.com", first_name="Ä", last_name="User",
+                       account_created=datetime(2024, 1, 2, 3, 4, 5, 678901), account_updated=None)
+IMAGE = SimpleNamespace(id=12, user_id=3, object_key="3/photo.png", image_url="https://bucket/3/photo.png",
+                        upload_date=datetime(2024, 1, 2, 23, 59, 59))
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr("app.responses.orjson", None)
+    else:
+        # Pinned in requirements.txt; the orjson case must not quietly fall back to json
+        assert app.responses.orjson is not None
+    return request.param
+
+def test_bodies_render_like_the_response_models(encoder):
+    expected_user = UserResponse(**vars(USER)).model_dump_json()
+    assert json.loads(FastJSONResponse(user_body(USER)).body) == json.loads(expected_user)
+
+    expected_image = ImageResponse(file_name=IMAGE.object_key, id=str(IMAGE.id), url=IMAGE.image_url,
+                                   upload_date=IMAGE.upload_date.strftime("%Y-%m-%d"), user_id=str(IMAGE.user_id))
+    assert json.loads(FastJSONResponse(image_body(IMAGE)).body) == json.loads(expected_image.model_dump_json())
+
+def test_non_ascii_is_written_as_utf8(encoder):
+    assert "Ä".encode("utf-8") in FastJSONResponse(user_body(USER)).body
+
+@pytest.mark.asyncio
+async def test_routes_render_through_orjson(monkeypatch):
+    calls = []
+    dumps = app.responses.orjson.dumps
+
+    def counting_dumps(*args, **kwargs):
+        calls.append(args)
+        return dumps(*args, **kwargs)
+    monkeypatch.setattr("app.responses.orjson.dumps", counting_dumps)
+    api = FastAPI(default_response_class=FastJSONResponse)
+
+    @api.get("/user")
+    async def get_user():
+        return FastJSONResponse(user_body(USER))
+
+    @api.get("/default")
+    async def get_default():
+        return {"when": datetime(2024, 1, 2)}
+
+    async with AsyncClient(app=api, base_url="http://test") as client:
+        user = await client.get("/user")
+        default = await client.get("/default")
+
+    assert user.json()["account_created"] == "2024-01-02T03:04:05.678901"
+    assert user.headers["content-type"] == "application/json"
+    assert default.json() == {"when": "2024-01-02T00:00:00"}
+    assert len(calls) == 2
@@ -0,0 +1,39 @@
+from datetime import datetime
+import pytest
+from app.auth_cache import UserSnapshot
+from app.tokens import TokenDenylist, InvalidToken, decode_access_token, issue_access_token
+
+def make_snapshot(token_version=0):
+    return UserSnapshot(id=7, email="token@example.com", first_name="Token", last_name="User",
+                        account_created=datetime(2024, 1, 2, 3, 4, 5), account_updated=None,
+                        is_verified=True, token_version=token_version)
+
+def test_token_carries_identity_but_no_profile():
+    token, expires_in = issue_access_token(make_snapshot(token_version=3))
+    assert expires_in > 0
+    claims = decode_access_token(token)
+    assert {key: claims[key] for key in ("sub", "ver", "email")} == {"sub": 7, "ver": 3, "email": "token@example.com"}
+    # Profile fields would go stale after an update, so they are loaded per request instead
+    assert not {"first_name", "last_name", "created", "updated"} & set(claims)
+
+def test_token_signed_with_another_salt_is_rejected():
+    from app.verification import serializer
+    with pytest.raises(InvalidToken):
+        decode_access_token(serializer.dumps({"sub": 7}))
+
+def test_denylist_drops_entries_once_tokens_have_expired(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.tokens.time", lambda: now[0])
+    denylist = TokenDenylist(ttl=60, max_size=1)
+    denylist.revoke("a", now[0] + 60)
+    denylist.revoke_user(7, 2)
+
+    assert denylist.is_revoked({"jti": "a", "sub": 1, "ver": 0})
+    assert denylist.is_revoked({"jti": "b", "sub": 7, "ver": 1})
+    assert not denylist.is_revoked({"jti": "b", "sub": 7, "ver": 2})
+
+    # Going over max_size prunes everything that has expired
+    now[0] += 61
+    denylist.revoke("c", now[0] + 60)
+    assert len(denylist) == 1
+    assert not denylist.is_revoked({"jti": "a", "sub": 7, "ver": 1})
@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from httpx import AsyncClient
+from app.main import app
+from app.tracing import TraceBuffer, SamplingProfiler, chrome_trace, record_span, span
+
+def test_spans_are_recorded_only_inside_a_trace():
+    buffer = TraceBuffer(enabled=True, sample_rate=1.0, size=2)
+    with span("outside", "db"):
+        pass
+
+    trace = buffer.start("GET /thing")
+    with span("s3.put_object", "s3"):
+        record_span("db.select_users", "db", 0.001)
+    buffer.finish(trace, "GET /thing/{id}", 200)
+
+    assert [name for name, *_ in trace.spans] == ["db.select_users", "s3.put_object"]
+    events = chrome_trace(buffer.traces())["traceEvents"]
+    assert events[0]["name"] == "GET /thing/{id}" and events[0]["args"]["status"] == 200
+    assert all(event["ph"] == "X" and event["tid"] == 1 for event in events)
+
+    # Spans after the request has finished don't attach to it
+    record_span("late", "db", 0.001)
+    assert len(trace.spans) == 2
+
+def test_ring_buffer_keeps_the_latest_traces():
+    buffer = TraceBuffer(enabled=True, sample_rate=1.0, size=2)
+    for name in ("a", "b", "c"):
+        buffer.finish(buffer.start(name))
+    assert [trace.name for trace in buffer.traces()] == ["b", "c"]
+
+@pytest.mark.asyncio
+async def test_profiler_samples_the_calling_thread():
+    profiler = SamplingProfiler(interval_ms=1)
+    profiler.start()
+    end = asyncio.get_running_loop().time() + 0.05
+    while asyncio.get_running_loop().time() < end:
+        sum(range(1000))
+        await asyncio.sleep(0)
+    profiler.stop()
+
+    assert sum(profiler.samples.values()) > 0
+    assert "test_profiler_samples_the_calling_thread" in profiler.folded()
+
+@pytest.mark.asyncio
+async def test_admin_traces_export(monkeypatch):
+    monkeypatch.setattr("app.admin.ADMIN_TOKEN", "admin-secret")
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        await client.get("/v2/livez")
+        assert (await client.get("/v2/admin/traces")).status_code == 403
+
+        response = await client.get("/v2/admin/traces", params={"route": "/v2/livez"},
+                                    headers={"X-Admin-Token": "admin-secret"})
+    assert response.status_code == 200
+    assert any(event["name"] == "GET /v2/livez" for event in response.json()["traceEvents"])
@@ -0,0 +1,49 @@
+import hashlib
+import io
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app.aws import AsyncServiceClient, StubS3Client
+from app.uploads import StreamingUpload, UploadTooLarge
+
+class FakeUploadFile:
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    async def read(self, size=-1):
+        return self._stream.read(size)
+
+@pytest.fixture
+def s3_client():
+    executor = ThreadPoolExecutor(max_workers=1)
+    yield AsyncServiceClient("s3", StubS3Client(), executor)
+    executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_large_file_is_uploaded_in_parts(s3_client):
+    data = bytes(range(256)) * 5000  # ~1.2 MiB
+    upload = StreamingUpload("bucket", "key", max_size=len(data), part_size=512 * 1024, s3_client=s3_client)
+    await upload.consume(FakeUploadFile(data))
+    await upload.complete()
+
+    assert upload.size == len(data)
+    assert upload.sha256 == hashlib.sha256(data).hexdigest()
+    assert s3_client.client.objects[("bucket", "key")] == data
+    assert len(upload._parts) == 3
+
+@pytest.mark.asyncio
+async def test_small_file_uses_single_put(s3_client):
+    upload = StreamingUpload("bucket", "key", part_size=512 * 1024, s3_client=s3_client)
+    await upload.consume(FakeUploadFile(b"small image"))
+    await upload.complete()
+
+    assert s3_client.client.objects[("bucket", "key")] == b"small image"
+    assert not s3_client.client.multipart_uploads
+
+@pytest.mark.asyncio
+async def test_oversized_upload_is_aborted(s3_client):
+    upload = StreamingUpload("bucket", "key", max_size=600 * 1024, part_size=512 * 1024, s3_client=s3_client)
+    with pytest.raises(UploadTooLarge):
+        await upload.consume(FakeUploadFile(b"x" * (700 * 1024)))
+
+    assert ("bucket", "key") not in s3_client.client.objects
+    assert not s3_client.client.multipart_uploads
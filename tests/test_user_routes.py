@@ -6,8 +6,12 @@ from sqlalchemy.orm import sessionmaker
 from app.main import app  # Import your FastAPI app
 from app.database import get_db
 from app.models.user import Base
+from app.aws import aws_clients
+from app.outbox import outbox_dispatcher
+from app.verification import consumed_tokens
 from itsdangerous import URLSafeTimedSerializer
 import os
+import json
 
 @pytest.fixture
 async def client(async_session: AsyncSession):
@@ -38,6 +42,50 @@ async def test_create_user(client):
     assert verify.status_code == 200
     assert verify.json()["message"] == "Email successfully verified"
 
+@pytest.mark.asyncio
+async def test_verification_link_is_idempotent(client, monkeypatch):
+    serializer = URLSafeTimedSerializer(os.getenv("SECRET_KEY"))
+    token = serializer.dumps({"email": "test@example.com"}, salt="email-verification-salt")
+    url = f"/v2/users/verify?user=test@example.com&token={token}"
+    assert (await client.get(url)).status_code == 200
+
+    # Without the consumed-token cache the already-verified row answers the replay
+    consumed_tokens.clear()
+    assert (await client.get(url)).status_code == 200
+
+    # With it, the token isn't even decoded again
+    def fail(token):
+        raise AssertionError("replayed token was decoded")
+    monkeypatch.setattr("app.routes.userRoutes.load_verification_token", fail)
+    assert (await client.get(url)).status_code == 200
+    monkeypatch.undo()
+
+    assert (await client.get(f"/v2/users/verify?user=other@example.com&token={token}")).status_code == 400
+    unknown = serializer.dumps({"email": "nobody@example.com"}, salt="email-verification-salt")
+    assert (await client.get(f"/v2/users/verify?user=nobody@example.com&token={unknown}")).status_code == 400
+
+@pytest.mark.asyncio
+async def test_verification_email_dispatched_from_outbox(client):
+    assert await outbox_dispatcher.drain_once() == 1
+    published = aws_clients.sns.client.published
+    assert any(json.loads(message["Message"])["email"] == "test@example.com" for message in published)
+
+    # Sent messages are not published again
+    assert await outbox_dispatcher.drain_once() == 0
+
+@pytest.mark.asyncio
+async def test_create_existing_user(client):
+    response = await client.post("/v2/users/", json={
+        "email": "test@example.com",
+        "password": "otherpassword",
+        "first_name": "Other",
+        "last_name": "User"
+    })
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email already exists"
+    # The conflicting insert queues no verification email
+    assert await outbox_dispatcher.drain_once() == 0
+
 @pytest.mark.asyncio
 async def test_get_user(client):
     response = await client.get("/v2/users/1", auth=("test@example.com", "testpassword"))
@@ -55,7 +103,269 @@ async def test_update_user(client):
     assert response.status_code == 200
     assert response.json()["first_name"] == "Updated"
 
+@pytest.mark.asyncio
+async def test_old_password_rejected_after_update(client):
+    response = await client.get("/v2/users/1", auth=("test@example.com", "testpassword"))
+    assert response.status_code == 401
+
+    response = await client.get("/v2/users/1", auth=("test@example.com", "newpassword"))
+    assert response.status_code == 200
+    assert response.json()["first_name"] == "Updated"
+
+@pytest.mark.asyncio
+async def test_get_user_not_modified(client):
+    auth = ("test@example.com", "newpassword")
+    response = await client.get("/v2/users/1", auth=auth)
+    etag = response.headers["ETag"]
+
+    not_modified = await client.get("/v2/users/1", auth=auth, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+    await client.put("/v2/users/1", json={"first_name": "Changed"}, auth=auth)
+    changed = await client.get("/v2/users/1", auth=auth, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["first_name"] == "Changed"
+    assert changed.headers["ETag"] != etag
+
+@pytest.mark.asyncio
+async def test_upload_duplicate_and_delete_image(client):
+    auth = ("test@example.com", "newpassword")
+    files = {"file": ("photo.png", b"not really a png", "image/png")}
+
+    response = await client.post("/v2/users/image", files=files, auth=auth)
+    assert response.status_code == 201
+    image_id = response.json()["id"]
+
+    duplicate = await client.post("/v2/users/image", files=files, auth=auth)
+    assert duplicate.status_code == 409
+
+    image = await client.get(f"/v2/users/image/{image_id}", auth=auth)
+    assert image.status_code == 200
+    assert image.json()["id"] == str(image_id)
+
+    deleted = await client.delete(f"/v2/users/image/{image_id}", auth=auth)
+    assert deleted.status_code == 204
+
+    # The same content can be uploaded again once the original is gone
+    response = await client.post("/v2/users/image", files=files, auth=auth)
+    assert response.status_code == 201
+
+@pytest.mark.asyncio
+async def test_upload_integrity_errors(client, monkeypatch, test_db):
+    import hashlib
+    from app.uploads import StreamingUpload
+    auth = ("test@example.com", "newpassword")
+    content = b"raced image"
+    objects = aws_clients.s3.client.objects
+    before = set(objects)
+
+    # Another request stores the same content between the duplicate check and the insert
+    complete = StreamingUpload.complete
+    async def complete_after_rival(self):
+        async with test_db.begin() as conn:
+            await conn.exec_driver_sql(
+                "INSERT INTO images (user_id, image_url, bucket_name, object_key, sha256) "
+                "VALUES (1, 'https://rival', 'bucket', 'rival', $1)", (hashlib.sha256(content).hexdigest(),))
+        await complete(self)
+    monkeypatch.setattr(StreamingUpload, "complete", complete_after_rival)
+    response = await client.post("/v2/users/image", files={"file": ("photo.png", content, "image/png")}, auth=auth)
+    assert response.status_code == 409
+    monkeypatch.undo()
+    async with test_db.begin() as conn:
+        await conn.exec_driver_sql("DELETE FROM images WHERE object_key = 'rival'")
+
+    # Any other constraint violation is a server error, not a duplicate
+    monkeypatch.setattr("app.routes.userRoutes.bucket_name", None)
+    response = await client.post("/v2/users/image", files={"file": ("photo.png", b"no bucket", "image/png")}, auth=auth)
+    assert response.status_code == 503
+
+    # Neither attempt leaves an object behind
+    assert set(objects) == before
+
+@pytest.mark.asyncio
+async def test_upload_failure_aborts_multipart_upload(client, monkeypatch):
+    from app.uploads import StreamingUpload
+    auth = ("test@example.com", "newpassword")
+    s3 = aws_clients.s3.client
+    objects = set(s3.objects)
+
+    # Small parts so the file goes through the multipart API, then fail before the duplicate check
+    class FailingUpload(StreamingUpload):
+        def __init__(self, bucket, key):
+            super().__init__(bucket, key, part_size=8)
+
+        @property
+        def sha256(self):
+            raise RuntimeError("hashing failed")
+    monkeypatch.setattr("app.routes.userRoutes.StreamingUpload", FailingUpload)
+    response = await client.post("/v2/users/image", files={"file": ("photo.png", b"x" * 20, "image/png")}, auth=auth)
+    assert response.status_code == 503
+    assert s3.multipart_uploads == {}
+    assert set(s3.objects) == objects
+
+@pytest.mark.asyncio
+async def test_list_images_paginates(client):
+    auth = ("test@example.com", "newpassword")
+    for content in (b"second image", b"third image"):
+        response = await client.post("/v2/users/image", files={"file": ("photo.png", content, "image/png")}, auth=auth)
+        assert response.status_code == 201
+
+    first = await client.get("/v2/users/image", params={"limit": 2}, auth=auth)
+    assert first.status_code == 200
+    page = first.json()
+    assert len(page["images"]) == 2
+    assert page["next_cursor"] == int(page["images"][-1]["id"])
+    assert all(image["download_url"] for image in page["images"])
+
+    second = await client.get("/v2/users/image", params={"limit": 2, "after": page["next_cursor"]}, auth=auth)
+    assert second.status_code == 200
+    assert len(second.json()["images"]) == 1
+    assert second.json()["next_cursor"] is None
+
+    ids = [int(image["id"]) for image in page["images"] + second.json()["images"]]
+    assert ids == sorted(ids)
+
+@pytest.mark.asyncio
+async def test_batch_and_delete_all_images(client, monkeypatch):
+    auth = ("test@example.com", "newpassword")
+    missing = await client.delete("/v2/users/image/999999", auth=auth)
+    assert missing.status_code == 404
+
+    listed = await client.get("/v2/users/image", auth=auth)
+    ids = [int(image["id"]) for image in listed.json()["images"]]
+    assert len(ids) == 3
+
+    response = await client.post("/v2/users/image/batch-delete", json={"ids": [ids[0], 999999]}, auth=auth)
+    assert response.status_code == 200
+    assert response.json() == {"deleted": [ids[0]], "not_found": [999999], "failed": []}
+
+    # Objects S3 refuses to delete are reported and their rows kept for a retry
+    s3 = aws_clients.s3.client
+    refused = listed.json()["images"][1]["file_name"]
+    original_delete_objects = s3.delete_objects
+
+    def delete_objects(Bucket, Delete, **kwargs):
+        kept = [obj for obj in Delete["Objects"] if obj["Key"] != refused]
+        original_delete_objects(Bucket=Bucket, Delete={**Delete, "Objects": kept})
+        return {"Errors": [{"Key": refused, "Code": "AccessDenied", "Message": "Access Denied"}]}
+
+    monkeypatch.setattr(s3, "delete_objects", delete_objects)
+    response = await client.delete("/v2/users/image", auth=auth)
+    assert response.json() == {"deleted": [ids[2]], "not_found": [], "failed": [{"id": ids[1], "error": "Access Denied"}]}
+
+    monkeypatch.undo()
+    response = await client.delete("/v2/users/image", auth=auth)
+    assert response.json()["deleted"] == [ids[1]]
+    assert (await client.get("/v2/users/image", auth=auth)).json()["images"] == []
+
+@pytest.mark.asyncio
+async def test_bearer_token_login_and_revocation(client):
+    login = await client.post("/v2/users/login", auth=("test@example.com", "newpassword"))
+    assert login.status_code == 200
+    token = login.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = await client.get("/v2/users/1", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["email"] == "test@example.com"
+
+    # The profile comes from the current row, not from the token
+    etag = response.headers["ETag"]
+    renamed = await client.put("/v2/users/1", json={"first_name": "Renamed"}, headers=headers)
+    assert renamed.json()["first_name"] == "Renamed"
+    assert (await client.put("/v2/users/1", json={}, headers=headers)).json()["first_name"] == "Renamed"
+    response = await client.get("/v2/users/1", headers=headers)
+    assert response.json()["first_name"] == "Renamed"
+    assert response.headers["ETag"] != etag
+
+    tampered = await client.get("/v2/users/1", headers={"Authorization": f"Bearer {token}x"})
+    assert tampered.status_code == 401
+
+    logout = await client.post("/v2/users/logout", headers=headers)
+    assert logout.status_code == 204
+    assert (await client.get("/v2/users/1", headers=headers)).status_code == 401
+
+    # A password change retires tokens issued before it
+    token = (await client.post("/v2/users/login", auth=("test@example.com", "newpassword"))).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    changed = await client.put("/v2/users/1", json={"password": "newpassword"}, headers=headers)
+    assert changed.status_code == 200
+    assert (await client.get("/v2/users/1", headers=headers)).status_code == 401
+
+    # Basic auth keeps working alongside tokens
+    assert (await client.get("/v2/users/1", auth=("test@example.com", "newpassword"))).status_code == 200
+    assert (await client.get("/v2/users/1")).status_code == 401
+
 @pytest.mark.asyncio
 async def test_health_check(client):
     response = await client.get("/v2/healthz")
     assert response.status_code == 200
+
+@pytest.mark.asyncio
+async def test_bulk_import(client, monkeypatch):
+    monkeypatch.setattr("app.admin.ADMIN_TOKEN", "admin-secret")
+    body = "\n".join([
+        json.dumps({"email": "bulk1@example.com", "password": "pw", "first_name": "Bulk", "last_name": "One"}),
+        json.dumps({"email": "test@example.com", "password": "pw", "first_name": "Test", "last_name": "User"}),
+        "{not json",
+        json.dumps({"email": "bulk1@example.com", "password": "pw", "first_name": "Bulk", "last_name": "Again"}),
+        json.dumps({"email": "bulk2@example.com", "first_name": "No", "last_name": "Password"}),
+    ])
+    headers = {"Content-Type": "application/x-ndjson"}
+
+    forbidden = await client.post("/v2/users/import", content=body, headers=headers)
+    assert forbidden.status_code == 403
+
+    response = await client.post("/v2/users/import", content=body,
+                                 headers={**headers, "X-Admin-Token": "admin-secret"})
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [result["status"] for result in results] == ["created", "exists", "invalid", "duplicate", "invalid"]
+    assert [result["line"] for result in results] == [1, 2, 3, 4, 5]
+
+    csv_body = "email,password,first_name,last_name\nbulk3@example.com,pw,Bulk,Three\nbulk1@example.com,pw,Bulk,One\n"
+    response = await client.post("/v2/users/import", content=csv_body, params={"batch_size": 1},
+                                 headers={"Content-Type": "text/csv", "X-Admin-Token": "admin-secret"})
+    assert [json.loads(line)["status"] for line in response.text.splitlines()] == ["created", "exists"]
+
+    # Imported users can't sign in until they verify, like regular signups
+    unverified = await client.get("/v2/users/1", auth=("bulk3@example.com", "pw"))
+    assert unverified.status_code == 403
+
+@pytest.mark.asyncio
+async def test_authentication_releases_its_connection_before_the_handler():
+    from fastapi.security import HTTPBasicCredentials
+    from app.auth_cache import credential_cache
+    from app.database import engine
+    from app.routes.userRoutes import get_current_user
+
+    credential_cache.clear()
+    user = await get_current_user(None, HTTPBasicCredentials(username="test@example.com", password="newpassword"))
+    assert user.email == "test@example.com"
+    # A write handler's own session is then the only one checked out
+    assert engine.pool.checkedout() == 0
+
+@pytest.mark.asyncio
+async def test_cached_credentials_stop_working_when_another_worker_changes_the_password(test_db):
+    from fastapi import HTTPException
+    from fastapi.security import HTTPBasicCredentials
+    from app.passwords import hash_password
+    from app.routes.userRoutes import get_current_user
+    credentials = HTTPBasicCredentials(username="test@example.com", password="newpassword")
+    assert (await get_current_user(None, credentials)).email == "test@example.com"
+
+    # Changed behind this worker's back: its cache entry was never invalidated
+    async with test_db.begin() as conn:
+        original = (await conn.exec_driver_sql(
+            "SELECT hashed_password FROM users WHERE email = 'test@example.com'")).scalar()
+        await conn.exec_driver_sql("UPDATE users SET hashed_password = $1 WHERE email = 'test@example.com'",
+                                   (await hash_password("changedpassword"),))
+    try:
+        with pytest.raises(HTTPException) as rejected:
+            await get_current_user(None, credentials)
+        assert rejected.value.status_code == 401
+    finally:
+        async with test_db.begin() as conn:
+            await conn.exec_driver_sql("UPDATE users SET hashed_password = $1 WHERE email = 'test@example.com'",
+                                       (original,))
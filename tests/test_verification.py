@@ -0,0 +1,55 @@
+import os
+import pytest
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from itsdangerous.signer import Signer
+from app.verification import ConsumedTokenCache, PrecomputedKeySigner, load_verification_token, verification_token, \
+    VERIFICATION_SALT
+
+def test_tokens_interoperate_with_a_plain_serializer():
+    plain = URLSafeTimedSerializer(os.getenv("SECRET_KEY"))
+    assert plain.loads(verification_token("a@example.com"), salt=VERIFICATION_SALT) == {"email": "a@example.com"}
+    assert load_verification_token(plain.dumps({"email": "b@example.com"}, salt=VERIFICATION_SALT)) == \
+        {"email": "b@example.com"}
+
+def test_key_is_derived_once_across_signs_and_loads(monkeypatch):
+    derivations = []
+    derive_key = Signer.derive_key
+    def counting_derive_key(self, secret_key=None):
+        derivations.append(secret_key)
+        return derive_key(self, secret_key)
+    monkeypatch.setattr(Signer, "derive_key", counting_derive_key)
+    monkeypatch.setattr(PrecomputedKeySigner, "_derived_keys", {})
+
+    serializer = URLSafeTimedSerializer("derive-once", salt=VERIFICATION_SALT, signer=PrecomputedKeySigner)
+    token = serializer.dumps({"email": "a@example.com"})
+    for _ in range(3):
+        assert serializer.loads(token, max_age=60) == {"email": "a@example.com"}
+    assert len(derivations) == 1
+
+    # After rotation the old secret's key is already cached; only the new one is derived, once
+    rotated = URLSafeTimedSerializer(["derive-once", "derive-twice"], salt=VERIFICATION_SALT,
+                                     signer=PrecomputedKeySigner)
+    for _ in range(3):
+        assert rotated.loads(token, max_age=60) == {"email": "a@example.com"}
+    assert derivations == [b"derive-once", b"derive-twice"]
+
+def test_token_with_another_salt_is_rejected():
+    token = URLSafeTimedSerializer(os.getenv("SECRET_KEY")).dumps({"email": "a@example.com"}, salt="access-token")
+    with pytest.raises(BadSignature):
+        load_verification_token(token)
+
+def test_consumed_tokens_expire_and_stay_bounded(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.verification.time", lambda: now[0])
+    cache = ConsumedTokenCache(max_size=2, max_age=60)
+    cache.add("t1", "one@example.com")
+    cache.add("t2", "two@example.com")
+    cache.add("t3", "three@example.com")
+
+    assert len(cache) == 2
+    assert cache.consumed_by("t1") is None
+    assert cache.consumed_by("t3") == "three@example.com"
+
+    now[0] += 61
+    assert cache.consumed_by("t3") is None
+    assert len(cache) == 1